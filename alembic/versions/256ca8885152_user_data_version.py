@@ -0,0 +1,90 @@
+"""user data version
+
+Revision ID: 256ca8885152
+Revises: ca6f5e65cf67
+Create Date: 2026-10-18 11:02:17.390412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import ForeignKey
+
+# revision identifiers, used by Alembic.
+revision = '256ca8885152'
+down_revision = 'ca6f5e65cf67'
+branch_labels = None
+depends_on = None
+
+
+# Every statement writing a user's expenses or budget categories bumps the
+# user's version in the same transaction, whichever code path it comes
+# from. Users without a row are at version 0. Users being deleted are
+# skipped, their rows cascade away anyway.
+BUMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION user_data_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    user_ids BIGINT[] := '{}';
+BEGIN
+    IF TG_TABLE_NAME = 'expense' THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            user_ids := user_ids || ARRAY(
+                SELECT budget_category.user_id FROM old_rows
+                JOIN budget_category ON budget_category.category_id = old_rows.category_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            user_ids := user_ids || ARRAY(
+                SELECT budget_category.user_id FROM new_rows
+                JOIN budget_category ON budget_category.category_id = new_rows.category_id);
+        END IF;
+    ELSE
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            user_ids := user_ids || ARRAY(SELECT user_id FROM old_rows);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            user_ids := user_ids || ARRAY(SELECT user_id FROM new_rows);
+        END IF;
+    END IF;
+    INSERT INTO user_data_version (user_id, version)
+    SELECT user_id, 1 FROM "user" WHERE user_id = ANY(user_ids)
+    ON CONFLICT (user_id) DO UPDATE
+    SET version = user_data_version.version + 1;
+    RETURN NULL;
+END;
+$$;
+"""
+
+BUMP_TRIGGERS = """
+CREATE TRIGGER {table}_data_version_insert AFTER INSERT ON {table}
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+
+CREATE TRIGGER {table}_data_version_update AFTER UPDATE ON {table}
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+
+CREATE TRIGGER {table}_data_version_delete AFTER DELETE ON {table}
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+"""
+
+VERSIONED_TABLES = ["expense", "budget_category"]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_data_version",
+        sa.Column("user_id", sa.BIGINT, ForeignKey("user.user_id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("version", sa.BIGINT, nullable=False)
+    )
+    op.execute(BUMP_FUNCTION)
+    for table in VERSIONED_TABLES:
+        op.execute(BUMP_TRIGGERS.format(table=table))
+
+
+def downgrade() -> None:
+    for table in VERSIONED_TABLES:
+        for operation in ["insert", "update", "delete"]:
+            op.execute(f"DROP TRIGGER {table}_data_version_{operation} ON {table}")
+    op.execute("DROP FUNCTION user_data_version_bump()")
+    op.drop_table("user_data_version")
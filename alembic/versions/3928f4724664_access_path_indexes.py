@@ -0,0 +1,38 @@
+"""access path indexes
+
+Revision ID: 3928f4724664
+Revises: 5ee1016f56f4
+Create Date: 2026-10-18 09:41:07.552913
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3928f4724664'
+down_revision = '5ee1016f56f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the tables writable while the indexes build,
+    # which is not allowed inside the migration transaction.
+    with op.get_context().autocommit_block():
+        # get_budget and list_expenses read a category's expenses by date;
+        # expense_id makes the index match the keyset pagination order.
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_expense_category_id_date_time "
+            "ON expense (category_id, date_time, expense_id)"
+        )
+        # set_budget looks categories up by name, every other query by user.
+        # Fails if a user already has two categories with the same name.
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_budget_category_user_id_category_name "
+            "ON budget_category (user_id, category_name)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_budget_category_user_id_category_name")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_expense_category_id_date_time")
@@ -0,0 +1,103 @@
+"""item category_id
+
+Revision ID: 48ab269db458
+Revises: 814e4567a37f
+Create Date: 2026-10-18 21:14:52.603117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '48ab269db458'
+down_revision = '814e4567a37f'
+branch_labels = None
+depends_on = None
+
+
+# Item names were searched through global GIN indexes, which read every
+# user's matching items before the join to expense kept the user's own.
+# Items carry their expense's category_id, so their indexes can lead with
+# it like expense's do. Writers that leave it out get it from the expense,
+# and an expense moving to another category takes its items along.
+ITEM_CATEGORY_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION item_set_category_id() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.category_id IS NULL THEN
+        SELECT category_id INTO NEW.category_id FROM expense
+        WHERE expense_id = NEW.expense_id AND date_time = NEW.expense_date_time;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION expense_move_items() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE item SET category_id = new_rows.category_id
+    FROM new_rows
+    WHERE item.expense_id = new_rows.expense_id
+    AND item.expense_date_time = new_rows.date_time
+    AND item.category_id IS DISTINCT FROM new_rows.category_id;
+    RETURN NULL;
+END;
+$$;
+"""
+
+ITEM_CATEGORY_TRIGGERS = """
+CREATE TRIGGER item_category_id BEFORE INSERT ON item
+FOR EACH ROW EXECUTE FUNCTION item_set_category_id();
+
+CREATE TRIGGER expense_move_items AFTER UPDATE ON expense
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_move_items();
+"""
+
+BACKFILL = """
+UPDATE item SET category_id = expense.category_id
+FROM expense
+WHERE expense.expense_id = item.expense_id
+AND expense.date_time = item.expense_date_time
+"""
+
+OLD_ITEM_INDEXES = {
+    "ix_item_name_tsv": "USING gin (to_tsvector('english', name))",
+    "ix_item_name_trgm": "USING gin (name gin_trgm_ops)",
+}
+ITEM_INDEXES = {
+    "ix_item_category_id_name_tsv": "USING gin (category_id, to_tsvector('english', name))",
+    "ix_item_category_id_name_trgm": "USING gin (category_id, name gin_trgm_ops)",
+    # a category's items in a date range, for matches too common for the
+    # GIN indexes to narrow down, like expense's
+    "ix_item_category_id_expense_date_time": "(category_id, expense_date_time)",
+}
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE item ADD COLUMN category_id BIGINT")
+    # no writes may slip in between the backfill and the triggers
+    op.execute("LOCK TABLE expense, item IN SHARE MODE")
+    op.execute(ITEM_CATEGORY_FUNCTIONS)
+    op.execute(ITEM_CATEGORY_TRIGGERS)
+    op.execute(BACKFILL)
+    op.execute("ALTER TABLE item ALTER COLUMN category_id SET NOT NULL")
+    with op.get_context().autocommit_block():
+        for name, columns in ITEM_INDEXES.items():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON item {columns}")
+        for name in OLD_ITEM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in OLD_ITEM_INDEXES.items():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON item {columns}")
+        for name in ITEM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    op.execute("DROP TRIGGER expense_move_items ON expense")
+    op.execute("DROP TRIGGER item_category_id ON item")
+    op.execute("DROP FUNCTION expense_move_items()")
+    op.execute("DROP FUNCTION item_set_category_id()")
+    op.execute("ALTER TABLE item DROP COLUMN category_id")
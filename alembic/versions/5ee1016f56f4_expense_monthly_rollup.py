@@ -0,0 +1,104 @@
+"""expense monthly rollup
+
+Revision ID: 5ee1016f56f4
+Revises: 848867feedf3
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import ForeignKey
+
+# revision identifiers, used by Alembic.
+revision = '5ee1016f56f4'
+down_revision = '848867feedf3'
+branch_labels = None
+depends_on = None
+
+
+# Statement level triggers see every changed row through transition tables,
+# so a bulk insert or COPY updates each (category, month) total once.
+ROLLUP_FUNCTION = """
+CREATE OR REPLACE FUNCTION expense_rollup_apply() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO expense_monthly_rollup
+        (user_id, category_id, month, total_cost, expense_count)
+        SELECT budget_category.user_id, old_rows.category_id,
+        date_trunc('month', old_rows.date_time AT TIME ZONE 'UTC')::date,
+        -SUM(old_rows.cost), -COUNT(*)
+        FROM old_rows
+        JOIN budget_category ON budget_category.category_id = old_rows.category_id
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, category_id, month) DO UPDATE
+        SET total_cost = expense_monthly_rollup.total_cost + EXCLUDED.total_cost,
+        expense_count = expense_monthly_rollup.expense_count + EXCLUDED.expense_count;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO expense_monthly_rollup
+        (user_id, category_id, month, total_cost, expense_count)
+        SELECT budget_category.user_id, new_rows.category_id,
+        date_trunc('month', new_rows.date_time AT TIME ZONE 'UTC')::date,
+        SUM(new_rows.cost), COUNT(*)
+        FROM new_rows
+        JOIN budget_category ON budget_category.category_id = new_rows.category_id
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, category_id, month) DO UPDATE
+        SET total_cost = expense_monthly_rollup.total_cost + EXCLUDED.total_cost,
+        expense_count = expense_monthly_rollup.expense_count + EXCLUDED.expense_count;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+"""
+
+ROLLUP_TRIGGERS = """
+CREATE TRIGGER expense_rollup_insert AFTER INSERT ON expense
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+
+CREATE TRIGGER expense_rollup_update AFTER UPDATE ON expense
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+
+CREATE TRIGGER expense_rollup_delete AFTER DELETE ON expense
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+"""
+
+BACKFILL = """
+INSERT INTO expense_monthly_rollup
+(user_id, category_id, month, total_cost, expense_count)
+SELECT budget_category.user_id, expense.category_id,
+date_trunc('month', expense.date_time AT TIME ZONE 'UTC')::date,
+SUM(expense.cost), COUNT(*)
+FROM expense
+JOIN budget_category ON budget_category.category_id = expense.category_id
+GROUP BY 1, 2, 3
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "expense_monthly_rollup",
+        sa.Column("user_id", sa.BIGINT, ForeignKey("user.user_id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("category_id", sa.BIGINT, ForeignKey("budget_category.category_id", ondelete="CASCADE"),
+                  primary_key=True),
+        sa.Column("month", sa.DATE, primary_key=True),
+        sa.Column("total_cost", sa.FLOAT, nullable=False),
+        sa.Column("expense_count", sa.BIGINT, nullable=False)
+    )
+    # no writes may slip in between the backfill and the triggers
+    op.execute("LOCK TABLE expense IN SHARE MODE")
+    op.execute(ROLLUP_FUNCTION)
+    op.execute(ROLLUP_TRIGGERS)
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER expense_rollup_insert ON expense")
+    op.execute("DROP TRIGGER expense_rollup_update ON expense")
+    op.execute("DROP TRIGGER expense_rollup_delete ON expense")
+    op.execute("DROP FUNCTION expense_rollup_apply()")
+    op.drop_table("expense_monthly_rollup")
@@ -0,0 +1,68 @@
+"""search indexes
+
+Revision ID: 814e4567a37f
+Revises: 830d118e180d
+Create Date: 2026-10-18 16:40:27.518230
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '814e4567a37f'
+down_revision = '830d118e180d'
+branch_labels = None
+depends_on = None
+
+
+# The indexes behind search_expenses. Expense descriptions are searched
+# within a user's categories, so their GIN indexes lead with category_id
+# (btree_gin) and only the user's matches are read.
+EXPENSE_INDEXES = {
+    "ix_expense_category_id_description_tsv":
+        "(category_id, to_tsvector('english', description))",
+    "ix_expense_category_id_description_trgm":
+        "(category_id, description gin_trgm_ops)",
+}
+ITEM_INDEXES = {
+    "ix_item_name_tsv": "(to_tsvector('english', name))",
+    "ix_item_name_trgm": "(name gin_trgm_ops)",
+}
+
+PARTITIONS = sa.text('''
+SELECT inhrelid::regclass::text FROM pg_inherits
+WHERE inhparent = 'expense'::regclass
+''')
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    partitions = op.get_bind().execute(PARTITIONS).scalars().all()
+    # An index on a partitioned table cannot be built CONCURRENTLY. It is
+    # created invalid on the parent only, each partition's is built
+    # CONCURRENTLY and attached, which validates the parent's once they
+    # all are. New partitions get theirs from the parent.
+    for name, columns in EXPENSE_INDEXES.items():
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON ONLY expense USING gin {columns}")
+    with op.get_context().autocommit_block():
+        for name, columns in EXPENSE_INDEXES.items():
+            for partition in partitions:
+                partition_index = f"{partition}_{name[len('ix_expense_'):]}"
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" '
+                    f'ON "{partition}" USING gin {columns}')
+                op.execute(f'ALTER INDEX {name} ATTACH PARTITION "{partition_index}"')
+        for name, columns in ITEM_INDEXES.items():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON item USING gin {columns}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in ITEM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    # dropping the parent's index drops the partitions' too
+    for name in EXPENSE_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,97 @@
+"""budget periods
+
+Revision ID: 830d118e180d
+Revises: a9cfbb206fee
+Create Date: 2026-10-18 15:12:08.604113
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '830d118e180d'
+down_revision = 'a9cfbb206fee'
+branch_labels = None
+depends_on = None
+
+
+# A category's budget for a date range. Periods are half open, [start,
+# end), and bounded. The exclusion constraint's GiST index on (category_id,
+# period) both rejects overlapping periods of a category and finds the one
+# holding any timestamp with a single probe.
+CREATE_BUDGET_PERIOD = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+CREATE TABLE budget_period (
+    period_id BIGSERIAL PRIMARY KEY,
+    category_id BIGINT NOT NULL
+        REFERENCES budget_category ON DELETE CASCADE,
+    period TSTZRANGE NOT NULL,
+    budget FLOAT8 NOT NULL,
+    CONSTRAINT budget_period_bounds CHECK (
+        NOT isempty(period) AND lower_inc(period) AND NOT upper_inc(period)
+        AND NOT lower_inf(period) AND NOT upper_inf(period)),
+    CONSTRAINT budget_period_no_overlap
+        EXCLUDE USING gist (category_id WITH =, period WITH &&)
+);
+"""
+
+# user_data_version_bump, with budget_period finding its users through
+# the category like expense does
+BUMP_FUNCTION = """
+CREATE OR REPLACE FUNCTION user_data_version_bump() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    user_ids BIGINT[] := '{{}}';
+BEGIN
+    IF TG_TABLE_NAME IN ({category_tables}) THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            user_ids := user_ids || ARRAY(
+                SELECT budget_category.user_id FROM old_rows
+                JOIN budget_category ON budget_category.category_id = old_rows.category_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            user_ids := user_ids || ARRAY(
+                SELECT budget_category.user_id FROM new_rows
+                JOIN budget_category ON budget_category.category_id = new_rows.category_id);
+        END IF;
+    ELSE
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            user_ids := user_ids || ARRAY(SELECT user_id FROM old_rows);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            user_ids := user_ids || ARRAY(SELECT user_id FROM new_rows);
+        END IF;
+    END IF;
+    INSERT INTO user_data_version (user_id, version)
+    SELECT user_id, 1 FROM "user" WHERE user_id = ANY(user_ids)
+    ON CONFLICT (user_id) DO UPDATE
+    SET version = user_data_version.version + 1;
+    RETURN NULL;
+END;
+$$;
+"""
+
+BUMP_TRIGGERS = """
+CREATE TRIGGER budget_period_data_version_insert AFTER INSERT ON budget_period
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+
+CREATE TRIGGER budget_period_data_version_update AFTER UPDATE ON budget_period
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+
+CREATE TRIGGER budget_period_data_version_delete AFTER DELETE ON budget_period
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION user_data_version_bump();
+"""
+
+
+def upgrade() -> None:
+    op.execute(CREATE_BUDGET_PERIOD)
+    op.execute(BUMP_FUNCTION.format(
+        category_tables="'expense', 'budget_period'"))
+    op.execute(BUMP_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE budget_period")
+    op.execute(BUMP_FUNCTION.format(category_tables="'expense'"))
@@ -0,0 +1,62 @@
+"""json rendering functions
+
+Revision ID: 99a61e2172be
+Revises: 256ca8885152
+Create Date: 2026-10-18 11:48:05.662710
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '99a61e2172be'
+down_revision = '256ca8885152'
+branch_labels = None
+depends_on = None
+
+
+# Format values exactly like the API's JSON encoder (Python's json module
+# and datetime.isoformat), so responses rendered by the database match the
+# ones rendered by the application byte for byte.
+
+# float8 output is already the shortest exact representation, Python only
+# adds ".0" to whole numbers. Both also pick the same notation below 1e15;
+# above that they disagree, so larger values (and NaN and infinities)
+# render as NULL and callers fall back to encoding in Python. Relies on
+# the default extra_float_digits.
+JSON_FLOAT_FUNCTION = """
+CREATE OR REPLACE FUNCTION api_json_float(value FLOAT8) RETURNS TEXT
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+SELECT CASE
+    WHEN NOT abs(value) < 1e15 THEN NULL
+    WHEN value::text ~ '[.e]' THEN value::text
+    ELSE value::text || '.0'
+END
+$$;
+"""
+
+# "YYYY-MM-DDTHH:MM:SS[.ffffff]+HH:MM[:SS]" in the session time zone, the
+# way the driver hands timestamps to the application
+JSON_TIMESTAMPTZ_FUNCTION = """
+CREATE OR REPLACE FUNCTION api_json_timestamptz(value TIMESTAMPTZ) RETURNS TEXT
+LANGUAGE sql STABLE STRICT PARALLEL SAFE AS $$
+SELECT '"' || to_char(value, 'YYYY-MM-DD"T"HH24:MI:SS')
+|| CASE WHEN to_char(value, 'US') = '000000' THEN '' ELSE to_char(value, '.US') END
+|| CASE WHEN utc_offset < 0 THEN '-' ELSE '+' END
+|| lpad((abs(utc_offset) / 3600)::text, 2, '0') || ':'
+|| lpad((abs(utc_offset) % 3600 / 60)::text, 2, '0')
+|| CASE WHEN utc_offset % 60 = 0 THEN ''
+   ELSE ':' || lpad((abs(utc_offset) % 60)::text, 2, '0') END
+|| '"'
+FROM (SELECT extract(timezone FROM value)::int AS utc_offset) AS offsets
+$$;
+"""
+
+
+def upgrade() -> None:
+    op.execute(JSON_FLOAT_FUNCTION)
+    op.execute(JSON_TIMESTAMPTZ_FUNCTION)
+
+
+def downgrade() -> None:
+    op.execute("DROP FUNCTION api_json_timestamptz(TIMESTAMPTZ)")
+    op.execute("DROP FUNCTION api_json_float(FLOAT8)")
@@ -0,0 +1,101 @@
+"""expense items
+
+Revision ID: a9cfbb206fee
+Revises: 99a61e2172be
+Create Date: 2026-10-18 13:05:41.218377
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a9cfbb206fee'
+down_revision = '99a61e2172be'
+branch_labels = None
+depends_on = None
+
+
+# 848867feedf3 describes an item table that databases created before it
+# never got, and partitioning expense dropped its foreign key. Either way
+# it ends up referencing expense's whole primary key, so items are found
+# (and pruned) by the partition key too, and cascade with their expense.
+CREATE_ITEM = """
+CREATE TABLE IF NOT EXISTS item (
+    item_id BIGSERIAL PRIMARY KEY,
+    expense_id BIGINT NOT NULL,
+    cost FLOAT8 NOT NULL,
+    name TEXT NOT NULL
+);
+ALTER TABLE item ADD COLUMN IF NOT EXISTS expense_date_time TIMESTAMPTZ;
+UPDATE item SET expense_date_time = expense.date_time
+FROM expense WHERE expense.expense_id = item.expense_id;
+DELETE FROM item WHERE expense_date_time IS NULL;
+ALTER TABLE item ALTER COLUMN expense_date_time SET NOT NULL;
+ALTER TABLE item ALTER COLUMN cost TYPE FLOAT8;
+"""
+
+# expense_create_partition moves a month's rows out of expense_default with
+# a DELETE, which now cascades to their items: the items are kept aside
+# and put back once the partition holding their expenses is attached.
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION expense_create_partition(month DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', month::timestamp);
+    lower_bound TIMESTAMPTZ := month_start AT TIME ZONE 'UTC';
+    upper_bound TIMESTAMPTZ := (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    partition_name TEXT := 'expense_' || to_char(month_start, '"y"YYYY"m"MM');{declare_items}
+BEGIN
+    -- several workers may try to create the same partition at once
+    PERFORM pg_advisory_xact_lock(hashtext('expense_create_partition'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE expense INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        partition_name);{save_items}
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM expense_default '
+        'WHERE date_time >= $1 AND date_time < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', partition_name)
+    USING lower_bound, upper_bound;
+    EXECUTE format(
+        'ALTER TABLE expense ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, lower_bound, upper_bound);{restore_items}
+    RETURN partition_name;
+END;
+$$;
+"""
+KEEP_ITEMS = {
+    "declare_items": """
+    moved_items item[];""",
+    "save_items": """
+    moved_items := ARRAY(
+        SELECT item FROM item
+        WHERE expense_date_time >= lower_bound AND expense_date_time < upper_bound);""",
+    "restore_items": """
+    INSERT INTO item SELECT * FROM unnest(moved_items);""",
+}
+
+
+def upgrade() -> None:
+    op.execute(CREATE_ITEM)
+    op.execute(
+        "ALTER TABLE item ADD CONSTRAINT item_expense_fkey "
+        "FOREIGN KEY (expense_id, expense_date_time) "
+        "REFERENCES expense (expense_id, date_time) "
+        "ON DELETE CASCADE ON UPDATE CASCADE"
+    )
+    op.execute(
+        "CREATE INDEX ix_item_expense_id_expense_date_time "
+        "ON item (expense_id, expense_date_time)"
+    )
+    op.execute(CREATE_PARTITION_FUNCTION.format(**KEEP_ITEMS))
+
+
+def downgrade() -> None:
+    op.execute(CREATE_PARTITION_FUNCTION.format(
+        **{name: "" for name in KEEP_ITEMS}))
+    op.execute("DROP INDEX ix_item_expense_id_expense_date_time")
+    op.execute("ALTER TABLE item DROP CONSTRAINT item_expense_fkey")
+    op.execute("ALTER TABLE item DROP COLUMN expense_date_time")
+    op.execute("ALTER TABLE item ALTER COLUMN cost TYPE DECIMAL")
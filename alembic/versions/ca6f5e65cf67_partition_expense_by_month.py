@@ -0,0 +1,156 @@
+"""partition expense by month
+
+Revision ID: ca6f5e65cf67
+Revises: 3928f4724664
+Create Date: 2026-10-18 10:26:51.804519
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'ca6f5e65cf67'
+down_revision = '3928f4724664'
+branch_labels = None
+depends_on = None
+
+
+# One partition per UTC calendar month, named expense_yYYYYmMM. Rows outside
+# every partition land in expense_default, so inserts never fail; creating
+# the partition for their month later moves them out of it.
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION expense_create_partition(month DATE) RETURNS TEXT
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', month::timestamp);
+    lower_bound TIMESTAMPTZ := month_start AT TIME ZONE 'UTC';
+    upper_bound TIMESTAMPTZ := (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC';
+    partition_name TEXT := 'expense_' || to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    -- several workers may try to create the same partition at once
+    PERFORM pg_advisory_xact_lock(hashtext('expense_create_partition'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE expense INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM expense_default '
+        'WHERE date_time >= $1 AND date_time < $2 RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved', partition_name)
+    USING lower_bound, upper_bound;
+    EXECUTE format(
+        'ALTER TABLE expense ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, lower_bound, upper_bound);
+    RETURN partition_name;
+END;
+$$;
+"""
+
+# A primary key on a partitioned table has to include the partition key, so
+# foreign keys to expense (expense_id) alone, like item's, cannot be kept.
+DROP_REFERENCING_FOREIGN_KEYS = """
+DO $$
+DECLARE
+    foreign_key RECORD;
+BEGIN
+    FOR foreign_key IN
+        SELECT conrelid::regclass AS table_name, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = 'expense'::regclass
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I',
+                       foreign_key.table_name, foreign_key.conname);
+    END LOOP;
+END;
+$$;
+"""
+
+# months holding expenses, plus the current one and the next three
+INITIAL_PARTITIONS = """
+SELECT expense_create_partition(month::date)
+FROM (
+    SELECT DISTINCT date_trunc('month', date_time AT TIME ZONE 'UTC') AS month
+    FROM expense_unpartitioned
+    UNION
+    SELECT generate_series(
+        date_trunc('month', now() AT TIME ZONE 'UTC'),
+        date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '3 months',
+        INTERVAL '1 month')
+) AS months
+ORDER BY month
+"""
+
+ROLLUP_TRIGGERS = """
+CREATE TRIGGER expense_rollup_insert AFTER INSERT ON expense
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+
+CREATE TRIGGER expense_rollup_update AFTER UPDATE ON expense
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+
+CREATE TRIGGER expense_rollup_delete AFTER DELETE ON expense
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION expense_rollup_apply();
+"""
+
+
+def upgrade() -> None:
+    op.execute("LOCK TABLE expense IN ACCESS EXCLUSIVE MODE")
+    op.execute(DROP_REFERENCING_FOREIGN_KEYS)
+    op.execute("ALTER TABLE expense RENAME TO expense_unpartitioned")
+    op.execute("ALTER INDEX expense_pkey RENAME TO expense_unpartitioned_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_expense_category_id_date_time")
+    # the id sequence outlives the old table
+    op.execute("ALTER SEQUENCE expense_expense_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE expense
+        (LIKE expense_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (date_time)
+    """)
+    op.execute("ALTER TABLE expense ADD PRIMARY KEY (expense_id, date_time)")
+    op.execute(
+        "ALTER TABLE expense ADD FOREIGN KEY (category_id) "
+        "REFERENCES budget_category ON DELETE CASCADE"
+    )
+    op.execute("CREATE TABLE expense_default PARTITION OF expense DEFAULT")
+    op.execute(CREATE_PARTITION_FUNCTION)
+    op.execute(INITIAL_PARTITIONS)
+
+    # the rollup already counts these rows, its triggers come after the copy
+    op.execute("INSERT INTO expense SELECT * FROM expense_unpartitioned")
+    op.execute("DROP TABLE expense_unpartitioned")
+    op.execute("ALTER SEQUENCE expense_expense_id_seq OWNED BY expense.expense_id")
+    op.execute(
+        "CREATE INDEX ix_expense_category_id_date_time "
+        "ON expense (category_id, date_time, expense_id)"
+    )
+    op.execute(ROLLUP_TRIGGERS)
+    op.execute("ANALYZE expense")
+
+
+def downgrade() -> None:
+    op.execute("LOCK TABLE expense IN ACCESS EXCLUSIVE MODE")
+    op.execute("""
+        CREATE TABLE expense_unpartitioned
+        (LIKE expense INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """)
+    op.execute("INSERT INTO expense_unpartitioned SELECT * FROM expense")
+    op.execute("ALTER SEQUENCE expense_expense_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE expense")
+    op.execute("DROP FUNCTION expense_create_partition(DATE)")
+
+    op.execute("ALTER TABLE expense_unpartitioned RENAME TO expense")
+    op.execute("ALTER TABLE expense ADD PRIMARY KEY (expense_id)")
+    op.execute(
+        "ALTER TABLE expense ADD FOREIGN KEY (category_id) "
+        "REFERENCES budget_category ON DELETE CASCADE"
+    )
+    op.execute("ALTER SEQUENCE expense_expense_id_seq OWNED BY expense.expense_id")
+    op.execute(
+        "CREATE INDEX ix_expense_category_id_date_time "
+        "ON expense (category_id, date_time, expense_id)"
+    )
+    op.execute(ROLLUP_TRIGGERS)
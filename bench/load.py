@@ -0,0 +1,167 @@
+"""
+Load driver replaying a realistic endpoint mix against a running API.
+
+    python -m bench.load --base-url http://127.0.0.1:3000 --concurrency 1,8,32
+
+reads the manifest written by bench.seed and, for each concurrency level,
+keeps that many clients busy for --duration seconds. It prints (or writes
+to --output) JSON with p50/p95/p99 latency in milliseconds and requests
+per second for every endpoint, tagged with the current git commit so runs
+can be compared across commits.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import subprocess
+import time
+
+import httpx
+
+# share of the traffic each endpoint receives
+MIX = {
+    "get_expense": 35,
+    "list_expenses": 25,
+    "get_budget": 20,
+    "add_expense": 15,
+    "set_budget": 5,
+}
+
+
+def build_request(endpoint: str, user: dict, rng: random.Random):
+    """Returns (method, path, params, json body) for one call."""
+    user_id = user["user_id"]
+    if endpoint == "get_expense":
+        expense_id = rng.choice(user["expense_ids"])
+        return "GET", f"/user/{user_id}/expense/{expense_id}", None, None
+    if endpoint == "list_expenses":
+        end = datetime.datetime(2020, 1, 1) + datetime.timedelta(
+            days=rng.randrange(7, 3 * 365))
+        start = end - datetime.timedelta(days=rng.choice([7, 30, 90]))
+        params = {"start_date": start.strftime("%Y-%m-%d %H:%M:%S"),
+                  "end_date": end.strftime("%Y-%m-%d %H:%M:%S")}
+        return "GET", f"/user/{user_id}/expenses", params, None
+    if endpoint == "get_budget":
+        return "GET", f"/users/{user_id}/budget/", None, None
+    if endpoint == "add_expense":
+        body = {
+            "cost": round(rng.lognormvariate(3, 1), 2),
+            "date_time": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "category_id": rng.choice(list(user["categories"].values())),
+            "description": "bench",
+        }
+        return "POST", f"/user/{user_id}/expense/", None, body
+    category = rng.choice(list(user["categories"]))
+    body = {"budget": rng.randrange(50, 2000, 10)}
+    return "POST", f"/users/{user_id}/budget/{category}/", None, body
+
+
+async def client_loop(client: httpx.AsyncClient, manifest: dict,
+                      rng: random.Random, deadline: float, samples: dict):
+    endpoints = list(MIX)
+    weights = list(MIX.values())
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights)[0]
+        method, path, params, body = build_request(
+            endpoint, rng.choice(manifest["users"]), rng)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, params=params, json=body)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        elapsed = time.perf_counter() - started
+        samples[endpoint]["latencies"].append(elapsed)
+        if not ok:
+            samples[endpoint]["errors"] += 1
+
+
+def percentile(values, fraction: float):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples: dict, duration: float):
+    report = {}
+    for endpoint, sample in samples.items():
+        latencies = sample["latencies"]
+        if not latencies:
+            continue
+        report[endpoint] = {
+            "requests": len(latencies),
+            "errors": sample["errors"],
+            "requests_per_second": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return report
+
+
+async def run_level(base_url: str, manifest: dict, concurrency: int,
+                    duration: float, seed: int):
+    samples = {endpoint: {"latencies": [], "errors": 0} for endpoint in MIX}
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=60) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            client_loop(client, manifest, random.Random(seed + worker),
+                        deadline, samples)
+            for worker in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests_per_second": round(
+            sum(len(s["latencies"]) for s in samples.values()) / elapsed, 2),
+        "endpoints": summarize(samples, elapsed),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.load")
+    parser.add_argument("--base-url", default="http://127.0.0.1:3000")
+    parser.add_argument("--manifest", default="bench_manifest.json")
+    parser.add_argument("--concurrency", default="1,8,32",
+                        help="comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds spent at each concurrency level")
+    parser.add_argument("--seed", type=int, default=365)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    report = {
+        "commit": current_commit(),
+        "base_url": args.base_url,
+        "mix": MIX,
+        "levels": [
+            asyncio.run(run_level(args.base_url, manifest, level,
+                                  args.duration, args.seed))
+            for level in levels
+        ],
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
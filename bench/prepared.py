@@ -0,0 +1,138 @@
+"""
+Microbenchmark of the prepared statements (DB_PREPARED_STATEMENTS).
+
+    python -m bench.prepared --repeat 200
+
+runs each read-only statement of queries.PREPARED for users of the
+manifest written by bench.seed, once as plain SQL and once as an EXECUTE
+of the statement prepared on the connection. For both it reports p50/p95
+latency and the median planning time Postgres reports (EXPLAIN ANALYZE),
+in milliseconds. Each statement runs a few times before being measured,
+so the prepared one has settled on its plan.
+"""
+import argparse
+import datetime
+import json
+import statistics
+import time
+
+import sqlalchemy
+
+from bench.load import current_commit, percentile
+from src import database as db
+from src import queries
+
+WARMUP = 10
+# statements with side effects are left out
+WRITES = {"insert_expense"}
+
+
+def statement_params(user: dict):
+    category_ids = list(user["categories"].values())
+    list_params = {
+        "user_id_input": user["user_id"],
+        "start_date": datetime.datetime(2023, 1, 1),
+        "end_date": datetime.datetime(2023, 2, 1),
+        "limit": 51,
+    }
+    return {
+        "user_by_id": {"user_id": user["user_id"]},
+        "expense_by_id": {"expense_id": user["expense_ids"][0]},
+        "category_by_id": {"user_id": user["user_id"],
+                           "category_id": category_ids[0]},
+        "data_version": {"user_id": user["user_id"]},
+        "budget_report": {"user_id": user["user_id"], "category_id": None},
+        "budget_summary": {"user_id": user["user_id"], "category_id": None},
+        "category_by_name": {"user_id": user["user_id"],
+                             "category_name": next(iter(user["categories"]))},
+        "expenses_by_id": {"user_id": user["user_id"],
+                           "expense_ids": user["expense_ids"][:10]},
+        "list_expenses_first_page": list_params,
+        "list_expenses_next_page": dict(
+            list_params, after_date_time=datetime.datetime(2023, 1, 15),
+            after_expense_id=0),
+        "owned_categories": {"user_id": user["user_id"],
+                             "category_ids": category_ids},
+    }
+
+
+def time_statement(conn, statement, params, repeat: int):
+    for _ in range(WARMUP):
+        conn.execute(statement, params).fetchall()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(statement, params).fetchall()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def planning_ms(conn, sql: str, params):
+    plan = conn.exec_driver_sql(
+        "EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params).scalar_one()
+    return plan[0]["Planning Time"]
+
+
+def run(manifest: dict, users: int, repeat: int):
+    prepared_engine = sqlalchemy.create_engine(db.engine.url, pool_size=1)
+    queries.prepare_statements(prepared_engine)
+    report = {}
+    with db.engine.connect() as plain, prepared_engine.connect() as prepared:
+        for user in manifest["users"][:users]:
+            for name, params in statement_params(user).items():
+                statement = queries.PREPARED[name]
+                sql, _, execute = queries.prepared_forms(
+                    name, statement, db.engine.dialect)
+                sample = report.setdefault(name, {
+                    "plain": [], "prepared": [],
+                    "plain_planning": [], "prepared_planning": []})
+                sample["plain"].extend(
+                    time_statement(plain, statement, params, repeat))
+                sample["prepared"].extend(
+                    time_statement(prepared, statement, params, repeat))
+                sample["plain_planning"].append(planning_ms(plain, sql, params))
+                sample["prepared_planning"].append(
+                    planning_ms(prepared, execute, params))
+            plain.rollback()
+            prepared.rollback()
+    prepared_engine.dispose()
+    return {
+        name: {
+            **{
+                f"{path}_{label}_ms": round(percentile(sample[path], fraction) * 1000, 3)
+                for path in ("plain", "prepared")
+                for label, fraction in (("p50", 0.50), ("p95", 0.95))
+            },
+            "plain_planning_ms": round(statistics.median(sample["plain_planning"]), 3),
+            "prepared_planning_ms": round(statistics.median(sample["prepared_planning"]), 3),
+        }
+        for name, sample in report.items()
+        if name not in WRITES
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.prepared")
+    parser.add_argument("--manifest", default="bench_manifest.json")
+    parser.add_argument("--users", type=int, default=5,
+                        help="manifest users to run the statements for")
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="timed executions per statement, user and path")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    report = {
+        "commit": current_commit(),
+        "statements": run(manifest, args.users, args.repeat),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
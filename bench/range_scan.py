@@ -0,0 +1,131 @@
+"""
+Date range query latency as the expense table grows.
+
+    python -m bench.range_scan --steps 4 --expenses-per-step 250000
+
+gives a throwaway user one month of expenses, then, step by step, adds
+--expenses-per-step older expenses spread over --months-per-step earlier
+months. After every step it times the list_expenses statement over that
+first month, whose size never changes, so with partition pruning the
+latency should stay flat while the table grows. Everything happens in one
+transaction that is rolled back at the end.
+"""
+import argparse
+import datetime
+import json
+import time
+
+import sqlalchemy
+
+from bench.load import current_commit, percentile
+from src import database as db
+from src import queries
+from src.api import expenses
+
+WINDOW_START = datetime.datetime(2024, 1, 1)
+WINDOW_END = datetime.datetime(2024, 2, 1)
+
+CREATE_PARTITIONS = sqlalchemy.text('''
+SELECT expense_create_partition(month::date)
+FROM generate_series(CAST(:first_month AS DATE), CAST(:last_month AS DATE),
+INTERVAL '1 month') AS month
+''')
+
+# :count expenses spread evenly over [:start, :end)
+INSERT_EXPENSES = sqlalchemy.text('''
+INSERT INTO expense (category_id, date_time, cost, description)
+SELECT :category_id,
+CAST(:start AS TIMESTAMPTZ) + (CAST(:end AS TIMESTAMPTZ) - CAST(:start AS TIMESTAMPTZ)) * n / :count,
+n % 100 + 0.5, 'range-scan'
+FROM generate_series(0, :count - 1) AS n
+''')
+
+
+def months_before(month: datetime.datetime, months: int) -> datetime.datetime:
+    index = month.year * 12 + month.month - 1 - months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def time_window(conn, user_id: int, repeat: int):
+    params = {
+        "user_id_input": user_id,
+        "start_date": WINDOW_START,
+        "end_date": WINDOW_END,
+        "limit": expenses.LIST_EXPENSES_PAGE_MAX,
+    }
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(queries.LIST_EXPENSES_FIRST_PAGE, params).fetchall()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(steps: int, expenses_per_step: int, months_per_step: int,
+        window_expenses: int, repeat: int):
+    results = []
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        user_id = conn.execute(sqlalchemy.text(
+            'INSERT INTO "user" (name) VALUES (\'range-scan\') RETURNING user_id'
+        )).scalar_one()
+        category_id = conn.execute(sqlalchemy.text('''
+            INSERT INTO budget_category (user_id, category_name, monthly_budget)
+            VALUES (:user_id, 'range-scan', 100) RETURNING category_id
+            '''), {"user_id": user_id}).scalar_one()
+
+        conn.execute(CREATE_PARTITIONS, {
+            "first_month": WINDOW_START, "last_month": WINDOW_START})
+        conn.execute(INSERT_EXPENSES, {
+            "category_id": category_id, "count": window_expenses,
+            "start": WINDOW_START, "end": WINDOW_END})
+        total = window_expenses
+        for step in range(steps + 1):
+            if step:
+                end = months_before(WINDOW_START, (step - 1) * months_per_step)
+                start = months_before(WINDOW_START, step * months_per_step)
+                conn.execute(CREATE_PARTITIONS, {
+                    "first_month": start,
+                    "last_month": months_before(end, 1)})
+                conn.execute(INSERT_EXPENSES, {
+                    "category_id": category_id, "count": expenses_per_step,
+                    "start": start, "end": end})
+                total += expenses_per_step
+            conn.execute(sqlalchemy.text("ANALYZE expense"))
+            latencies = time_window(conn, user_id, repeat)
+            results.append({
+                "total_expenses": total,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            })
+        transaction.rollback()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.range_scan")
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--expenses-per-step", type=int, default=250000)
+    parser.add_argument("--months-per-step", type=int, default=12)
+    parser.add_argument("--window-expenses", type=int, default=1000,
+                        help="expenses in the month that is queried")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="times the query is run after each step")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": current_commit(),
+        "window": [str(WINDOW_START), str(WINDOW_END)],
+        "steps": run(args.steps, args.expenses_per_step, args.months_per_step,
+                     args.window_expenses, args.repeat),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
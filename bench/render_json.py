@@ -0,0 +1,95 @@
+"""
+Microbenchmark of the two ways to build the list responses.
+
+    python -m bench.render_json --repeat 50
+
+calls list_users, get_budget and list_expenses in process, for users of
+the manifest written by bench.seed, once with the JSON encoded by the
+application and once rendered by Postgres (DB_RENDER_JSON), checks both
+bodies are identical and reports p50/p95 latency in milliseconds for each.
+"""
+import argparse
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from bench.load import current_commit, percentile
+from src import database as db
+from src.api.server import app
+
+
+def endpoint_urls(user_id: int):
+    return {
+        "list_users": "/users/",
+        "get_budget": f"/users/{user_id}/budget/",
+        "get_budget_summary": f"/users/{user_id}/budget/?include_expenses=false",
+        "list_expenses": (
+            f"/user/{user_id}/expenses?start_date=2020-01-01 00:00:00"
+            "&end_date=2023-01-01 00:00:00&limit=1000"),
+    }
+
+
+def time_requests(client: TestClient, url: str, repeat: int):
+    latencies = []
+    body = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - started)
+        body = response.content
+    return latencies, body
+
+
+def run(manifest: dict, users: int, repeat: int):
+    report = {}
+    with TestClient(app) as client:
+        for user in manifest["users"][:users]:
+            for endpoint, url in endpoint_urls(user["user_id"]).items():
+                sample = report.setdefault(
+                    endpoint, {"python": [], "postgres": [], "identical": True})
+                db.DB_RENDER_JSON = False
+                latencies, encoded = time_requests(client, url, repeat)
+                sample["python"].extend(latencies)
+                db.DB_RENDER_JSON = True
+                latencies, rendered = time_requests(client, url, repeat)
+                sample["postgres"].extend(latencies)
+                sample["identical"] &= encoded == rendered
+    return {
+        endpoint: {
+            "identical": sample["identical"],
+            **{
+                f"{path}_{name}_ms": round(percentile(sample[path], fraction) * 1000, 3)
+                for path in ("python", "postgres")
+                for name, fraction in (("p50", 0.50), ("p95", 0.95))
+            },
+        }
+        for endpoint, sample in report.items()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.render_json")
+    parser.add_argument("--manifest", default="bench_manifest.json")
+    parser.add_argument("--users", type=int, default=5,
+                        help="manifest users to run the endpoints for")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="requests per endpoint, user and path")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    report = {
+        "commit": current_commit(),
+        "endpoints": run(manifest, args.users, args.repeat),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+    python -m bench.seed --users 100 --categories 10 --expenses 1000
+
+seeds N users x M categories x K expenses (per category) into the database
+configured by the usual POSTGRES_* variables, and writes the ids it
+created to a manifest read by bench.load. The same --seed always produces
+the same names, budgets, costs and dates.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import random
+
+import sqlalchemy
+
+from src import database as db
+from src import partitions
+
+DESCRIPTIONS = [
+    "coffee", "groceries", "rent", "gas", "lunch", "movie tickets",
+    "book", "phone bill", "gym", "dinner", "parking", "pharmacy",
+]
+START = datetime.datetime(2020, 1, 1)
+HISTORY = datetime.timedelta(days=3 * 365)
+
+
+def seed(users: int, categories: int, expenses: int, rng: random.Random,
+         prefix: str):
+    manifest = {"users": []}
+    with db.engine.begin() as conn:
+        _create_partitions(conn)
+        for user_number in range(users):
+            user_id = conn.execute(
+                sqlalchemy.text(
+                    'INSERT INTO "user" (name) VALUES (:name) RETURNING user_id'),
+                {"name": f"{prefix}-user-{user_number}"}
+            ).scalar_one()
+            category_ids = {}
+            for category_number in range(categories):
+                name = f"{prefix}-category-{category_number}"
+                category_ids[name] = conn.execute(
+                    sqlalchemy.text('''
+                    INSERT INTO budget_category
+                    (category_name, user_id, monthly_budget)
+                    VALUES (:category_name, :user_id, :monthly_budget)
+                    RETURNING category_id
+                    '''),
+                    {"category_name": name, "user_id": user_id,
+                     "monthly_budget": rng.randrange(50, 2000, 10)}
+                ).scalar_one()
+            _copy_expenses(conn, category_ids.values(), expenses, rng)
+            expense_ids = conn.execute(
+                sqlalchemy.text('''
+                SELECT expense_id FROM expense
+                WHERE category_id = ANY(:category_ids)
+                ORDER BY expense_id
+                '''),
+                {"category_ids": list(category_ids.values())}
+            ).scalars().all()
+            manifest["users"].append({
+                "user_id": user_id,
+                "categories": category_ids,
+                # a sample is enough to pick realistic get_expense targets
+                "expense_ids": rng.sample(expense_ids, min(100, len(expense_ids))),
+            })
+    return manifest
+
+
+def _create_partitions(conn):
+    first_month = START.date().replace(day=1)
+    months = (START + HISTORY).year * 12 + (START + HISTORY).month \
+        - (first_month.year * 12 + first_month.month)
+    for month in range(months + 1):
+        conn.execute(partitions.CREATE_PARTITION,
+                     {"month": partitions.add_months(first_month, month)})
+
+
+def _copy_expenses(conn, category_ids, expenses: int, rng: random.Random):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for category_id in category_ids:
+        for _ in range(expenses):
+            date_time = START + HISTORY * rng.random()
+            writer.writerow([
+                category_id,
+                date_time.strftime("%Y-%m-%d %H:%M:%S"),
+                round(rng.lognormvariate(3, 1), 2),
+                rng.choice(DESCRIPTIONS),
+            ])
+    buffer.seek(0)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY expense (category_id, date_time, cost, description) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.seed")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=1000,
+                        help="expenses per category")
+    parser.add_argument("--seed", type=int, default=365)
+    parser.add_argument("--prefix", default="bench",
+                        help="prefix of the generated user and category names")
+    parser.add_argument("--manifest", default="bench_manifest.json")
+    args = parser.parse_args(argv)
+
+    manifest = seed(args.users, args.categories, args.expenses,
+                    random.Random(args.seed), args.prefix)
+    manifest["seed"] = args.seed
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    print(f"seeded {args.users} users x {args.categories} categories x "
+          f"{args.expenses} expenses, manifest in {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
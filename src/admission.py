@@ -0,0 +1,214 @@
+"""
+Admission control in front of the connection pools.
+
+Every request holds a pooled connection while it runs, so past a point
+more concurrent requests only queue on pool checkout, up to
+DB_POOL_TIMEOUT, long after their clients gave up. AdmissionMiddleware
+lets at most ADMISSION_CAPACITY units of work run at once, a request
+weighing ROUTE_WEIGHTS units (1 by default), and queues the others in
+arrival order, at most ADMISSION_QUEUE_MAX of them.
+
+A request is turned away with a 503 and a Retry-After header, rather than
+queued, when the queue is full or when its expected wait exceeds what it
+may wait: ADMISSION_MAX_WAIT seconds, or less when the client's
+X-Request-Timeout leaves less once its own run is accounted for. The
+expected wait is the work ahead of it, in units, over the capacity, times
+the average run time of a unit over the recent requests.
+"""
+import asyncio
+import collections
+import math
+import os
+import threading
+import time
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from src import database as db
+
+ADMISSION_CAPACITY = int(os.environ.get(
+    "ADMISSION_CAPACITY", db.DB_POOL_SIZE + db.DB_MAX_OVERFLOW))
+ADMISSION_QUEUE_MAX = int(os.environ.get("ADMISSION_QUEUE_MAX", 100))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", 5))
+
+# Units of work of the endpoints heavier than a single row read or write,
+# by endpoint name, which the async twins share. Endpoints that never
+# touch the database weigh nothing and are always admitted.
+ROUTE_WEIGHTS = {
+    "get_expenses_batch": 2,
+    "search_expenses": 2,
+    "get_budget": 3,
+    "get_spending": 3,
+    "add_expenses_bulk": 5,
+    "export_expenses": 5,
+    "healthz": 0,
+    "readyz": 0,
+    "get_metrics": 0,
+    "root": 0,
+}
+
+# weight of the latest request in the average run time of a unit
+RUN_TIME_SMOOTHING = 0.1
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"overloaded, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("weight", "future", "loop", "admitted")
+
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.admitted = False
+
+
+def _admit(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Weighted FIFO semaphore with a bounded queue and deadline-aware
+    rejection. Requests may run on several event loops (the test client
+    runs one per request), so its state is guarded by a lock and waiters
+    are woken on their own loop.
+    """
+
+    def __init__(self, capacity: int, queue_max: int, max_wait: float):
+        self.capacity = capacity
+        self.queue_max = queue_max
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.queued = 0
+        self.rejected = 0
+        self.seconds_per_unit = 0.0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self, weight: int) -> float:
+        ahead = self.in_use + self.queued + weight - self.capacity
+        return max(ahead, 0) * self.seconds_per_unit / self.capacity
+
+    async def acquire(self, weight: int, timeout: float = None):
+        """
+        Waits for `weight` units, raising Overloaded when they cannot be
+        had within `timeout` seconds of the request's start.
+        """
+        weight = min(weight, self.capacity)
+        with self._lock:
+            if not self._waiters and self.in_use + weight <= self.capacity:
+                self.in_use += weight
+                return
+            max_wait = self.max_wait
+            if timeout is not None:
+                max_wait = min(max_wait, timeout - weight * self.seconds_per_unit)
+            expected_wait = self.expected_wait(weight)
+            if len(self._waiters) >= self.queue_max or expected_wait > max_wait:
+                self.rejected += 1
+                raise Overloaded(expected_wait)
+            waiter = _Waiter(weight)
+            self._waiters.append(waiter)
+            self.queued += weight
+        try:
+            await asyncio.wait_for(waiter.future, max_wait)
+        except BaseException as e:
+            with self._lock:
+                if waiter.admitted:
+                    # admitted as the wait ran out
+                    self._release(weight)
+                else:
+                    self._waiters.remove(waiter)
+                    self.queued -= weight
+                    self._wake()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.rejected += 1
+                    raise Overloaded(self.expected_wait(weight)) from None
+            raise
+
+    def release(self, weight: int, seconds: float):
+        """Gives back the units of a request that ran for `seconds`."""
+        weight = min(weight, self.capacity)
+        with self._lock:
+            seconds_per_unit = seconds / weight
+            if self.seconds_per_unit:
+                self.seconds_per_unit += RUN_TIME_SMOOTHING * (
+                    seconds_per_unit - self.seconds_per_unit)
+            else:
+                self.seconds_per_unit = seconds_per_unit
+            self._release(weight)
+
+    def _release(self, weight: int):
+        self.in_use -= weight
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and \
+                self.in_use + self._waiters[0].weight <= self.capacity:
+            waiter = self._waiters.popleft()
+            self.queued -= waiter.weight
+            self.in_use += waiter.weight
+            waiter.admitted = True
+            waiter.loop.call_soon_threadsafe(_admit, waiter.future)
+
+
+limiter = AdmissionController(
+    ADMISSION_CAPACITY, ADMISSION_QUEUE_MAX, ADMISSION_MAX_WAIT)
+
+
+def client_timeout(scope) -> float:
+    """Seconds the client gives the request, from X-Request-Timeout."""
+    for name, value in scope["headers"]:
+        if name == b"x-request-timeout":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware running each request under `limiter`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        weight = self.weight(scope) if scope["type"] == "http" else 0
+        if not weight or limiter.capacity <= 0:
+            await self.app(scope, receive, send)
+            return
+        current = limiter
+        try:
+            await current.acquire(weight, client_timeout(scope))
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": "server overloaded, retry later."}, status_code=503,
+                headers={"Retry-After": str(max(math.ceil(e.retry_after), 1))})
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current.release(weight, time.perf_counter() - started)
+
+    def weight(self, scope) -> int:
+        for route in scope["app"].router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL and "endpoint" in child_scope:
+                # so that rejected requests are labelled with their route
+                scope["endpoint"] = child_scope["endpoint"]
+                return ROUTE_WEIGHTS.get(child_scope["endpoint"].__name__, 1)
+        # unknown paths are answered without the database
+        return 0
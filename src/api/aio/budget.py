@@ -0,0 +1,146 @@
+import sqlalchemy
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src import cache
+from src import database as db
+from src import queries
+from src import sql_utils as utils
+from src.api.budget import (BudgetJson, BudgetPeriodJson, budget_period_params,
+                            budget_report, budget_summary,
+                            check_period_overlap, rendered_budget)
+
+router = APIRouter()
+
+
+@router.get("/users/{user_id}/budget/", tags=["budgets"])
+async def get_budget(user_id: int, request: Request, response: Response,
+                     budget_category_id: int = None,
+                     include_expenses: bool = True,
+                     conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns the user's budget information.
+    By default, it will return all the user's budget information for all categories.
+
+    - `budget_category_id`: the id of the category
+    - `budget_category`: the user-defined name of a specific category
+    - `budget`: the budget associated with the category
+    - `budget_period`: the `start` and `end` of the category's budget
+      period holding the current time, left out when there is none
+    - `expenses`: the expenses associated with each category,
+      left out when `include_expenses` is false
+    - `budget_delta`: a number showing the difference between
+      current money spent in the category and the budget in place
+
+    Within a budget period, its budget applies and only the expenses
+    of the period count.
+
+    Each expense is represented by a dictionary with the following keys:
+
+    - `cost`: the monetary value of the expense, in dollars
+    - `item`: the item associated with the expense
+    - `date_time`: the date of the expense
+
+    The response carries an `ETag`; sending it back in `If-None-Match`
+    answers `304 Not Modified` while the user's data did not change and
+    none of their budget periods started or ended.
+    """
+    not_modified = utils.check_etag(
+        request, response, await utils.get_budget_data_version_async(conn, user_id))
+    if not_modified:
+        return not_modified
+    params = [{"user_id": user_id, "category_id": budget_category_id or None}]
+    if db.DB_RENDER_JSON:
+        rendered = rendered_budget((await conn.execute(
+            queries.BUDGET_REPORT_JSON if include_expenses
+            else queries.BUDGET_SUMMARY_JSON,
+            params
+        )).fetchone(), budget_category_id, response)
+        if rendered:
+            return rendered
+    result = await conn.execute(
+        queries.BUDGET_REPORT if include_expenses else queries.BUDGET_SUMMARY,
+        params
+    )
+    if not include_expenses:
+        return budget_summary(result.fetchall(), budget_category_id)
+    return budget_report(result.fetchall(), budget_category_id)
+
+
+@router.post("/users/{user_id}/budget/{budget_category}/", tags=["budgets"])
+async def set_budget(user_id: int, budget_category: str, budget: BudgetJson,
+                     conn: AsyncConnection = Depends(db.get_async_connection)):
+    """
+    This endpoint adds or updates a category with a budget. It takes as input:
+
+    - `user_id`: the associated user for the budget
+    - `budget_category`: the user generated category to be created/updated
+    - `budget`: the dollar amount of the budget
+    """
+    user = await utils.get_user_async(conn, user_id)
+    category_result = (await conn.execute(
+        queries.CATEGORY_BY_NAME,
+        [{"user_id": user.user_id, "category_name": budget_category}]
+    )).fetchone()
+    if category_result is None:
+        inserted_category = await conn.execute(
+            queries.INSERT_CATEGORY,
+            {"category_name": budget_category,
+             "user_id": user_id, "monthly_budget": budget.budget}
+        )
+        category_id = inserted_category.fetchone().category_id
+    else:
+        updated_category = await conn.execute(
+            queries.UPDATE_CATEGORY_BUDGET,
+            [{"monthly_budget": budget.budget,
+              "category_id": category_result.category_id}]
+        )
+        category_id = updated_category.fetchone().category_id
+    key = cache.category_key(user.user_id, category_id)
+    await cache.publish_async(conn, key)
+    await conn.commit()
+    cache.lookups.invalidate(key)
+    return {
+        "category_id": category_id,
+        "category_name": budget_category,
+        "user_id": user.user_id,
+        "monthly_budget": budget.budget
+    }
+
+
+@router.post("/users/{user_id}/budget/{budget_category}/periods", tags=["budgets"])
+async def add_budget_period(user_id: int, budget_category: str,
+                            period: BudgetPeriodJson,
+                            conn: AsyncConnection = Depends(db.get_async_connection)):
+    """
+    This endpoint adds a budget period to an existing category. It takes as input:
+
+    - `start_date`: when the period starts, included
+    - `end_date`: when the period ends, excluded
+    - `budget`: the dollar amount of the budget over the period
+
+    Expects format "YYYY-MM-DD HH:MM:SS" for timestamps.
+    The periods of a category cannot overlap: adding one that overlaps
+    another answers `409 Conflict`.
+    """
+    user = await utils.get_user_async(conn, user_id)
+    category = utils.check_category((await conn.execute(
+        queries.CATEGORY_BY_NAME,
+        [{"user_id": user.user_id, "category_name": budget_category}]
+    )).fetchone())
+    params = budget_period_params(category.category_id, period)
+    try:
+        period_id = (await conn.execute(
+            queries.INSERT_BUDGET_PERIOD, params)).scalar_one()
+    except sqlalchemy.exc.IntegrityError as e:
+        await conn.rollback()
+        check_period_overlap(e)
+        raise
+    await conn.commit()
+    return {
+        "period_id": period_id,
+        "category_id": category.category_id,
+        "start_date": period.start_date,
+        "end_date": period.end_date,
+        "budget": period.budget,
+    }
@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src import database as db
+from src import group_commit
+from src import queries
+from src import sql_utils as utils
+from src.api.expenses import (LIST_EXPENSES_PAGE_MAX, STREAM_BATCH_SIZE,
+                              ExpenseBatchJson, ExpenseItemLines, ExpenseJson,
+                              added_expense, expense_detail, expense_items,
+                              expense_with_items_params, expenses_batch,
+                              expenses_page, list_expenses_query,
+                              ndjson_lines, rendered_page)
+
+router = APIRouter()
+
+
+@router.get("/user/{user_id}/expense/{expense_id}", tags=["expenses"])
+async def get_expense(user_id: int, expense_id: int, include_items: bool = False,
+                      conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns the information associated with an expense by its identifier.
+    For each expense it returns:
+
+    - `cost`: the monetary value of the expense, in Dollars
+    - `date_time`: the date and time of the expense
+    - `expense_id`: the ID of the item associated with the expense
+    - `category`: the user defined category of the item
+    - `description`: the user defined description of the item
+    - `items`: with `include_items`, the line items of the expense, each
+      with its `item_id`, `name` and `cost`
+    """
+    user = await utils.get_user_async(conn, user_id)
+    if not include_items:
+        expense = await utils.get_expense_async(conn, expense_id)
+        category = await utils.get_category_async(
+            conn, user.user_id, expense.category_id)
+        return expense_detail(expense, category)
+    rows = (await conn.execute(
+        queries.EXPENSE_WITH_ITEMS, {"expense_id": expense_id})).fetchall()
+    expense = utils.check_expense(rows[0] if rows else None)
+    category = await utils.get_category_async(
+        conn, user.user_id, expense.category_id)
+    return expense_detail(expense[:5], category, expense_items(rows))
+
+
+@router.post("/user/{user_id}/expenses/batch", tags=["expenses"])
+async def get_expenses_batch(user_id: int, batch: ExpenseBatchJson,
+                             conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns many expenses by their identifiers in one request,
+    at most `EXPENSE_BATCH_MAX` (100 by default) at a time.
+    Takes in an ExpenseBatchJson which contains the `expense_ids` to fetch.
+
+    It returns:
+
+    - `expenses`: the expenses found, in the order they were asked for,
+      each with the same fields as the single expense endpoint
+    - `errors`: the IDs that do not exist or belong to another user, each
+      with an `expense_id` and a `detail` message
+    """
+    user = await utils.get_user_async(conn, user_id)
+    rows = (await conn.execute(queries.EXPENSES_BY_ID, {
+        "user_id": user.user_id, "expense_ids": batch.expense_ids})).fetchall()
+    return expenses_batch(batch.expense_ids, rows)
+
+
+@router.get("/user/{user_id}/expenses", tags=["expenses"])
+async def list_expenses(user_id: int,
+                        request: Request,
+                        response: Response,
+                        start_date: str = (
+                                datetime.datetime.utcnow() - datetime.timedelta(days=7)
+                        ).strftime("%Y-%m-%d %H:%M:%S"),
+                        end_date: str = datetime.datetime
+                        .utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+                        limit: int = Query(None, ge=1, le=LIST_EXPENSES_PAGE_MAX),
+                        cursor: str = None,
+                        stream: bool = False,
+                        include_items: bool = False,
+                        conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns the information associated with expenses
+    over a defined time period, ordered by `date_time` then `expense_id`.
+    By default, the difference between `start_date` and `end_date` is one week
+    and `end_time` is today.
+    Expects format "YYYY-MM-DD HH:MM:SS" for timestamp
+
+    - `limit`: the maximum number of expenses to return. When more expenses
+      remain, the `X-Next-Cursor` response header holds the cursor for the
+      next page
+    - `cursor`: the `X-Next-Cursor` value of the previous page
+    - `stream`: when true, the expenses are streamed as newline delimited
+      JSON instead of a single JSON list
+    - `include_items`: when true, each expense comes with its `items`,
+      read in the same query
+
+    For each expense, it returns:
+
+    - `cost`: the monetary value of the expense, in dollars
+    - `date`: the date of the expense
+    - `expense_id`: the ID of the item associated with the expense
+    - `category`: the user-defined category of the item
+
+    The response carries an `ETag`; sending it back in `If-None-Match`
+    answers `304 Not Modified` while the user's data did not change.
+    """
+    query, params = list_expenses_query(
+        user_id, start_date, end_date, limit, cursor, stream, include_items)
+    not_modified = utils.check_etag(
+        request, response, await utils.get_data_version_async(conn, user_id))
+    if not_modified:
+        return not_modified
+    if stream:
+        return StreamingResponse(
+            _stream_expenses(conn, query, params, include_items),
+            media_type="application/x-ndjson",
+            headers=response.headers
+        )
+
+    if db.DB_RENDER_JSON and not include_items:
+        rendered = rendered_page((await conn.execute(*list_expenses_query(
+            user_id, start_date, end_date, limit, cursor, stream, rendered=True
+        ))).fetchone(), limit, response)
+        if rendered:
+            return rendered
+    expenses = (await conn.execute(query, params)).fetchall()
+    return expenses_page(expenses, limit, response, include_items)
+
+
+async def _stream_expenses(conn, query, params, include_items: bool = False):
+    result = await conn.stream(query, params)
+    lines = ExpenseItemLines() if include_items else None
+    async for batch in result.partitions(STREAM_BATCH_SIZE):
+        yield lines.feed(batch) if lines else ndjson_lines(batch)
+    if lines:
+        yield lines.finish()
+
+
+@router.post("/user/{user_id}/expense/", tags=["expenses"])
+async def add_expense(user_id: int, expense_json: ExpenseJson,
+                      conn: AsyncConnection = Depends(db.get_async_connection)):
+    """
+    This endpoint adds a new expense to the database.
+    This expense includes:
+
+    - `user`: the user who is adding the expense (required)
+    - `cost`: the monetary value of the expense, in Dollars (required)
+    - `date_time`: the date and time of the expense. (required)
+            Expects format "YYYY-MM-DD HH:MM:SS"
+    - `category_id`: the budget category of the item (required)
+    - `description`: the user defined description of the item (not required)
+    - `items`: the line items of the expense, each with a `name` and a
+      `cost` (not required). They are added with the expense, whose cost
+      is then the sum of theirs
+
+    With `EXPENSE_GROUP_COMMIT`, concurrent requests without items are
+    inserted and committed together.
+    """
+
+    # check user has category specified
+    await utils.get_category_async(conn, user_id, expense_json.category_id)
+
+    # bound as text like the sync path, for Postgres to read in the session
+    # TimeZone; asyncpg would take a naive datetime as the process's local time
+    utils.parse_timestamp(expense_json.date_time)
+    if expense_json.items:
+        rows = (await conn.execute(
+            queries.INSERT_EXPENSE_WITH_ITEMS,
+            expense_with_items_params(expense_json, expense_json.date_time)
+        )).fetchall()
+        await conn.commit()
+        return added_expense(expense_json, rows[0].expense_id, rows)
+
+    row = {
+        "category_id": expense_json.category_id,
+        "date_time": expense_json.date_time,
+        "cost": expense_json.cost,
+        "description": expense_json.description
+    }
+    if group_commit.EXPENSE_GROUP_COMMIT:
+        await conn.rollback()
+        expense_id = await asyncio.wrap_future(
+            group_commit.writer().submit(row))
+    else:
+        inserted_expense = await conn.execute(queries.INSERT_EXPENSE, row)
+        expense_id = inserted_expense.fetchone().expense_id
+        await conn.commit()
+    return added_expense(expense_json, expense_id)
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src import cache
+from src import database as db
+from src import passwords
+from src import queries
+from src import sql_utils as utils
+from src.api.users import UserJson, user_summary
+
+router = APIRouter()
+
+
+@router.get("/users/", tags=["users"])
+async def list_users(conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns the information associated with all users.
+    For each user it returns:
+
+    - `user_id`: the ID of the user
+    - `name`: the name of the user
+    """
+    if db.DB_RENDER_JSON:
+        return Response((await conn.execute(queries.LIST_USERS_JSON)).scalar_one(),
+                        media_type="application/json")
+    users = (await conn.execute(queries.LIST_USERS)).fetchall()
+    return [user_summary(user) for user in users]
+
+
+@router.get("/users/{user_id}/", tags=["users"])
+async def get_user(user_id: int,
+                   conn: AsyncConnection = Depends(db.get_async_read_connection)):
+    """
+    This endpoint returns the information associated with a user by its identifier.
+    For each user it returns:
+
+    - `user_id`: the ID of the user
+    - `name`: the name of the user
+    """
+    return user_summary(await utils.get_user_async(conn, user_id))
+
+
+async def hashed_password(user: UserJson) -> str:
+    return await passwords.hash_password_async(user.password)
+
+
+@router.post("/users/", tags=["users"])
+async def create_user(user: UserJson,
+                      hashed_pwd: str = Depends(hashed_password),
+                      conn: AsyncConnection = Depends(db.get_async_connection)):
+    """
+    This endpoint creates a new user.
+
+    Takes in a UserJson which contains the user's name and password.
+
+    Returns the user's ID and name if successful.
+    """
+    inserted_user = await conn.execute(
+        queries.INSERT_USER,
+        [{"name": user.name,
+          "hashed_pwd": hashed_pwd}]
+    )
+    user_id = inserted_user.fetchone().user_id
+    await cache.publish_async(conn, cache.user_key(user_id))
+    await conn.commit()
+    cache.lookups.invalidate(cache.user_key(user_id))
+    db.remember_new_user(user_id)
+    return {
+        "user_id": user_id,
+        "user_name": user.name,
+    }
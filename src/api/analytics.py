@@ -0,0 +1,73 @@
+import enum
+import itertools
+
+import sqlalchemy
+from fastapi import APIRouter, Depends
+
+from src import database as db
+from src import queries
+from src import sql_utils as utils
+
+router = APIRouter()
+
+
+class Bucket(str, enum.Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+@router.get("/user/{user_id}/analytics/spending", tags=["analytics"])
+def get_spending(user_id: int,
+                 start_date: str,
+                 end_date: str,
+                 bucket: Bucket = Bucket.week,
+                 category_id: int = None,
+                 conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
+    """
+    This endpoint returns a user's spending over a time period, per budget
+    category, grouped into day, week or month buckets.
+    Expects format "YYYY-MM-DD HH:MM:SS" for timestamp
+
+    - `bucket`: `day`, `week` (the default, starting on Monday) or `month`
+    - `category_id`: only report this budget category
+
+    For each budget category with expenses in the period it returns:
+
+    - `category_id`: the ID of the budget category
+    - `category`: the name of the budget category
+    - `series`: one entry per bucket with expenses, in order, holding the
+      bucket's start (`bucket`), the `total` spent in it, the number of
+      expenses (`count`) and the `running_total` since `start_date`
+    """
+    user = utils.get_user(conn, user_id)
+    if category_id is not None:
+        utils.get_category(conn, user.user_id, category_id)
+    rows = conn.execute(queries.SPENDING, {
+        "user_id": user.user_id,
+        "category_id": category_id,
+        "bucket": bucket.value,
+        "start_date": utils.parse_timestamp(start_date),
+        "end_date": utils.parse_timestamp(end_date),
+    }).fetchall()
+    return spending_series(rows)
+
+
+def spending_series(rows):
+    return [
+        {
+            "category_id": category_id,
+            "category": category_name,
+            "series": [
+                {
+                    "bucket": row.bucket,
+                    "total": row.total,
+                    "count": row.expense_count,
+                    "running_total": row.running_total,
+                }
+                for row in category_rows
+            ],
+        }
+        for (category_id, category_name), category_rows in itertools.groupby(
+            rows, key=lambda row: (row.category_id, row.category_name))
+    ]
@@ -1,15 +1,24 @@
+import itertools
+
 import sqlalchemy
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 
+from src import cache
 from src import database as db
-from src.sql_utils import get_category, get_user
+from src import queries
+from src import sql_utils as utils
+from src.sql_utils import get_user
 
 router = APIRouter()
 
+
 # TODO update all these endpoints considering they are now subsets of a the parent table "category"
 @router.get("/users/{user_id}/budget/", tags=["budgets"])
-def get_budget(user_id: int, budget_category_id: int = None):
+def get_budget(user_id: int, request: Request, response: Response,
+               budget_category_id: int = None,
+               include_expenses: bool = True,
+               conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
     """
     This endpoint returns the user's budget information.
     By default, it will return all the user's budget information for all categories.
@@ -17,86 +26,137 @@ def get_budget(user_id: int, budget_category_id: int = None):
     - `budget_category_id`: the id of the category
     - `budget_category`: the user-defined name of a specific category
     - `budget`: the budget associated with the category
-    - `expenses`: the expenses associated with each category
+    - `budget_period`: the `start` and `end` of the category's budget
+      period holding the current time, left out when there is none
+    - `expenses`: the expenses associated with each category,
+      left out when `include_expenses` is false
     - `budget_delta`: a number showing the difference between
       current money spent in the category and the budget in place
 
+    Within a budget period, its budget applies and only the expenses
+    of the period count.
+
     Each expense is represented by a dictionary with the following keys:
 
     - `cost`: the monetary value of the expense, in dollars
     - `item`: the item associated with the expense
     - `date_time`: the date of the expense
+
+    The response carries an `ETag`; sending it back in `If-None-Match`
+    answers `304 Not Modified` while the user's data did not change and
+    none of their budget periods started or ended.
+    """
+    not_modified = utils.check_etag(
+        request, response, utils.get_budget_data_version(conn, user_id))
+    if not_modified:
+        return not_modified
+    params = [{"user_id": user_id, "category_id": budget_category_id or None}]
+    if db.DB_RENDER_JSON:
+        rendered = rendered_budget(conn.execute(
+            queries.BUDGET_REPORT_JSON if include_expenses
+            else queries.BUDGET_SUMMARY_JSON,
+            params
+        ).fetchone(), budget_category_id, response)
+        if rendered:
+            return rendered
+    rows = conn.execute(
+        queries.BUDGET_REPORT if include_expenses else queries.BUDGET_SUMMARY,
+        params
+    ).fetchall()
+    if not include_expenses:
+        return budget_summary(rows, budget_category_id)
+    return budget_report(rows, budget_category_id)
+
+
+def check_budget_rows(rows, budget_category_id: int = None):
+    if not rows:
+        raise HTTPException(status_code=404, detail="user not found.")
+    if budget_category_id and rows[0].category_id is None:
+        raise HTTPException(
+            status_code=404, detail="budget category not found.")
+
+
+def rendered_budget(report, budget_category_id: int, response: Response):
     """
+    Answers get_budget with the body rendered by BUDGET_REPORT_JSON or
+    BUDGET_SUMMARY_JSON, or None when only Python can encode it.
+    """
+    if report.row_count == 0:
+        raise HTTPException(status_code=404, detail="user not found.")
+    if budget_category_id and report.category_count == 0:
+        raise HTTPException(
+            status_code=404, detail="budget category not found.")
+    if not report.renderable:
+        return None
+    return Response(report.body, media_type="application/json",
+                    headers=response.headers)
+
+
+def budget_report(rows, budget_category_id: int = None):
+    """Groups the rows of BUDGET_REPORT into the get_budget response."""
+    check_budget_rows(rows, budget_category_id)
     data = []
-    with db.engine.connect() as conn:
-        user = get_user(user_id)
-        if budget_category_id:
-            category_user = get_category(user.user_id, budget_category_id)
-            expenses = conn.execute(
-                sqlalchemy.text('''
-                SELECT * FROM expense
-                WHERE category_id = :category_id
-                '''),
-                [{"user_id": user.user_id, "category_id": budget_category_id}]
-            ).fetchall()
-            expenses_list = []
-            for expense in expenses:
-                _, _, date_time, cost, description = expense
-                expenses_list.append({
-                    "date_time": date_time,
-                    "cost": cost,
-                    "item": description
-                })
-            data.append({
-                "budget_category_id": budget_category_id,
-                "budget_category": category_user.category_name,
-                "budget": category_user.monthly_budget,
-                "expenses": expenses_list,
-                "budget_delta": category_user.monthly_budget - sum(
-                    [expense["cost"] for expense in expenses_list]
-                )
-            })
-        else:
-            categories_user = conn.execute(
-                sqlalchemy.text(
-                    "SELECT * FROM budget_category WHERE user_id = :user_id"),
-                [{"user_id": user[0]}]
-            ).fetchall()
-            for category_user in categories_user:
-                expenses = conn.execute(
-                    sqlalchemy.text('''
-                    SELECT * FROM expense
-                    WHERE category_id = :category_id
-                    '''),
-                    [{"user_id": user.user_id,
-                      "category_id": category_user.category_id}]
-                ).fetchall()
-                expenses_list = []
-                for expense in expenses:
-                    _, _, date_time, cost, description = expense
-                    expenses_list.append({
-                        "date_time": date_time,
-                        "cost": cost,
-                        "item": description
-                    })
-                data.append({
-                    "budget_category_id": category_user.category_id,
-                    "budget_category": category_user.category_name,
-                    "budget": category_user.monthly_budget,
-                    "expenses": expenses_list,
-                    "budget_delta": category_user.monthly_budget - sum(
-                        [expense["cost"] for expense in expenses_list]
-                    )
-                })
+    for category_id, category_rows in itertools.groupby(
+            rows, key=lambda row: row.category_id):
+        if category_id is None:
+            # user without any categories
+            continue
+        category_rows = list(category_rows)
+        category_user = category_rows[0]
+        expenses_list = [
+            {
+                "date_time": expense.date_time,
+                "cost": expense.cost,
+                "item": expense.description
+            }
+            for expense in category_rows
+            if expense.expense_id is not None
+        ]
+        category = category_budget(category_user)
+        category["expenses"] = expenses_list
+        category["budget_delta"] = category_user.monthly_budget - sum(
+            [expense["cost"] for expense in expenses_list]
+        )
+        data.append(category)
     return data
 
 
+def budget_summary(rows, budget_category_id: int = None):
+    """Turns the rows of BUDGET_SUMMARY into the get_budget response."""
+    check_budget_rows(rows, budget_category_id)
+    data = []
+    for category_user in rows:
+        if category_user.category_id is None:
+            continue
+        category = category_budget(category_user)
+        category["budget_delta"] = \
+            category_user.monthly_budget - category_user.spent
+        data.append(category)
+    return data
+
+
+def category_budget(category_user):
+    """The fields of a get_budget category preceding its expenses."""
+    category = {
+        "budget_category_id": category_user.category_id,
+        "budget_category": category_user.category_name,
+        "budget": category_user.monthly_budget,
+    }
+    if category_user.period_start is not None:
+        category["budget_period"] = {
+            "start": category_user.period_start,
+            "end": category_user.period_end,
+        }
+    return category
+
+
 class BudgetJson(BaseModel):
     budget: float
 
 
 @router.post("/users/{user_id}/budget/{budget_category}/", tags=["budgets"])
-def set_budget(user_id: int, budget_category: str, budget: BudgetJson):
+def set_budget(user_id: int, budget_category: str, budget: BudgetJson,
+               conn: sqlalchemy.Connection = Depends(db.get_connection)):
     """
     This endpoint adds or updates a category with a budget. It takes as input:
 
@@ -104,51 +164,98 @@ def set_budget(user_id: int, budget_category: str, budget: BudgetJson):
     - `budget_category`: the user generated category to be created/updated
     - `budget`: the dollar amount of the budget
     """
-    with db.engine.connect() as conn:
-        user = get_user(user_id)
-        category_result = conn.execute(
-            sqlalchemy.text('''
-            SELECT * FROM budget_category
-            WHERE user_id = :user_id
-            AND category_name = :category_name
-            '''),
-            [{"user_id": user.user_id, "category_name": budget_category}]
-        ).fetchone()
-        if category_result is None:
-            inserted_category = conn.execute(
-                sqlalchemy.text('''
-                INSERT INTO budget_category
-                (category_name, user_id, monthly_budget)
-                VALUES (:category_name, :user_id, :monthly_budget)
-                RETURNING category_id
-                '''),
-                {"category_name": budget_category,
-                 "user_id": user_id, "monthly_budget": budget.budget}
-            )
-            category_id = inserted_category.fetchone().category_id
-            conn.commit()
-            return {
-                "category_id": category_id,
-                "category_name": budget_category,
-                "user_id": user.user_id,
-                "monthly_budget": budget.budget
-            }
-        else:
-            updated_category = conn.execute(
-                sqlalchemy.text('''
-                UPDATE budget_category
-                SET monthly_budget = :monthly_budget
-                WHERE category_id = :category_id
-                RETURNING category_id
-                '''),
-                [{"monthly_budget": budget.budget,
-                  "category_id": category_result.category_id}]
-            )
-            category_id = updated_category.fetchone().category_id
-            conn.commit()
-            return {
-                "category_id": category_id,
-                "category_name": budget_category,
-                "user_id": user.user_id,
-                "monthly_budget": budget.budget
-            }
+    user = get_user(conn, user_id)
+    category_result = conn.execute(
+        queries.CATEGORY_BY_NAME,
+        [{"user_id": user.user_id, "category_name": budget_category}]
+    ).fetchone()
+    if category_result is None:
+        inserted_category = conn.execute(
+            queries.INSERT_CATEGORY,
+            {"category_name": budget_category,
+             "user_id": user_id, "monthly_budget": budget.budget}
+        )
+        category_id = inserted_category.fetchone().category_id
+    else:
+        updated_category = conn.execute(
+            queries.UPDATE_CATEGORY_BUDGET,
+            [{"monthly_budget": budget.budget,
+              "category_id": category_result.category_id}]
+        )
+        category_id = updated_category.fetchone().category_id
+    key = cache.category_key(user.user_id, category_id)
+    cache.publish(conn, key)
+    conn.commit()
+    cache.lookups.invalidate(key)
+    return {
+        "category_id": category_id,
+        "category_name": budget_category,
+        "user_id": user.user_id,
+        "monthly_budget": budget.budget
+    }
+
+
+# Expects format "YYYY-MM-DD HH:MM:SS" for timestamps
+class BudgetPeriodJson(BaseModel):
+    start_date: str
+    end_date: str
+    budget: float
+
+
+def budget_period_params(category_id: int, period: BudgetPeriodJson):
+    start_date = utils.parse_timestamp(period.start_date)
+    end_date = utils.parse_timestamp(period.end_date)
+    if end_date <= start_date:
+        raise HTTPException(
+            status_code=400, detail="end_date must be after start_date.")
+    return {"category_id": category_id, "start_date": start_date,
+            "end_date": end_date, "budget": period.budget}
+
+
+# SQLSTATE of exclusion constraint violations
+EXCLUSION_VIOLATION = "23P01"
+
+
+def check_period_overlap(e: sqlalchemy.exc.IntegrityError):
+    """Answers 409 when `e` is budget_period_no_overlap's violation."""
+    if getattr(e.orig, "pgcode", None) == EXCLUSION_VIOLATION:
+        raise HTTPException(
+            status_code=409, detail="budget period overlaps another one.")
+
+
+@router.post("/users/{user_id}/budget/{budget_category}/periods", tags=["budgets"])
+def add_budget_period(user_id: int, budget_category: str,
+                      period: BudgetPeriodJson,
+                      conn: sqlalchemy.Connection = Depends(db.get_connection)):
+    """
+    This endpoint adds a budget period to an existing category. It takes as input:
+
+    - `start_date`: when the period starts, included
+    - `end_date`: when the period ends, excluded
+    - `budget`: the dollar amount of the budget over the period
+
+    Expects format "YYYY-MM-DD HH:MM:SS" for timestamps.
+    The periods of a category cannot overlap: adding one that overlaps
+    another answers `409 Conflict`.
+    """
+    user = get_user(conn, user_id)
+    category = utils.check_category(conn.execute(
+        queries.CATEGORY_BY_NAME,
+        [{"user_id": user.user_id, "category_name": budget_category}]
+    ).fetchone())
+    params = budget_period_params(category.category_id, period)
+    try:
+        period_id = conn.execute(
+            queries.INSERT_BUDGET_PERIOD, params).scalar_one()
+    except sqlalchemy.exc.IntegrityError as e:
+        conn.rollback()
+        check_period_overlap(e)
+        raise
+    conn.commit()
+    return {
+        "period_id": period_id,
+        "category_id": category.category_id,
+        "start_date": period.start_date,
+        "end_date": period.end_date,
+        "budget": period.budget,
+    }
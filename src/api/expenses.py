@@ -1,18 +1,28 @@
+import csv
 import datetime
+import io
+import json
+import math
+import os
 
 import sqlalchemy
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError, conlist, root_validator
 
 from src import database as db
+from src import group_commit
+from src import queries
 from src import sql_utils as utils
 from src.sql_utils import get_category
 
 router = APIRouter()
 
-# TODO update these endpoints considering the sub table "items"
+
 @router.get("/user/{user_id}/expense/{expense_id}", tags=["expenses"])
-def get_expense(user_id: int, expense_id: int):
+def get_expense(user_id: int, expense_id: int, include_items: bool = False,
+                conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
     """
     This endpoint returns the information associated with an expense by its identifier.
     For each expense it returns:
@@ -22,82 +32,336 @@ def get_expense(user_id: int, expense_id: int):
     - `expense_id`: the ID of the item associated with the expense
     - `category`: the user defined category of the item
     - `description`: the user defined description of the item
+    - `items`: with `include_items`, the line items of the expense, each
+      with its `item_id`, `name` and `cost`
     """
-    user = utils.get_user(user_id)
-    expense_id, category_id, date_time, cost, description = utils.get_expense(
-        expense_id)
-    category = utils.get_category(user.user_id, category_id)
-    return {
+    user = utils.get_user(conn, user_id)
+    if not include_items:
+        expense = utils.get_expense(conn, expense_id)
+        category = utils.get_category(conn, user.user_id, expense.category_id)
+        return expense_detail(expense, category)
+    rows = conn.execute(
+        queries.EXPENSE_WITH_ITEMS, {"expense_id": expense_id}).fetchall()
+    expense = utils.check_expense(rows[0] if rows else None)
+    category = utils.get_category(conn, user.user_id, expense.category_id)
+    return expense_detail(expense[:5], category, expense_items(rows))
+
+
+def expense_detail(expense, category, items=None):
+    expense_id, _, date_time, cost, description = expense
+    detail = {
         "cost": cost,
         "date_time": date_time,
         "expense_id": expense_id,
         "category": category.category_name,
         "description": description,
     }
+    if items is not None:
+        detail["items"] = items
+    return detail
+
+
+def item_detail(row):
+    return {"item_id": row.item_id, "name": row.item_name,
+            "cost": row.item_cost}
+
+
+def expense_items(rows):
+    """The items of the rows of one expense joined with its items."""
+    return [item_detail(row) for row in rows if row.item_id is not None]
+
+
+def group_items(rows, groups=None):
+    """
+    Folds the rows of expenses joined with their items, ordered by
+    expense, into one (expense row, items) pair per expense, appended to
+    `groups` (the last one of which `rows` may continue).
+    """
+    groups = [] if groups is None else groups
+    for row in rows:
+        if not groups or groups[-1][0].expense_id != row.expense_id:
+            groups.append((row, []))
+        if row.item_id is not None:
+            groups[-1][1].append(item_detail(row))
+    return groups
+
+
+EXPENSE_BATCH_MAX = int(os.environ.get("EXPENSE_BATCH_MAX", 100))
+
+
+class ExpenseBatchJson(BaseModel):
+    expense_ids: conlist(int, min_items=1, max_items=EXPENSE_BATCH_MAX)
+
+
+@router.post("/user/{user_id}/expenses/batch", tags=["expenses"])
+def get_expenses_batch(user_id: int, batch: ExpenseBatchJson,
+                       conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
+    """
+    This endpoint returns many expenses by their identifiers in one request,
+    at most `EXPENSE_BATCH_MAX` (100 by default) at a time.
+    Takes in an ExpenseBatchJson which contains the `expense_ids` to fetch.
+
+    It returns:
+
+    - `expenses`: the expenses found, in the order they were asked for,
+      each with the same fields as the single expense endpoint
+    - `errors`: the IDs that do not exist or belong to another user, each
+      with an `expense_id` and a `detail` message
+    """
+    user = utils.get_user(conn, user_id)
+    rows = conn.execute(queries.EXPENSES_BY_ID, {
+        "user_id": user.user_id, "expense_ids": batch.expense_ids}).fetchall()
+    return expenses_batch(batch.expense_ids, rows)
+
+
+def expenses_batch(expense_ids, rows):
+    # another user's expenses are reported exactly like missing ones
+    found = {row.expense_id: row for row in rows}
+    expenses = []
+    errors = []
+    for expense_id in dict.fromkeys(expense_ids):
+        row = found.get(expense_id)
+        if row is None:
+            errors.append(
+                {"expense_id": expense_id, "detail": "expense not found."})
+            continue
+        expenses.append(expense_detail(row[:5], row))
+    return {"expenses": expenses, "errors": errors}
+
+
+LIST_EXPENSES_PAGE_MAX = 1000
+STREAM_BATCH_SIZE = 500
 
 
 @router.get("/user/{user_id}/expenses", tags=["expenses"])
 def list_expenses(user_id: int,
+                  request: Request,
+                  response: Response,
                   start_date: str = (
                           datetime.datetime.utcnow() - datetime.timedelta(days=7)
                   ).strftime("%Y-%m-%d %H:%M:%S"),
                   end_date: str = datetime.datetime
-                  .utcnow().strftime("%Y-%m-%d %H:%M:%S")):
+                  .utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+                  limit: int = Query(None, ge=1, le=LIST_EXPENSES_PAGE_MAX),
+                  cursor: str = None,
+                  stream: bool = False,
+                  include_items: bool = False,
+                  conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
     """
     This endpoint returns the information associated with expenses
-    over a defined time period.
+    over a defined time period, ordered by `date_time` then `expense_id`.
     By default, the difference between `start_date` and `end_date` is one week
     and `end_time` is today.
     Expects format "YYYY-MM-DD HH:MM:SS" for timestamp
 
+    - `limit`: the maximum number of expenses to return. When more expenses
+      remain, the `X-Next-Cursor` response header holds the cursor for the
+      next page
+    - `cursor`: the `X-Next-Cursor` value of the previous page
+    - `stream`: when true, the expenses are streamed as newline delimited
+      JSON instead of a single JSON list
+    - `include_items`: when true, each expense comes with its `items`,
+      read in the same query
+
     For each expense, it returns:
 
     - `cost`: the monetary value of the expense, in dollars
     - `date`: the date of the expense
     - `expense_id`: the ID of the item associated with the expense
     - `category`: the user-defined category of the item
+
+    The response carries an `ETag`; sending it back in `If-None-Match`
+    answers `304 Not Modified` while the user's data did not change.
     """
+    query, params = list_expenses_query(
+        user_id, start_date, end_date, limit, cursor, stream, include_items)
+    not_modified = utils.check_etag(
+        request, response, utils.get_data_version(conn, user_id))
+    if not_modified:
+        return not_modified
+    if stream:
+        return StreamingResponse(
+            _stream_expenses(conn, query, params, include_items),
+            media_type="application/x-ndjson",
+            headers=response.headers
+        )
 
-    with db.engine.connect() as conn:
-        expenses = conn.execute(sqlalchemy.text(
-            '''
-            SELECT expense_id, budget_category.category_id, 
-            date_time, cost, description, category_name
-            FROM expense
-            JOIN budget_category on budget_category.category_id = expense.category_id
-            JOIN "user" on "user".user_id = budget_category.user_id
-            WHERE "user".user_id = :user_id_input
-            AND date_time <= :end_date AND date_time >= :start_date;
-            ''',
-        ),
-            {
-                "user_id_input": user_id,
-                "end_date": end_date,
-                "start_date": start_date,
-            }
-        ).fetchall()
-        return [
-            {
-                "expense_id": expense.expense_id,
-                "cost": expense.cost,
-                "date_time": expense.date_time,
-                "description": expense.description,
-                "category": expense.category_name,
-            }
-            for expense in expenses
-        ]
+    if db.DB_RENDER_JSON and not include_items:
+        rendered = rendered_page(conn.execute(*list_expenses_query(
+            user_id, start_date, end_date, limit, cursor, stream, rendered=True
+        )).fetchone(), limit, response)
+        if rendered:
+            return rendered
+    expenses = conn.execute(query, params).fetchall()
+    return expenses_page(expenses, limit, response, include_items)
+
+
+def list_expenses_query(user_id: int, start_date: str, end_date: str,
+                        limit: int, cursor: str, stream: bool,
+                        include_items: bool = False, rendered: bool = False):
+    """
+    Picks the list_expenses statement and its parameters, with `rendered`
+    the one returning the JSON response body, and `include_items` the one
+    joining each expense of the page with its items.
+    """
+    params = {
+        "user_id_input": user_id,
+        "end_date": utils.parse_timestamp(end_date),
+        "start_date": utils.parse_timestamp(start_date),
+        # one extra row tells us whether there is a next page
+        "limit": limit + 1 if limit and not stream else limit,
+    }
+    if rendered:
+        params["page_size"] = limit
+    if not cursor:
+        if rendered:
+            return queries.LIST_EXPENSES_FIRST_PAGE_JSON, params
+        return (queries.LIST_EXPENSES_FIRST_PAGE_WITH_ITEMS if include_items
+                else queries.LIST_EXPENSES_FIRST_PAGE), params
+    params["after_date_time"], params["after_expense_id"] = \
+        utils.decode_cursor(cursor)
+    if rendered:
+        return queries.LIST_EXPENSES_NEXT_PAGE_JSON, params
+    return (queries.LIST_EXPENSES_NEXT_PAGE_WITH_ITEMS if include_items
+            else queries.LIST_EXPENSES_NEXT_PAGE), params
+
+
+def expenses_page(expenses, limit: int, response: Response,
+                  include_items: bool = False):
+    if include_items:
+        expenses = group_items(expenses)
+    else:
+        expenses = [(expense, None) for expense in expenses]
+    if limit and len(expenses) > limit:
+        expenses = expenses[:limit]
+        last, _ = expenses[-1]
+        response.headers["X-Next-Cursor"] = utils.encode_cursor(
+            last.date_time, last.expense_id)
+    return [expense_summary(expense, items) for expense, items in expenses]
+
+
+def rendered_page(page, limit: int, response: Response):
+    """
+    Answers list_expenses with the body rendered by LIST_EXPENSES_JSON, or
+    None when only Python can encode it.
+    """
+    if page.renderable is False:
+        return None
+    if limit and page.row_count > limit:
+        response.headers["X-Next-Cursor"] = utils.encode_cursor(
+            page.last_date_time, page.last_expense_id)
+    return Response(page.body, media_type="application/json",
+                    headers=response.headers)
+
+
+def expense_summary(expense, items=None):
+    summary = {
+        "expense_id": expense.expense_id,
+        "cost": expense.cost,
+        "date_time": expense.date_time,
+        "description": expense.description,
+        "category": expense.category_name,
+    }
+    if items is not None:
+        summary["items"] = items
+    return summary
+
+
+def ndjson_lines(expenses, grouped: bool = False):
+    if not grouped:
+        expenses = [(expense, None) for expense in expenses]
+    return "".join(
+        json.dumps(jsonable_encoder(expense_summary(expense, items))) + "\n"
+        for expense, items in expenses
+    )
+
+
+class ExpenseItemLines:
+    """
+    Renders the streamed rows of a list_expenses query with items. The
+    rows of an expense may span two batches, so the last expense of each
+    batch waits for the next one.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def feed(self, rows) -> str:
+        groups = group_items(rows, self.pending)
+        self.pending = groups[-1:]
+        return ndjson_lines(groups[:-1], grouped=True)
+
+    def finish(self) -> str:
+        return ndjson_lines(self.pending, grouped=True)
+
+
+def _stream_expenses(conn, query, params, include_items: bool = False):
+    # A server-side cursor hands rows over in batches of STREAM_BATCH_SIZE,
+    # so memory stays flat however wide the date range is. The request's
+    # connection stays checked out until the response has been sent.
+    result = conn.execution_options(
+        yield_per=STREAM_BATCH_SIZE).execute(query, params)
+    lines = ExpenseItemLines() if include_items else None
+    for batch in result.partitions():
+        yield lines.feed(batch) if lines else ndjson_lines(batch)
+    if lines:
+        yield lines.finish()
+
+
+class ItemJson(BaseModel):
+    name: str
+    cost: float
 
 
 # Expects format "YYYY-MM-DD HH:MM:SS" for timestamp
 class ExpenseJson(BaseModel):
-    cost: float
+    cost: float = None
     date_time: str
     category_id: int
     description: str
+    items: conlist(ItemJson, min_items=1) = None
+
+    @root_validator(skip_on_failure=True)
+    def check_cost(cls, values):
+        items = values.get("items")
+        cost = values.get("cost")
+        if items is None:
+            if cost is None:
+                raise ValueError("cost is required for an expense without items.")
+        elif cost is not None and not math.isclose(
+                cost, sum(item.cost for item in items)):
+            raise ValueError("cost must be the sum of the costs of the items.")
+        return values
+
+
+def expense_with_items_params(expense_json: ExpenseJson, date_time):
+    return {
+        "category_id": expense_json.category_id,
+        "date_time": date_time,
+        "description": expense_json.description,
+        "item_names": [item.name for item in expense_json.items],
+        "item_costs": [item.cost for item in expense_json.items],
+    }
+
+
+def added_expense(expense_json: ExpenseJson, expense_id: int, rows=None):
+    """The add_expense response, with `rows` those of INSERT_EXPENSE_WITH_ITEMS."""
+    added = {
+        "expense_id": expense_id,
+        "category_id": expense_json.category_id,
+        "date_time": expense_json.date_time,
+        "cost": expense_json.cost,
+        "description": expense_json.description,
+    }
+    if rows is not None:
+        added["cost"] = rows[0].cost
+        added["items"] = [item_detail(row) for row in rows]
+    return added
 
 
 @router.post("/user/{user_id}/expense/", tags=["expenses"])
-def add_expense(user_id: int, expense_json: ExpenseJson):
+def add_expense(user_id: int, expense_json: ExpenseJson,
+                conn: sqlalchemy.Connection = Depends(db.get_connection)):
     """
     This endpoint adds a new expense to the database.
     This expense includes:
@@ -108,33 +372,138 @@ def add_expense(user_id: int, expense_json: ExpenseJson):
             Expects format "YYYY-MM-DD HH:MM:SS"
     - `category_id`: the budget category of the item (required)
     - `description`: the user defined description of the item (not required)
+    - `items`: the line items of the expense, each with a `name` and a
+      `cost` (not required). They are added with the expense, whose cost
+      is then the sum of theirs
+
+    With `EXPENSE_GROUP_COMMIT`, concurrent requests without items are
+    inserted and committed together.
     """
 
     # check user has category specified
-    get_category(user_id, expense_json.category_id)
-
-    with db.engine.connect() as conn:
-        inserted_expense = conn.execute(
-            sqlalchemy.text(
-                '''
-                INSERT INTO expense (category_id, date_time, cost, description)
-                VALUES (:category_id, :date_time, :cost, :description)
-                RETURNING expense_id;
-            '''
-            ),
-            {
-                "category_id": expense_json.category_id,
-                "date_time": expense_json.date_time,
-                "cost": expense_json.cost,
-                "description": expense_json.description
-            }
-        )
-        expense = inserted_expense.fetchone()
+    get_category(conn, user_id, expense_json.category_id)
+
+    if expense_json.items:
+        rows = conn.execute(
+            queries.INSERT_EXPENSE_WITH_ITEMS,
+            expense_with_items_params(expense_json, expense_json.date_time)
+        ).fetchall()
         conn.commit()
-    return {
-        "expense_id": expense.expense_id,
+        return added_expense(expense_json, rows[0].expense_id, rows)
+
+    row = {
         "category_id": expense_json.category_id,
         "date_time": expense_json.date_time,
         "cost": expense_json.cost,
-        "description": expense_json.description,
+        "description": expense_json.description
     }
+    if group_commit.EXPENSE_GROUP_COMMIT:
+        # the lookup's transaction is not kept open while waiting
+        conn.rollback()
+        expense_id = group_commit.writer().submit(row).result()
+    else:
+        expense_id = conn.execute(
+            queries.INSERT_EXPENSE, row).fetchone().expense_id
+        conn.commit()
+    return added_expense(expense_json, expense_id)
+
+
+BULK_COLUMNS = ["category_id", "date_time", "cost", "description"]
+expense_table = sqlalchemy.table(
+    "expense", *[sqlalchemy.column(column) for column in BULK_COLUMNS])
+
+
+async def read_upload(request: Request):
+    return request.headers.get("content-type", ""), await request.body()
+
+
+@router.post("/user/{user_id}/expenses/bulk", tags=["expenses"])
+def add_expenses_bulk(user_id: int, upload=Depends(read_upload),
+                      conn: sqlalchemy.Connection = Depends(db.get_connection)):
+    """
+    This endpoint adds many expenses to the database at once.
+    The body is either a JSON list of expenses, or a CSV file sent with
+    content type `text/csv` whose header names the columns below:
+
+    - `cost`: the monetary value of the expense, in Dollars (required)
+    - `date_time`: the date and time of the expense. (required)
+            Expects format "YYYY-MM-DD HH:MM:SS"
+    - `category_id`: the budget category of the item (required)
+    - `description`: the user defined description of the item (not required)
+
+    Valid expenses are all added in one transaction. It returns:
+
+    - `inserted`: the number of expenses added
+    - `errors`: the rows that were rejected, each with its 0-based `row`
+      index and a `detail` message
+    """
+    content_type, body = upload
+    try:
+        if content_type.startswith("text/csv"):
+            records = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+        else:
+            records = json.loads(body)
+    except (ValueError, csv.Error):
+        raise HTTPException(status_code=400, detail="invalid request body.")
+    if not isinstance(records, list):
+        raise HTTPException(
+            status_code=400, detail="expected a list of expenses.")
+
+    rows = []
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, dict) and not record.get("description"):
+                record = dict(record, description="")
+            expense = ExpenseJson.parse_obj(record)
+            utils.to_timestamp(expense.date_time)
+        except (ValidationError, ValueError) as e:
+            errors.append({"row": index, "detail": str(e)})
+            continue
+        if expense.items is not None:
+            errors.append({"row": index, "detail": "items cannot be bulk added."})
+            continue
+        rows.append((index, expense))
+
+    utils.get_user(conn, user_id)
+    owned_categories = set(conn.execute(
+        queries.OWNED_CATEGORIES,
+        {"user_id": user_id,
+         "category_ids": list({expense.category_id for _, expense in rows})}
+    ).scalars())
+    expenses = []
+    for index, expense in rows:
+        if expense.category_id not in owned_categories:
+            errors.append(
+                {"row": index, "detail": "budget category not found."})
+            continue
+        expenses.append(expense.dict(include=set(BULK_COLUMNS)))
+
+    if expenses:
+        _copy_expenses(conn, expenses)
+        conn.commit()
+
+    return {
+        "inserted": len(expenses),
+        "errors": sorted(errors, key=lambda error: error["row"]),
+    }
+
+
+def _copy_expenses(conn, expenses):
+    # COPY is the fastest way into Postgres; drivers without COPY support
+    # fall back to batched multi-row INSERTs.
+    with conn.connection.cursor() as cursor:
+        if not hasattr(cursor, "copy_expert"):
+            conn.execute(sqlalchemy.insert(expense_table), expenses)
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for expense in expenses:
+            writer.writerow([expense[column] for column in BULK_COLUMNS])
+        buffer.seek(0)
+        # csv writes "" unquoted, which COPY would load as NULL
+        cursor.copy_expert(
+            f"COPY expense ({', '.join(BULK_COLUMNS)}) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NOT_NULL (description))",
+            buffer
+        )
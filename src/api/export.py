@@ -0,0 +1,141 @@
+import enum
+import os
+import queue
+import threading
+import zlib
+
+import sqlalchemy
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from src import database as db
+from src import queries
+from src import sql_utils as utils
+
+router = APIRouter()
+
+# Bytes of COPY output handed over at a time, and how many of those may
+# wait for the client: the most an export holds in memory
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 64 * 1024))
+EXPORT_QUEUE_CHUNKS = int(os.environ.get("EXPORT_QUEUE_CHUNKS", 8))
+# zlib level of gzip exports, the lowest favours throughput
+EXPORT_GZIP_LEVEL = int(os.environ.get("EXPORT_GZIP_LEVEL", 1))
+
+
+class ExportFormat(str, enum.Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+EXPORTS = {
+    ExportFormat.csv: (queries.EXPORT_EXPENSES_CSV, "text/csv"),
+    ExportFormat.ndjson: (queries.EXPORT_EXPENSES_NDJSON, "application/x-ndjson"),
+}
+
+
+@router.get("/user/{user_id}/export", tags=["expenses"])
+def export_expenses(user_id: int,
+                    format: ExportFormat = ExportFormat.csv,
+                    gzip: bool = False,
+                    conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
+    """
+    This endpoint streams all of a user's expenses, oldest first, in one
+    response, whatever the size of their history.
+
+    - `format`: `csv` (the default, with a header row) or `ndjson`, one
+      JSON object per line
+    - `gzip`: when true, the body is gzip compressed on the fly and sent
+      with `Content-Encoding: gzip`
+
+    For each expense, it returns the `expense_id`, `date_time`, `category`
+    name, `cost` and `description`.
+    """
+    user = utils.get_user(conn, user_id)
+    copy_sql, media_type = EXPORTS[format]
+    # timestamps come out in UTC, as the other endpoints return them
+    conn.execute(queries.SET_UTC_TIME_ZONE)
+    chunks = CopyStream(conn, copy_sql, {"user_id": user.user_id}).chunks()
+    headers = {"Content-Disposition":
+               f'attachment; filename="expenses-{user.user_id}.{format.value}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+        chunks = gzip_chunks(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(
+        EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+_DONE = object()
+
+
+class CopyStream:
+    """
+    The output of a COPY ... TO STDOUT, yielded by `chunks` in chunks of
+    about EXPORT_CHUNK_SIZE bytes. Postgres sends the rows as fast as it reads
+    them, so a thread runs the COPY into a queue of at most
+    EXPORT_QUEUE_CHUNKS chunks, blocking while the client is behind.
+    Closing the generator early, as when the client goes away, cancels the
+    COPY.
+    """
+
+    def __init__(self, conn: sqlalchemy.Connection, copy_sql: str,
+                 params: dict):
+        self.conn = conn
+        self.copy_sql = copy_sql
+        self.params = params
+        self._queue = queue.Queue(EXPORT_QUEUE_CHUNKS)
+        self._buffer = bytearray()
+        self._cancelled = False
+
+    def chunks(self):
+        dbapi_connection = self.conn.connection.dbapi_connection
+        thread = threading.Thread(
+            target=self._copy, name="expense-export", daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is _DONE:
+                    return
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                yield chunk
+        finally:
+            if thread.is_alive():
+                self._cancelled = True
+                dbapi_connection.cancel()
+                # unblocks the COPY thread waiting for room in the queue
+                while thread.is_alive():
+                    try:
+                        self._queue.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+    def write(self, data: bytes):
+        # called by copy_expert for every row
+        if self._cancelled:
+            return
+        self._buffer += data
+        if len(self._buffer) >= EXPORT_CHUNK_SIZE:
+            self._queue.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _copy(self):
+        try:
+            with self.conn.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    cursor.mogrify(self.copy_sql, self.params), self)
+            if self._buffer:
+                self._queue.put(bytes(self._buffer))
+            self._queue.put(_DONE)
+        except Exception as e:
+            if not self._cancelled:
+                self._queue.put(e)
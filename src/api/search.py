@@ -0,0 +1,130 @@
+import base64
+import datetime
+import enum
+import json
+import os
+import re
+
+import sqlalchemy
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from src import database as db
+from src import queries
+from src import sql_utils as utils
+
+router = APIRouter()
+
+SEARCH_PAGE_MAX = 100
+# How much of a word of an expense a fuzzy query must match, from 0 to 1
+SEARCH_FUZZY_THRESHOLD = float(os.environ.get("SEARCH_FUZZY_THRESHOLD", 0.4))
+SEARCH_WORD = re.compile(r"\w+")
+
+
+class SearchMode(str, enum.Enum):
+    text = "text"
+    prefix = "prefix"
+    fuzzy = "fuzzy"
+
+
+@router.get("/user/{user_id}/expenses/search", tags=["expenses"])
+def search_expenses(user_id: int,
+                    response: Response,
+                    q: str = Query(..., min_length=1),
+                    mode: SearchMode = SearchMode.text,
+                    start_date: str = None,
+                    end_date: str = None,
+                    category_id: int = None,
+                    limit: int = Query(20, ge=1, le=SEARCH_PAGE_MAX),
+                    cursor: str = None,
+                    conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
+    """
+    This endpoint searches a user's expenses by their description and the
+    names of their items, best matches first, then newest.
+    Expects format "YYYY-MM-DD HH:MM:SS" for timestamp
+
+    - `q`: what to search for
+    - `mode`: `text` (the default) for full text search, with quoted
+      phrases, `or` and `-` to exclude words; `prefix` for words starting
+      with those of `q`, as typed; `fuzzy` to tolerate typos
+    - `start_date`, `end_date`: only search expenses within these dates
+    - `category_id`: only search this budget category
+    - `limit`: the maximum number of expenses to return (20 by default).
+      When more expenses remain, the `X-Next-Cursor` response header holds
+      the cursor for the next page
+    - `cursor`: the `X-Next-Cursor` value of the previous page
+
+    For each expense, it returns:
+
+    - `expense_id`: the ID of the expense
+    - `cost`: the monetary value of the expense, in dollars
+    - `date_time`: the date and time of the expense
+    - `description`: the user defined description of the expense
+    - `category`: the user-defined category of the expense
+    - `rank`: how well the expense matches, higher is better
+    """
+    user = utils.get_user(conn, user_id)
+    if category_id is not None:
+        utils.get_category(conn, user.user_id, category_id)
+    params = {
+        "user_id": user.user_id,
+        "category_id": category_id,
+        "query": search_query(q, mode),
+        "start_date": utils.parse_timestamp(start_date) if start_date
+        else datetime.datetime.min,
+        "end_date": utils.parse_timestamp(end_date) if end_date
+        else datetime.datetime.max,
+        # one extra row tells us whether there is a next page
+        "limit": limit + 1,
+        "after_rank": None,
+        "after_date_time": None,
+        "after_expense_id": None,
+    }
+    if cursor:
+        (params["after_rank"], params["after_date_time"],
+         params["after_expense_id"]) = decode_search_cursor(cursor)
+    if mode is SearchMode.fuzzy:
+        conn.execute(queries.SET_FUZZY_THRESHOLD,
+                     {"threshold": str(SEARCH_FUZZY_THRESHOLD)})
+    rows = conn.execute(
+        queries.SEARCH_EXPENSES_BY_MODE[mode.value], params).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_search_cursor(rows[-1])
+    return [
+        {
+            "expense_id": row.expense_id,
+            "cost": row.cost,
+            "date_time": row.date_time,
+            "description": row.description,
+            "category": row.category_name,
+            "rank": row.rank,
+        }
+        for row in rows
+    ]
+
+
+def search_query(q: str, mode: SearchMode) -> str:
+    """The :query of `mode` for what the user typed."""
+    if mode is not SearchMode.prefix:
+        return q
+    # only words, so the tsquery syntax cannot be injected
+    words = SEARCH_WORD.findall(q)
+    if not words:
+        raise HTTPException(status_code=400, detail="invalid search query.")
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def encode_search_cursor(row) -> str:
+    """Opaque cursor pointing just past `row` in the search order."""
+    payload = json.dumps([row.rank, row.date_time.isoformat(), row.expense_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_search_cursor(cursor: str):
+    try:
+        rank, date_time, expense_id = json.loads(
+            base64.urlsafe_b64decode(cursor))
+        return (float(rank), datetime.datetime.fromisoformat(date_time),
+                int(expense_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor.")
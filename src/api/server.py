@@ -1,5 +1,15 @@
-from fastapi import FastAPI
-from src.api import budget, users, expenses
+from fastapi import FastAPI, Response
+from src import admission
+from src import cache
+from src import database as db
+from src import group_commit
+from src import metrics
+from src import partitions
+from src import passwords
+from src.api import analytics, budget, export, users, expenses, search
+from src.api.aio import budget as aio_budget
+from src.api.aio import expenses as aio_expenses
+from src.api.aio import users as aio_users
 
 
 description = ""
@@ -17,9 +27,122 @@ app = FastAPI(
     },
     openapi_tags=tags_metadata,
 )
+# set once startup warmed the pools up, cleared when shutting down
+app.state.ready = False
+if db.DB_ASYNC:
+    # Registered first so these take precedence over the sync endpoints
+    # with the same path; endpoints without an async version stay sync.
+    # The sync twins already document these paths in the OpenAPI schema.
+    app.include_router(aio_users.router, include_in_schema=False)
+    app.include_router(aio_budget.router, include_in_schema=False)
+    app.include_router(aio_expenses.router, include_in_schema=False)
 app.include_router(users.router)
 app.include_router(budget.router)
 app.include_router(expenses.router)
+app.include_router(search.router)
+app.include_router(export.router)
+app.include_router(analytics.router)
+# added first, so the metrics middleware wrapping it sees rejections too
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.register(metrics.Gauge(
+    "lookup_cache_hits_total", "Lookup cache hits.",
+    lambda: cache.lookups.hits, "counter"))
+metrics.register(metrics.Gauge(
+    "lookup_cache_misses_total", "Lookup cache misses.",
+    lambda: cache.lookups.misses, "counter"))
+metrics.register(metrics.Gauge(
+    "db_pool_checked_out", "Pooled connections currently in use.",
+    lambda: db.engine.pool.checkedout()))
+metrics.register(metrics.Gauge(
+    "db_replicas_usable", "Read replicas within DB_REPLICA_MAX_LAG.",
+    lambda: len(db.usable_replicas)))
+metrics.register(metrics.Gauge(
+    "admission_queue_depth", "Requests waiting for admission.",
+    lambda: admission.limiter.queue_depth))
+metrics.register(metrics.Gauge(
+    "admission_units_in_use", "Units of work of the requests running.",
+    lambda: admission.limiter.in_use))
+metrics.register(metrics.Gauge(
+    "admission_rejected_total", "Requests turned away with a 503.",
+    lambda: admission.limiter.rejected, "counter"))
+
+
+@app.on_event("startup")
+def create_engines():
+    db.create_engines()
+
+
+@app.on_event("startup")
+def start_cache_listener():
+    cache.start_listener(db.engine)
+
+
+@app.on_event("startup")
+def start_replica_monitor():
+    db.start_replica_monitor()
+
+
+@app.on_event("startup")
+def create_expense_partitions():
+    if partitions.EXPENSE_PARTITIONS_AHEAD > 0:
+        partitions.ensure_partitions(db.engine, partitions.EXPENSE_PARTITIONS_AHEAD)
+    partitions.start_maintenance()
+
+
+@app.on_event("startup")
+async def warm_up_pools():
+    # registered last, so the API is ready once every other hook is done
+    db.warm_up()
+    if db.DB_ASYNC:
+        await db.warm_up_async()
+    app.state.ready = True
+
+
+@app.on_event("shutdown")
+def stop_accepting_traffic():
+    app.state.ready = False
+
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    passwords.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_expense_writer():
+    group_commit.stop()
+
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    await db.dispose_engines()
+
+
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """Liveness, with the connections of each database pool."""
+    return {"status": "ok", "pools": db.pool_stats()}
+
+
+@app.get("/readyz", include_in_schema=False)
+def readyz(response: Response):
+    """
+    Readiness: 503 until startup has warmed the pools up, and again from
+    the start of shutdown, so load balancers only send traffic in between.
+    """
+    if not app.state.ready:
+        response.status_code = 503
+    return {"status": "ready" if app.state.ready else "not ready",
+            "pools": db.pool_stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Request and database metrics in the Prometheus text format."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.get("/")
 async def root():
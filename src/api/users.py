@@ -1,15 +1,18 @@
 import sqlalchemy
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 
+from src import cache
 from src import database as db
+from src import passwords
+from src import queries
+from src import sql_utils as utils
 
 router = APIRouter()
 
 
-# TODO add some password business
 @router.get("/users/", tags=["users"])
-def list_users():
+def list_users(conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
     """
     This endpoint returns the information associated with all users.
     For each user it returns:
@@ -17,21 +20,16 @@ def list_users():
     - `user_id`: the ID of the user
     - `name`: the name of the user
     """
-    with db.engine.connect() as conn:
-        users = conn.execute(
-            sqlalchemy.text('SELECT * FROM "user"')
-        ).fetchall()
-    return [
-        {
-            "user_id": user.user_id,
-            "name": user.name,
-        }
-        for user in users
-    ]
+    if db.DB_RENDER_JSON:
+        return Response(conn.execute(queries.LIST_USERS_JSON).scalar_one(),
+                        media_type="application/json")
+    users = conn.execute(queries.LIST_USERS).fetchall()
+    return [user_summary(user) for user in users]
 
 
 @router.get("/users/{user_id}/", tags=["users"])
-def get_user(user_id: int):
+def get_user(user_id: int,
+             conn: sqlalchemy.Connection = Depends(db.get_read_connection)):
     """
     This endpoint returns the information associated with a user by its identifier.
     For each user it returns:
@@ -39,13 +37,10 @@ def get_user(user_id: int):
     - `user_id`: the ID of the user
     - `name`: the name of the user
     """
-    with db.engine.connect() as conn:
-        user = conn.execute(
-            sqlalchemy.text('SELECT * FROM "user" WHERE user_id = :user_id'),
-            [{"user_id": user_id}]
-        ).fetchone()
-        if user is None:
-            raise HTTPException(status_code=404, detail="user not found.")
+    return user_summary(utils.get_user(conn, user_id))
+
+
+def user_summary(user):
     return {
         "user_id": user.user_id,
         "name": user.name,
@@ -57,27 +52,71 @@ class UserJson(BaseModel):
     password: str
 
 
+class LoginJson(BaseModel):
+    user_id: int
+    password: str
+
+
+def hashed_password(user: UserJson) -> str:
+    # a dependency declared before the connection, so the pooled
+    # connection is not held while bcrypt runs
+    return passwords.hash_password(user.password)
+
+
 @router.post("/users/", tags=["users"])
-def create_user(user: UserJson):
+def create_user(user: UserJson,
+                hashed_pwd: str = Depends(hashed_password),
+                conn: sqlalchemy.Connection = Depends(db.get_connection)):
     """
     This endpoint creates a new user.
 
-    Takes in a UserJson which contains the user's name.
+    Takes in a UserJson which contains the user's name and password.
 
     Returns the user's ID and name if successful.
     """
 
-    with db.engine.connect() as conn:
-        inserted_user = conn.execute(
-            sqlalchemy.text(
-                'INSERT INTO "user" (name) VALUES (:name, crypt(\':password\', gen_salt(\'bf\'))) RETURNING user_id'
-            ),
-            [{"name": user.name,
-             "password": user.password}]
-        )
-        user_id = inserted_user.fetchone().user_id
-        conn.commit()
+    inserted_user = conn.execute(
+        queries.INSERT_USER,
+        [{"name": user.name,
+         "hashed_pwd": hashed_pwd}]
+    )
+    user_id = inserted_user.fetchone().user_id
+    cache.publish(conn, cache.user_key(user_id))
+    conn.commit()
+    cache.lookups.invalidate(cache.user_key(user_id))
+    db.remember_new_user(user_id)
     return {
         "user_id": user_id,
         "user_name": user.name,
     }
+
+
+@router.post("/users/login", tags=["users"])
+def login(credentials: LoginJson, request: Request):
+    """
+    This endpoint checks a user's password.
+
+    Takes in a LoginJson which contains the user's ID and password.
+
+    Returns the user's ID and name if the password matches, 401 otherwise.
+    A password hashed with another work factor than BCRYPT_ROUNDS is
+    rehashed with the current one.
+    """
+    # pooled connections are only held around the statements, not while
+    # bcrypt runs
+    with db.connect(request) as conn:
+        user = conn.execute(
+            queries.USER_PASSWORD, [{"user_id": credentials.user_id}]).fetchone()
+    hashed_pwd = user.hashed_pwd if user is not None else None
+    if not passwords.verify_password(credentials.password, hashed_pwd):
+        raise HTTPException(status_code=401, detail="invalid credentials.")
+
+    if passwords.needs_rehash(hashed_pwd):
+        rehashed_pwd = passwords.hash_password(credentials.password)
+        with db.connect(request) as conn:
+            conn.execute(queries.UPDATE_PASSWORD,
+                         [{"user_id": user.user_id,
+                           "hashed_pwd": rehashed_pwd,
+                           "old_hashed_pwd": hashed_pwd}])
+            conn.commit()
+    return user_summary(user)
@@ -0,0 +1,157 @@
+"""
+In-process cache for the user and category rows that sql_utils looks up
+on almost every request.
+
+Writers invalidate the keys they change once their transaction committed.
+With LOOKUP_CACHE_CHANNEL set they also NOTIFY that channel inside the
+transaction, and every worker LISTENing on it drops the same keys, so
+other processes never serve a stale row for longer than it takes the
+notification to arrive (and never longer than LOOKUP_CACHE_TTL).
+"""
+import collections
+import logging
+import os
+import select
+import threading
+import time
+
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CACHE_TTL = float(os.environ.get("LOOKUP_CACHE_TTL", 30))
+LOOKUP_CACHE_SIZE = int(os.environ.get("LOOKUP_CACHE_SIZE", 10000))
+LOOKUP_CACHE_CHANNEL = os.environ.get("LOOKUP_CACHE_CHANNEL")
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread safe LRU cache whose entries also expire after `ttl` seconds.
+    A `ttl` or `maxsize` of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries)}
+
+
+lookups = TTLCache(LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL)
+
+
+def user_key(user_id: int):
+    return ("user", user_id)
+
+
+def category_key(user_id: int, category_id: int):
+    return ("category", user_id, category_id)
+
+
+def encode_key(key) -> str:
+    return ":".join(str(part) for part in key)
+
+
+def decode_key(payload: str):
+    kind, *ids = payload.split(":")
+    return (kind, *(int(part) for part in ids))
+
+
+NOTIFY = sqlalchemy.text("SELECT pg_notify(:channel, :payload)")
+
+
+def publish(conn: sqlalchemy.Connection, *keys):
+    """
+    Tells the other workers to drop `keys` once `conn` commits. Does nothing
+    unless LOOKUP_CACHE_CHANNEL is configured.
+    """
+    if LOOKUP_CACHE_CHANNEL:
+        for key in keys:
+            conn.execute(NOTIFY, {"channel": LOOKUP_CACHE_CHANNEL,
+                                  "payload": encode_key(key)})
+
+
+async def publish_async(conn, *keys):
+    if LOOKUP_CACHE_CHANNEL:
+        for key in keys:
+            await conn.execute(NOTIFY, {"channel": LOOKUP_CACHE_CHANNEL,
+                                        "payload": encode_key(key)})
+
+
+def start_listener(engine: sqlalchemy.Engine):
+    """Starts the thread applying invalidations published by other workers."""
+    if not LOOKUP_CACHE_CHANNEL:
+        return None
+    thread = threading.Thread(
+        target=_listen, args=(engine,), name="lookup-cache-listener",
+        daemon=True)
+    thread.start()
+    return thread
+
+
+def _listen(engine: sqlalchemy.Engine):
+    while True:
+        try:
+            # a dedicated connection, detached so it does not hold a pool slot
+            pooled = engine.raw_connection()
+            connection = pooled.driver_connection
+            pooled.detach()
+            connection.rollback()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{LOOKUP_CACHE_CHANNEL}"')
+            # notifications may have been missed while disconnected
+            lookups.clear()
+            _drain(connection)
+        except Exception:
+            logger.exception("lookup cache listener failed, reconnecting")
+            time.sleep(5)
+
+
+def _drain(connection):
+    while True:
+        if select.select([connection], [], [], 60) == ([], [], []):
+            continue
+        connection.poll()
+        while connection.notifies:
+            notification = connection.notifies.pop(0)
+            lookups.invalidate(decode_key(notification.payload))
@@ -1,6 +1,17 @@
+import contextlib
+import itertools
+import logging
 import sqlalchemy
 import os
+import threading
+import time
 import dotenv
+from fastapi import Request
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src import cache
+from src import metrics
+from src import queries
 
 # DO NOT CHANGE THIS TO BE HARDCODED. ONLY PULL FROM ENVIRONMENT VARIABLES.
 dotenv.load_dotenv()
@@ -9,7 +20,346 @@ DB_PASSWD = os.environ.get("POSTGRES_PASSWORD")
 DB_SERVER: str = os.environ.get("POSTGRES_SERVER")
 DB_PORT: str = os.environ.get("POSTGRES_PORT")
 DB_NAME: str = os.environ.get("POSTGRES_DB")
+# Read replicas, as comma separated host[:port], sharing the primary's
+# user, password and database
+DB_REPLICAS = [replica.strip() for replica in os.environ.get("POSTGRES_REPLICAS", "").split(",") if replica.strip()]
+
+# Connection pool settings, defaults match SQLAlchemy's own
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Connections each pool opens at startup, before the API reports ready
+DB_POOL_WARMUP = int(os.environ.get("DB_POOL_WARMUP", DB_POOL_SIZE))
+# Serve the users, budget and expenses endpoints from asyncio (asyncpg)
+DB_ASYNC = os.environ.get("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+# Let Postgres render the JSON of the list_users, get_budget and
+# list_expenses responses
+DB_RENDER_JSON = os.environ.get("DB_RENDER_JSON", "false").lower() in ("1", "true", "yes")
+# Have each pooled (psycopg2) connection prepare the hot statements once
+DB_PREPARED_STATEMENTS = os.environ.get("DB_PREPARED_STATEMENTS", "false").lower() in ("1", "true", "yes")
+
+# Replicas further behind the primary than this many seconds are skipped
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 1))
+# Seconds a user's reads stay on the primary after they wrote, 0 disables it
+DB_READ_YOUR_WRITES = float(os.environ.get("DB_READ_YOUR_WRITES", 0))
+
+logger = logging.getLogger(__name__)
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+
+def database_url(driver: str, server: str, port: str) -> str:
+    return f"postgresql{driver}://{DB_USER}:{DB_PASSWD}@{server}:{port}/{DB_NAME}"
+
+
+def replica_address(replica: str):
+    server, _, port = replica.partition(":")
+    return server, port or DB_PORT
+
+
+# The engines are created on first use (or by the API's startup), not on
+# import, so scripts and tests importing this module do not pay for them:
+# engine, the primary's; async_engine, its asyncpg twin, only with DB_ASYNC
+# so asyncpg does not need to be installed otherwise; reader_engines and
+# async_reader_engines, the replicas', in the order of POSTGRES_REPLICAS.
+ENGINES = ("engine", "async_engine", "reader_engines", "async_reader_engines")
+_engines_lock = threading.Lock()
+_engines_created = False
+
+
+def create_engines():
+    """Creates the engines, once; later calls return right away."""
+    global engine, async_engine, reader_engines, async_reader_engines
+    global _engines_created
+    if _engines_created:
+        return
+    with _engines_lock:
+        if _engines_created:
+            return
+        engine = sqlalchemy.create_engine(
+            database_url("", DB_SERVER, DB_PORT), **POOL_OPTIONS)
+        async_engine = create_async_engine(
+            database_url("+asyncpg", DB_SERVER, DB_PORT), **POOL_OPTIONS
+        ) if DB_ASYNC else None
+        reader_engines = [
+            sqlalchemy.create_engine(
+                database_url("", *replica_address(replica)), **POOL_OPTIONS)
+            for replica in DB_REPLICAS
+        ]
+        async_reader_engines = [
+            create_async_engine(
+                database_url("+asyncpg", *replica_address(replica)),
+                **POOL_OPTIONS)
+            for replica in DB_REPLICAS
+        ] if DB_ASYNC else []
+
+        if DB_PREPARED_STATEMENTS:
+            for sync_engine in [engine, *reader_engines]:
+                queries.prepare_statements(sync_engine)
+        for sync_engine in [engine, *reader_engines]:
+            metrics.instrument_engine(sync_engine)
+        for any_engine in [async_engine, *async_reader_engines]:
+            if any_engine is not None:
+                metrics.instrument_engine(any_engine.sync_engine)
+        _engines_created = True
+
+
+def __getattr__(name: str):
+    if name in ENGINES:
+        create_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pooled_engines():
+    """
+    The engines created so far under the names their pool stats are
+    reported with, sync engines for the asyncpg ones.
+    """
+    if not _engines_created:
+        return {}
+    pooled = {"primary": engine}
+    if async_engine is not None:
+        pooled["primary_async"] = async_engine.sync_engine
+    for replica, reader_engine in zip(DB_REPLICAS, reader_engines):
+        pooled[f"replica {replica}"] = reader_engine
+    for replica, reader_engine in zip(DB_REPLICAS, async_reader_engines):
+        pooled[f"replica {replica} async"] = reader_engine.sync_engine
+    return pooled
+
+
+def pool_stats():
+    """The connections of every pool created so far, by engine."""
+    return {
+        name: {
+            "size": pooled.pool.size(),
+            "checked_in": pooled.pool.checkedin(),
+            "checked_out": pooled.pool.checkedout(),
+            "overflow": pooled.pool.overflow(),
+        }
+        for name, pooled in pooled_engines().items()
+    }
+
+
+def warm_up(connections: int = DB_POOL_WARMUP):
+    """
+    Opens `connections` connections of the primary's and each replica's
+    pool at once, then returns them to the pools, so the first requests
+    do not wait for connection setup (nor, with DB_PREPARED_STATEMENTS,
+    for the PREPAREs). An unreachable replica is only logged.
+    """
+    create_engines()
+    for index, sync_engine in enumerate([engine, *reader_engines]):
+        try:
+            _warm_up_pool(sync_engine, connections)
+        except sqlalchemy.exc.SQLAlchemyError:
+            if index == 0:
+                raise
+            logger.warning("replica %s is unreachable", DB_REPLICAS[index - 1])
+
+
+def _warm_up_pool(sync_engine: sqlalchemy.Engine, connections: int):
+    opened = []
+    try:
+        # the pool would close any connection past its size on return
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            opened.append(sync_engine.connect())
+    finally:
+        for conn in opened:
+            conn.close()
+
+
+async def warm_up_async(connections: int = DB_POOL_WARMUP):
+    """warm_up for the asyncpg engines."""
+    create_engines()
+    for index, reader_engine in enumerate([async_engine, *async_reader_engines]):
+        try:
+            await _warm_up_pool_async(reader_engine, connections)
+        except (sqlalchemy.exc.SQLAlchemyError, OSError):
+            if index == 0:
+                raise
+            logger.warning("replica %s is unreachable", DB_REPLICAS[index - 1])
+
+
+async def _warm_up_pool_async(pooled_engine, connections: int):
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            opened.append(await pooled_engine.connect())
+    finally:
+        for conn in opened:
+            await conn.close()
+
+
+async def dispose_engines():
+    """Closes the pooled connections of every engine created so far."""
+    if not _engines_created:
+        return
+    for any_engine in [async_engine, *async_reader_engines]:
+        if any_engine is not None:
+            await any_engine.dispose()
+    for sync_engine in [engine, *reader_engines]:
+        sync_engine.dispose()
+
+# Seconds since the last transaction the replica applied, 0 when it has
+# applied everything it received (an idle primary sends nothing new), NULL when
+# its WAL receiver is not streaming, since then it receives nothing and would
+# look caught up forever. status is hidden from roles without
+# pg_read_all_stats, for them a running receiver has to do
+REPLICA_LAG = sqlalchemy.text('''
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (
+        SELECT FROM pg_stat_wal_receiver
+        WHERE COALESCE(status, 'streaming') = 'streaming'
+    ) THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END AS lag
+''')
+
+# Replication lag of each replica, None while unknown or unreachable
+replica_lags = [None] * len(DB_REPLICAS)
+# Indices of the replicas reads are sent to, none until they are checked
+usable_replicas = []
+_next_replica = itertools.count()
+
+# Users who wrote recently, their reads go to the primary
+recent_writers = cache.TTLCache(100000, DB_READ_YOUR_WRITES)
+
+
+def check_replicas():
+    """Measures every replica's lag and picks the ones reads may use."""
+    global usable_replicas
+    create_engines()
+    for index, reader_engine in enumerate(reader_engines):
+        try:
+            with reader_engine.connect() as conn:
+                lag = conn.execute(REPLICA_LAG).scalar_one()
+        except sqlalchemy.exc.SQLAlchemyError:
+            logger.warning("replica %s is unreachable", DB_REPLICAS[index])
+            lag = None
+        else:
+            if lag is None:
+                logger.warning("replica %s is not streaming", DB_REPLICAS[index])
+        replica_lags[index] = None if lag is None else float(lag)
+    usable_replicas = [
+        index for index, lag in enumerate(replica_lags)
+        if lag is not None and lag <= DB_REPLICA_MAX_LAG
+    ]
+
+
+def start_replica_monitor():
+    """Starts the thread re-checking the replicas' lag in the background."""
+    if not DB_REPLICAS:
+        return None
+    thread = threading.Thread(
+        target=_monitor_replicas, name="replica-monitor", daemon=True)
+    thread.start()
+    return thread
+
+
+def _monitor_replicas():
+    while True:
+        try:
+            check_replicas()
+        except Exception:
+            logger.exception("checking the replicas failed")
+        time.sleep(DB_REPLICA_CHECK_INTERVAL)
+
+
+def pick_replica(request: Request):
+    """
+    The index of the replica to read from for `request`, None for the
+    primary: when no replica is usable, or when the request's user wrote
+    within the last DB_READ_YOUR_WRITES seconds.
+    """
+    replicas = usable_replicas
+    if not replicas:
+        return None
+    user_id = request.path_params.get("user_id")
+    if user_id is not None and recent_writers.get(user_id) is not cache.MISSING:
+        return None
+    return replicas[next(_next_replica) % len(replicas)]
+
+
+def remember_writer(request: Request):
+    # path parameters are still strings here, as they are in pick_replica
+    user_id = request.path_params.get("user_id")
+    if user_id is not None and request.method not in ("GET", "HEAD"):
+        recent_writers.set(user_id, True)
+
+
+def remember_new_user(user_id: int):
+    """
+    remember_writer for a user created by the request, who is not in its
+    path: their first reads go to the primary too.
+    """
+    recent_writers.set(str(user_id), True)
+
+
+def get_connection(request: Request):
+    """
+    FastAPI dependency checking out one pooled connection for the whole
+    request. Endpoints commit their own writes, anything left uncommitted
+    is rolled back when the connection goes back to the pool.
+    """
+    # before and after the write, so the pin outlives the commit
+    remember_writer(request)
+    create_engines()
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        metrics.record_pool_wait(time.perf_counter() - started)
+        yield conn
+    remember_writer(request)
+
+
+# get_connection as a context manager, for endpoints that only need a
+# connection around some of their statements
+connect = contextlib.contextmanager(get_connection)
+
+
+def get_read_connection(request: Request):
+    """
+    get_connection for endpoints that only read, connected to a replica
+    when one is usable.
+    """
+    create_engines()
+    replica = pick_replica(request)
+    reader_engine = engine if replica is None else reader_engines[replica]
+    started = time.perf_counter()
+    with reader_engine.connect() as conn:
+        metrics.record_pool_wait(time.perf_counter() - started)
+        yield conn
+
+
+async def get_async_connection(request: Request):
+    """
+    Async counterpart of get_connection, one AsyncConnection per request.
+    """
+    remember_writer(request)
+    create_engines()
+    started = time.perf_counter()
+    async with async_engine.connect() as conn:
+        metrics.record_pool_wait(time.perf_counter() - started)
+        yield conn
+    remember_writer(request)
 
-# Create a new DB engine based on our connection string
-engine = sqlalchemy.create_engine(f"postgresql://{DB_USER}:{DB_PASSWD}@{DB_SERVER}:{DB_PORT}/{DB_NAME}")
 
+async def get_async_read_connection(request: Request):
+    """Async counterpart of get_read_connection."""
+    create_engines()
+    replica = pick_replica(request)
+    reader_engine = (async_engine if replica is None
+                     else async_reader_engines[replica])
+    started = time.perf_counter()
+    async with reader_engine.connect() as conn:
+        metrics.record_pool_wait(time.perf_counter() - started)
+        yield conn
@@ -0,0 +1,170 @@
+"""
+Group commit for add_expense.
+
+With EXPENSE_GROUP_COMMIT set, add_expense requests hand their row to one
+writer thread instead of inserting and committing it themselves. The
+writer gathers the rows arriving within EXPENSE_GROUP_COMMIT_WAIT_MS of
+the first one, at most EXPENSE_GROUP_COMMIT_MAX_ROWS of them, and inserts
+them in one statement and one commit, so they share a single WAL flush.
+When that statement fails, the batch is written again row by row, each in
+its own savepoint, so only the requests whose row is bad get an error.
+"""
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+
+import sqlalchemy
+
+from src import database as db
+from src import queries
+
+logger = logging.getLogger(__name__)
+
+EXPENSE_GROUP_COMMIT = os.environ.get("EXPENSE_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+EXPENSE_GROUP_COMMIT_WAIT_MS = float(os.environ.get("EXPENSE_GROUP_COMMIT_WAIT_MS", 2))
+EXPENSE_GROUP_COMMIT_MAX_ROWS = int(os.environ.get("EXPENSE_GROUP_COMMIT_MAX_ROWS", 100))
+
+_STOP = object()
+
+
+class ExpenseWriter:
+    """
+    Inserts the expense rows given to `submit` in batches, from a thread
+    with a dedicated connection. `submit` returns a future of the new
+    expense_id, or of the error inserting that row.
+    """
+
+    def __init__(self, engine: sqlalchemy.Engine, max_rows: int,
+                 max_wait: float):
+        self.engine = engine
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="expense-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: dict) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self._queue.put((row, future))
+        return future
+
+    def stop(self):
+        """Writes the rows already submitted, then stops the thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            try:
+                if conn is None:
+                    # detached, so waiting requests holding every pooled
+                    # connection cannot starve the writer
+                    conn = self.engine.connect()
+                    conn.detach()
+                self._write(conn, batch)
+            except Exception as e:
+                logger.exception("expense group commit failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if conn is not None:
+                    conn.close()
+                    conn = None
+        if conn is not None:
+            conn.close()
+
+    def _next_batch(self):
+        # blocks for the first row only, then waits at most max_wait
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, conn: sqlalchemy.Connection, batch):
+        rows = [row for row, _ in batch]
+        try:
+            expense_ids = conn.execute(queries.INSERT_EXPENSES, {
+                "category_ids": [row["category_id"] for row in rows],
+                "date_times": [row["date_time"] for row in rows],
+                "costs": [row["cost"] for row in rows],
+                "descriptions": [row["description"] for row in rows],
+            }).scalars().all()
+            conn.commit()
+        except sqlalchemy.exc.DBAPIError as e:
+            conn.rollback()
+            if e.connection_invalidated:
+                raise
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                self._write_each(conn, batch)
+            return
+        for (_, future), expense_id in zip(batch, expense_ids):
+            future.set_result(expense_id)
+
+    def _write_each(self, conn: sqlalchemy.Connection, batch):
+        outcomes = []
+        for row, future in batch:
+            savepoint = conn.begin_nested()
+            try:
+                expense_id = conn.execute(
+                    queries.INSERT_EXPENSE, row).scalar_one()
+                savepoint.commit()
+                outcomes.append((future, expense_id, None))
+            except sqlalchemy.exc.DBAPIError as e:
+                savepoint.rollback()
+                if e.connection_invalidated:
+                    raise
+                outcomes.append((future, None, e))
+        conn.commit()
+        # nobody hears about their row before it is committed
+        for future, expense_id, error in outcomes:
+            if error is None:
+                future.set_result(expense_id)
+            else:
+                future.set_exception(error)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def writer() -> ExpenseWriter:
+    """The process' ExpenseWriter, started on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ExpenseWriter(
+                db.engine, EXPENSE_GROUP_COMMIT_MAX_ROWS,
+                EXPENSE_GROUP_COMMIT_WAIT_MS / 1000)
+        return _writer
+
+
+def stop():
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
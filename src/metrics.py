@@ -0,0 +1,216 @@
+"""
+Per-request database instrumentation exported in the Prometheus text format.
+
+MetricsMiddleware opens a RequestStats for every request, the engine hooks
+installed by instrument_engine add each query to it, and once the response
+is sent the totals are observed into the histograms below, labelled with
+the route template (e.g. /user/{user_id}/expenses).
+
+Statements slower than SLOW_QUERY_MS are logged with their SQL text and
+the types of their parameters, never the values.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+
+import sqlalchemy
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 0))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(
+                key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    cumulative += count
+                    lines.append(
+                        f"{self.name}_bucket{_labels(key, le=_number(bound))} {cumulative}")
+                lines.append(
+                    f"{self.name}_bucket{_labels(key, le='+Inf')} {series['count']}")
+                lines.append(f"{self.name}_sum{_labels(key)} {_number(series['sum'])}")
+                lines.append(f"{self.name}_count{_labels(key)} {series['count']}")
+        return lines
+
+
+class Gauge:
+    """A value read from `callback` whenever the metrics are scraped."""
+
+    def __init__(self, name: str, documentation: str, callback,
+                 metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.metric_type}",
+                f"{self.name} {_number(self.callback())}"]
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(key, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return (str(value).replace("\\", "\\\\")
+            .replace('"', '\\"').replace("\n", "\\n"))
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+request_seconds = register(Histogram(
+    "http_request_duration_seconds", "Request latency.", LATENCY_BUCKETS))
+request_queries = register(Histogram(
+    "http_request_db_queries", "SQL statements run per request.", COUNT_BUCKETS))
+request_db_seconds = register(Histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL statements per request.",
+    LATENCY_BUCKETS))
+request_db_rows = register(Histogram(
+    "http_request_db_rows", "Rows returned by SQL statements per request.",
+    ROW_BUCKETS))
+pool_wait_seconds = register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time waited for a pooled connection per request.",
+    LATENCY_BUCKETS))
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "rows", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.pool_wait_seconds = 0.0
+
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def record_pool_wait(seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def instrument_engine(engine: sqlalchemy.Engine):
+    """Counts every statement `engine` runs towards the current request."""
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @sqlalchemy.event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            stats.rows += max(cursor.rowcount, 0)
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning(
+                "slow query (%.1f ms): %s parameters: %s",
+                elapsed * 1000, " ".join(statement.split()),
+                parameter_shape(parameters))
+
+
+def parameter_shape(parameters):
+    """The types of the bound parameters, which are safe to log."""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing each request into the histograms above."""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            labels = {"method": scope["method"], "route": self.route(scope)}
+            request_seconds.observe(elapsed, **labels)
+            request_queries.observe(stats.queries, **labels)
+            request_db_seconds.observe(stats.db_seconds, **labels)
+            request_db_rows.observe(stats.rows, **labels)
+            pool_wait_seconds.observe(stats.pool_wait_seconds, **labels)
+
+    def route(self, scope) -> str:
+        # the router stores the matched endpoint in the shared scope
+        if self._routes is None:
+            self._routes = {
+                route.endpoint: route.path
+                for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
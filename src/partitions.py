@@ -0,0 +1,211 @@
+"""
+Maintenance commands for the monthly partitions of the expense table.
+
+    python -m src.partitions list                     show every partition
+    python -m src.partitions create [--months-ahead N]
+        create the partitions for this month and the next N
+    python -m src.partitions archive --before YYYY-MM [--drop]
+        detach the partitions of months before YYYY-MM into the
+        expense_archive schema, or drop them
+
+Rows of months without a partition go to expense_default and are moved out
+of it when their partition is created. The API creates the partitions for
+the next EXPENSE_PARTITIONS_AHEAD months when it starts, and again every
+EXPENSE_PARTITIONS_INTERVAL seconds while it runs.
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+import sqlalchemy
+
+from src import database as db
+
+EXPENSE_PARTITIONS_AHEAD = int(os.environ.get("EXPENSE_PARTITIONS_AHEAD", 3))
+EXPENSE_PARTITIONS_INTERVAL = float(os.environ.get("EXPENSE_PARTITIONS_INTERVAL", 3600))
+ARCHIVE_SCHEMA = "expense_archive"
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^expense_y(\d{4})m(\d{2})$")
+
+CREATE_PARTITION = sqlalchemy.text("SELECT expense_create_partition(:month)")
+
+LIST_PARTITIONS = sqlalchemy.text('''
+SELECT child.relname AS name,
+pg_get_expr(child.relpartbound, child.oid) AS bounds,
+child.reltuples::bigint AS estimated_rows
+FROM pg_inherits
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE pg_inherits.inhparent = 'expense'::regclass
+ORDER BY child.relname
+''')
+
+
+def partition_month(name: str):
+    """The first day of the month a partition holds, None for the default."""
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(engine: sqlalchemy.Engine, months_ahead: int):
+    """Creates the partitions for the current month and the next ones."""
+    this_month = datetime.datetime.utcnow().date().replace(day=1)
+    with engine.begin() as conn:
+        return [
+            conn.execute(
+                CREATE_PARTITION, {"month": add_months(this_month, months)}
+            ).scalar_one()
+            for months in range(months_ahead + 1)
+        ]
+
+
+def start_maintenance():
+    """
+    Starts the thread re-running ensure_partitions in the background, so
+    an API running past the months created at startup keeps creating them.
+    """
+    if EXPENSE_PARTITIONS_AHEAD <= 0:
+        return None
+    thread = threading.Thread(
+        target=_maintain_partitions, name="partition-maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def _maintain_partitions():
+    while True:
+        time.sleep(EXPENSE_PARTITIONS_INTERVAL)
+        try:
+            ensure_partitions(db.engine, EXPENSE_PARTITIONS_AHEAD)
+        except Exception:
+            logger.exception("creating the expense partitions failed")
+
+
+MONTH_ITEMS = """
+{action} FROM item
+WHERE expense_date_time >= :month AND expense_date_time < :next_month
+"""
+
+# No trigger fires on DETACH: the users whose expenses leave with a
+# partition get their data version bumped by hand, so their ETags change
+BUMP_PARTITION_USERS = """
+INSERT INTO user_data_version (user_id, version)
+SELECT DISTINCT budget_category.user_id, 1 FROM "{name}" AS archived
+JOIN budget_category ON budget_category.category_id = archived.category_id
+ON CONFLICT (user_id) DO UPDATE
+SET version = user_data_version.version + 1
+"""
+
+
+def month_range(month: datetime.date):
+    """The bounds of a partition's month, which are UTC months."""
+    def start(day: datetime.date) -> datetime.datetime:
+        return datetime.datetime(
+            day.year, day.month, 1, tzinfo=datetime.timezone.utc)
+    return {"month": start(month), "next_month": start(add_months(month, 1))}
+
+
+def archive(engine: sqlalchemy.Engine, before: datetime.date, drop: bool):
+    """
+    Detaches every monthly partition older than `before`. Their expenses
+    leave the rollup too, so budgets only count the expenses still in
+    the expense table, and their items move to the archive with them.
+    """
+    archived = []
+    with engine.connect() as conn:
+        names = [row.name for row in conn.execute(LIST_PARTITIONS)]
+    for name in names:
+        month = partition_month(name)
+        if month is None or month >= before:
+            continue
+        archive_partition(engine, name, drop)
+        archived.append(name)
+    return archived
+
+
+def archive_partition(engine: sqlalchemy.Engine, name: str, drop: bool):
+    """Detaches the monthly partition `name`, see archive."""
+    month = partition_month(name)
+    # one transaction per partition keeps the locks short
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(
+            f'LOCK TABLE "{name}" IN ACCESS EXCLUSIVE MODE'))
+        conn.execute(
+            sqlalchemy.text(
+                "DELETE FROM expense_monthly_rollup WHERE month = :month"),
+            {"month": month})
+        conn.execute(sqlalchemy.text(BUMP_PARTITION_USERS.format(name=name)))
+        if not drop:
+            conn.execute(sqlalchemy.text(
+                f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+            # the items go along, next to their expenses
+            conn.execute(sqlalchemy.text(
+                f'CREATE TABLE "{ARCHIVE_SCHEMA}"."{name}_item" AS '
+                + MONTH_ITEMS.format(action="SELECT *")), month_range(month))
+        # items referencing the partition would block detaching it
+        conn.execute(sqlalchemy.text(MONTH_ITEMS.format(action="DELETE")),
+                     month_range(month))
+        conn.execute(sqlalchemy.text(
+            f'ALTER TABLE expense DETACH PARTITION "{name}"'))
+        if drop:
+            conn.execute(sqlalchemy.text(f'DROP TABLE "{name}"'))
+        else:
+            conn.execute(sqlalchemy.text(
+                f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+
+
+def parse_month(value: str) -> datetime.date:
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {value}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="show the expense partitions")
+    create_parser = commands.add_parser(
+        "create", help="create the partitions of the coming months")
+    create_parser.add_argument(
+        "--months-ahead", type=int, default=EXPENSE_PARTITIONS_AHEAD,
+        help="months after the current one to create partitions for")
+    archive_parser = commands.add_parser(
+        "archive", help="detach the partitions of old months")
+    archive_parser.add_argument(
+        "--before", type=parse_month, required=True,
+        help="archive the months before this one (YYYY-MM)")
+    archive_parser.add_argument(
+        "--drop", action="store_true",
+        help="drop the detached partitions instead of keeping them in "
+             f"the {ARCHIVE_SCHEMA} schema")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        with db.engine.connect() as conn:
+            for row in conn.execute(LIST_PARTITIONS):
+                print(f"{row.name}: {row.bounds}, ~{max(row.estimated_rows, 0)} rows")
+    elif args.command == "create":
+        for name in ensure_partitions(db.engine, args.months_ahead):
+            print(f"{name} ready")
+    else:
+        archived = archive(db.engine, args.before, args.drop)
+        print(f"{'dropped' if args.drop else 'archived'} {len(archived)} partitions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
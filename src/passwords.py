@@ -0,0 +1,75 @@
+"""
+Password hashing, kept off the database and off the event loop.
+
+bcrypt runs in a pool of PASSWORD_WORKERS processes (one per core by
+default), so hashing neither holds the GIL of the API worker nor burns
+database CPU. BCRYPT_ROUNDS sets the work factor of new hashes; hashes
+made with another one are replaced the next time their user logs in.
+"""
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", os.cpu_count() or 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+# compared against when there is no user, so unknown users take as long
+_DUMMY_HASH = "$2b$12$8f0B3t7LhExW.xd8zzd60epVqkIMuaMcA7TiKPukrKHqXcHdbRO3u"
+
+
+def pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawned rather than forked, the API process runs threads
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def hash_password(password: str) -> str:
+    return pool().submit(_hash, password, BCRYPT_ROUNDS).result()
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Whether `password` matches `hashed`, False when there is no hash."""
+    valid = pool().submit(_verify, password, hashed or _DUMMY_HASH).result()
+    return valid and bool(hashed)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(
+        pool(), _hash, password, BCRYPT_ROUNDS)
+
+
+def needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$<rounds>$<salt and hash>
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,566 @@
+"""
+Every SQL statement the endpoints run, in one place.
+
+The sync and async routers execute these same statements. With
+DB_PREPARED_STATEMENTS, the PREPARED ones are parsed once per pooled
+connection, see prepare_statements.
+"""
+import re
+
+import sqlalchemy
+from sqlalchemy import event
+
+# Lookups shared by the endpoints, see sql_utils
+
+USER_BY_ID = sqlalchemy.text('SELECT * FROM "user" WHERE user_id = :user_id')
+
+EXPENSE_BY_ID = sqlalchemy.text(
+    "SELECT * FROM expense WHERE expense_id = :expense_id")
+
+CATEGORY_BY_ID = sqlalchemy.text('''
+SELECT * FROM budget_category
+WHERE user_id = :user_id
+AND category_id = :category_id
+''')
+
+# no row for an unknown user, version 0 for a user who never wrote anything
+DATA_VERSION = sqlalchemy.text('''
+SELECT COALESCE(user_data_version.version, 0) AS version
+FROM "user"
+LEFT JOIN user_data_version ON user_data_version.user_id = "user".user_id
+WHERE "user".user_id = :user_id
+''')
+
+# DATA_VERSION of get_budget, whose answer also changes whenever one of the
+# user's budget periods starts or ends: the next of those boundaries, in
+# microseconds since the epoch, is appended to it
+BUDGET_DATA_VERSION = sqlalchemy.text('''
+SELECT COALESCE(user_data_version.version, 0) || COALESCE('-' || (
+    SELECT (extract(epoch FROM min(
+        CASE WHEN lower(budget_period.period) > now()
+        THEN lower(budget_period.period) ELSE upper(budget_period.period) END
+    )) * 1000000)::bigint
+    FROM budget_category
+    JOIN budget_period ON budget_period.category_id = budget_category.category_id
+    WHERE budget_category.user_id = "user".user_id
+    AND upper(budget_period.period) > now()
+), '') AS version
+FROM "user"
+LEFT JOIN user_data_version ON user_data_version.user_id = "user".user_id
+WHERE "user".user_id = :user_id
+''')
+
+
+# Users
+
+LIST_USERS = sqlalchemy.text('SELECT * FROM "user" ORDER BY user_id')
+
+# list_users' response rendered by Postgres, see DB_RENDER_JSON
+LIST_USERS_JSON = sqlalchemy.text('''
+SELECT '[' || COALESCE(string_agg(
+'{"user_id":' || user_id || ',"name":' || to_json(name)::text || '}',
+',' ORDER BY user_id), '') || ']' AS body
+FROM "user"
+''')
+
+INSERT_USER = sqlalchemy.text(
+    'INSERT INTO "user" (name, hashed_pwd) VALUES (:name, :hashed_pwd) RETURNING user_id'
+)
+
+USER_PASSWORD = sqlalchemy.text(
+    'SELECT user_id, name, hashed_pwd FROM "user" WHERE user_id = :user_id'
+)
+
+# only replaces the hash it was computed from, a concurrent change wins
+UPDATE_PASSWORD = sqlalchemy.text(
+    'UPDATE "user" SET hashed_pwd = :hashed_pwd WHERE user_id = :user_id AND hashed_pwd = :old_hashed_pwd'
+)
+
+
+# Budgets
+
+# One query for the whole report: the user row is outer joined to its
+# categories and their expenses, so a missing user or category shows up
+# as missing columns rather than needing separate lookups.
+# A category with a budget period holding the current time is measured
+# against that period's budget and expenses only, found with one probe of
+# the period exclusion index; others against their monthly_budget and all
+# their expenses.
+BUDGET_REPORT = sqlalchemy.text('''
+SELECT "user".user_id, budget_category.category_id,
+budget_category.category_name,
+COALESCE(budget_period.budget, budget_category.monthly_budget) AS monthly_budget,
+lower(budget_period.period) AS period_start,
+upper(budget_period.period) AS period_end,
+expense.expense_id, expense.date_time, expense.cost,
+expense.description
+FROM "user"
+LEFT JOIN budget_category
+ON budget_category.user_id = "user".user_id
+AND (CAST(:category_id AS BIGINT) IS NULL
+     OR budget_category.category_id = :category_id)
+LEFT JOIN LATERAL (
+    SELECT period_id, period, budget FROM budget_period
+    WHERE budget_period.category_id = budget_category.category_id
+    AND budget_period.period @> now()
+    LIMIT 1
+) AS budget_period ON true
+LEFT JOIN expense
+ON expense.category_id = budget_category.category_id
+AND expense.date_time >= COALESCE(lower(budget_period.period), '-infinity')
+AND expense.date_time < COALESCE(upper(budget_period.period), 'infinity')
+WHERE "user".user_id = :user_id
+ORDER BY budget_category.category_id, expense.expense_id
+''')
+
+# Same report without the expense list: spend comes from the monthly
+# rollup, so the cost grows with categories and months, not expenses.
+# Periods need not follow months, so theirs is summed from the expenses
+# in the period's range.
+BUDGET_SUMMARY = sqlalchemy.text('''
+SELECT "user".user_id, budget_category.category_id,
+budget_category.category_name,
+COALESCE(budget_period.budget, budget_category.monthly_budget) AS monthly_budget,
+lower(budget_period.period) AS period_start,
+upper(budget_period.period) AS period_end,
+CASE WHEN budget_period.period_id IS NULL THEN COALESCE(rollup.spent, 0)
+     ELSE COALESCE(period_spend.spent, 0) END AS spent
+FROM "user"
+LEFT JOIN budget_category
+ON budget_category.user_id = "user".user_id
+AND (CAST(:category_id AS BIGINT) IS NULL
+     OR budget_category.category_id = :category_id)
+LEFT JOIN LATERAL (
+    SELECT period_id, period, budget FROM budget_period
+    WHERE budget_period.category_id = budget_category.category_id
+    AND budget_period.period @> now()
+    LIMIT 1
+) AS budget_period ON true
+LEFT JOIN LATERAL (
+    SELECT SUM(total_cost ORDER BY month) AS spent
+    FROM expense_monthly_rollup
+    WHERE budget_period.period_id IS NULL
+    AND expense_monthly_rollup.user_id = "user".user_id
+    AND expense_monthly_rollup.category_id = budget_category.category_id
+) AS rollup ON true
+LEFT JOIN LATERAL (
+    SELECT SUM(cost ORDER BY expense_id) AS spent
+    FROM expense
+    WHERE budget_period.period_id IS NOT NULL
+    AND expense.category_id = budget_category.category_id
+    AND expense.date_time >= lower(budget_period.period)
+    AND expense.date_time < upper(budget_period.period)
+) AS period_spend ON true
+WHERE "user".user_id = :user_id
+ORDER BY budget_category.category_id
+''')
+
+# The get_budget responses rendered by Postgres, see DB_RENDER_JSON.
+# Sums run in the same order as budget_report's so the floats match, and
+# categories holding a value api_json_float cannot render come out NULL.
+BUDGET_REPORT_JSON = sqlalchemy.text('''
+SELECT COUNT(*) AS row_count, COUNT(category_id) AS category_count,
+'[' || COALESCE(string_agg(category_json, ',' ORDER BY category_id), '') || ']' AS body,
+bool_and(category_id IS NULL OR category_json IS NOT NULL) AS renderable
+FROM (
+    SELECT category_id,
+    CASE WHEN bool_and(expense_id IS NULL OR api_json_float(cost) IS NOT NULL) THEN
+    '{"budget_category_id":' || category_id
+    || ',"budget_category":' || to_json(category_name)::text
+    || ',"budget":' || api_json_float(monthly_budget)
+    || COALESCE(',"budget_period":{"start":' || api_json_timestamptz(period_start)
+        || ',"end":' || api_json_timestamptz(period_end) || '}', '')
+    || ',"expenses":[' || COALESCE(string_agg(
+        '{"date_time":' || api_json_timestamptz(date_time)
+        || ',"cost":' || api_json_float(cost)
+        || ',"item":' || COALESCE(to_json(description)::text, 'null') || '}',
+        ',' ORDER BY expense_id), '')
+    || '],"budget_delta":' || api_json_float(
+        monthly_budget - COALESCE(SUM(cost ORDER BY expense_id), 0)) || '}'
+    END AS category_json
+    FROM (''' + BUDGET_REPORT.text + ''') AS report
+    GROUP BY category_id, category_name, monthly_budget, period_start, period_end
+) AS categories
+''')
+
+BUDGET_SUMMARY_JSON = sqlalchemy.text('''
+SELECT COUNT(*) AS row_count, COUNT(category_id) AS category_count,
+'[' || COALESCE(string_agg(category_json, ',' ORDER BY category_id), '') || ']' AS body,
+bool_and(category_id IS NULL OR category_json IS NOT NULL) AS renderable
+FROM (
+    SELECT category_id,
+    '{"budget_category_id":' || category_id
+    || ',"budget_category":' || to_json(category_name)::text
+    || ',"budget":' || api_json_float(monthly_budget)
+    || COALESCE(',"budget_period":{"start":' || api_json_timestamptz(period_start)
+        || ',"end":' || api_json_timestamptz(period_end) || '}', '')
+    || ',"budget_delta":' || api_json_float(monthly_budget - spent) || '}'
+    AS category_json
+    FROM (''' + BUDGET_SUMMARY.text + ''') AS summary
+) AS categories
+''')
+
+CATEGORY_BY_NAME = sqlalchemy.text('''
+SELECT * FROM budget_category
+WHERE user_id = :user_id
+AND category_name = :category_name
+''')
+
+INSERT_CATEGORY = sqlalchemy.text('''
+INSERT INTO budget_category
+(category_name, user_id, monthly_budget)
+VALUES (:category_name, :user_id, :monthly_budget)
+RETURNING category_id
+''')
+
+UPDATE_CATEGORY_BUDGET = sqlalchemy.text('''
+UPDATE budget_category
+SET monthly_budget = :monthly_budget
+WHERE category_id = :category_id
+RETURNING category_id
+''')
+
+# Overlapping periods of a category violate budget_period_no_overlap
+INSERT_BUDGET_PERIOD = sqlalchemy.text('''
+INSERT INTO budget_period (category_id, period, budget)
+VALUES (:category_id,
+        tstzrange(CAST(:start_date AS TIMESTAMPTZ), CAST(:end_date AS TIMESTAMPTZ), '[)'),
+        :budget)
+RETURNING period_id
+''')
+
+
+# Expenses
+
+EXPENSES_BY_ID = sqlalchemy.text('''
+SELECT expense_id, expense.category_id, date_time, cost, description,
+category_name
+FROM expense
+JOIN budget_category on budget_category.category_id = expense.category_id
+WHERE expense_id = ANY(:expense_ids)
+AND budget_category.user_id = :user_id
+''')
+
+LIST_EXPENSES = '''
+SELECT expense_id, budget_category.category_id,
+date_time, cost, description, category_name
+FROM expense
+JOIN budget_category on budget_category.category_id = expense.category_id
+WHERE budget_category.user_id = :user_id_input
+AND date_time <= :end_date AND date_time >= :start_date
+{keyset}
+ORDER BY date_time, expense_id
+LIMIT :limit
+'''
+LIST_EXPENSES_FIRST_PAGE = sqlalchemy.text(LIST_EXPENSES.format(keyset=""))
+LIST_EXPENSES_NEXT_PAGE = sqlalchemy.text(LIST_EXPENSES.format(
+    keyset="AND (date_time, expense_id) > (:after_date_time, :after_expense_id)"
+))
+
+# A list_expenses page rendered by Postgres, see DB_RENDER_JSON. Rows past
+# :page_size only tell whether there is a next page, expenses holding a
+# cost api_json_float cannot render come out NULL.
+LIST_EXPENSES_JSON = '''
+SELECT COUNT(*) AS row_count,
+'[' || COALESCE(string_agg(expense_json, ',' ORDER BY page_row)
+    FILTER (WHERE CAST(:page_size AS BIGINT) IS NULL OR page_row <= :page_size),
+    '') || ']' AS body,
+bool_and(expense_json IS NOT NULL) AS renderable,
+MAX(date_time) FILTER (WHERE page_row = :page_size) AS last_date_time,
+MAX(expense_id) FILTER (WHERE page_row = :page_size) AS last_expense_id
+FROM (
+    SELECT expense_id, date_time,
+    row_number() OVER (ORDER BY date_time, expense_id) AS page_row,
+    '{{"expense_id":' || expense_id
+    || ',"cost":' || api_json_float(cost)
+    || ',"date_time":' || api_json_timestamptz(date_time)
+    || ',"description":' || COALESCE(to_json(description)::text, 'null')
+    || ',"category":' || to_json(category_name)::text || '}}' AS expense_json
+    FROM ({page}) AS page
+) AS rendered
+'''
+LIST_EXPENSES_FIRST_PAGE_JSON = sqlalchemy.text(
+    LIST_EXPENSES_JSON.format(page=LIST_EXPENSES_FIRST_PAGE.text))
+LIST_EXPENSES_NEXT_PAGE_JSON = sqlalchemy.text(
+    LIST_EXPENSES_JSON.format(page=LIST_EXPENSES_NEXT_PAGE.text))
+
+# A list_expenses page with each expense's items, one row per item (or
+# one without item columns for expenses without items)
+LIST_EXPENSES_WITH_ITEMS = '''
+SELECT page.*, item.item_id, item.name AS item_name, item.cost AS item_cost
+FROM ({page}) AS page
+LEFT JOIN item ON item.expense_id = page.expense_id
+AND item.expense_date_time = page.date_time
+ORDER BY page.date_time, page.expense_id, item.item_id
+'''
+LIST_EXPENSES_FIRST_PAGE_WITH_ITEMS = sqlalchemy.text(
+    LIST_EXPENSES_WITH_ITEMS.format(page=LIST_EXPENSES_FIRST_PAGE.text))
+LIST_EXPENSES_NEXT_PAGE_WITH_ITEMS = sqlalchemy.text(
+    LIST_EXPENSES_WITH_ITEMS.format(page=LIST_EXPENSES_NEXT_PAGE.text))
+
+EXPENSE_WITH_ITEMS = sqlalchemy.text('''
+SELECT expense.expense_id, expense.category_id, expense.date_time,
+expense.cost, expense.description,
+item.item_id, item.name AS item_name, item.cost AS item_cost
+FROM expense
+LEFT JOIN item ON item.expense_id = expense.expense_id
+AND item.expense_date_time = expense.date_time
+WHERE expense.expense_id = :expense_id
+ORDER BY item.item_id
+''')
+
+# date_time is bound as text, so every driver has it read in the session
+# TimeZone: asyncpg would convert a datetime with the process's own
+INSERT_EXPENSE = sqlalchemy.text('''
+INSERT INTO expense (category_id, date_time, cost, description)
+VALUES (:category_id, CAST(CAST(:date_time AS TEXT) AS TIMESTAMPTZ), :cost, :description)
+RETURNING expense_id;
+''')
+
+# An expense and all its items in one statement. Its cost is the sum of
+# the items, stored so reads never add them up again. The item_ids are
+# drawn before inserting, so they come back in the order of the arrays.
+INSERT_EXPENSE_WITH_ITEMS = sqlalchemy.text('''
+WITH items AS MATERIALIZED (
+    SELECT nextval('item_item_id_seq') AS item_id, position, name, cost
+    FROM unnest(CAST(:item_names AS TEXT[]), CAST(:item_costs AS FLOAT8[]))
+    WITH ORDINALITY AS rows (name, cost, position)
+), new_expense AS (
+    INSERT INTO expense (category_id, date_time, cost, description)
+    SELECT CAST(:category_id AS BIGINT), CAST(CAST(:date_time AS TEXT) AS TIMESTAMPTZ),
+    SUM(cost ORDER BY position), CAST(:description AS TEXT)
+    FROM items
+    RETURNING expense_id, category_id, date_time, cost
+), new_items AS (
+    INSERT INTO item (item_id, expense_id, expense_date_time, category_id, name, cost)
+    SELECT item_id, expense_id, date_time, category_id, name, items.cost
+    FROM items, new_expense
+)
+SELECT new_expense.expense_id, new_expense.cost,
+items.item_id, items.name AS item_name, items.cost AS item_cost
+FROM new_expense, items
+ORDER BY items.position
+''')
+
+# The rows of one add_expense group commit, in one statement. Their
+# expense_ids are drawn before inserting, so they come back in the order
+# of the arrays.
+INSERT_EXPENSES = sqlalchemy.text('''
+WITH batch AS MATERIALIZED (
+    SELECT nextval('expense_expense_id_seq') AS expense_id, row_number,
+    category_id, date_time, cost, description
+    FROM unnest(CAST(:category_ids AS BIGINT[]),
+                CAST(:date_times AS TIMESTAMPTZ[]),
+                CAST(:costs AS FLOAT8[]),
+                CAST(:descriptions AS TEXT[]))
+    WITH ORDINALITY AS rows (category_id, date_time, cost, description, row_number)
+), inserted AS (
+    INSERT INTO expense (expense_id, category_id, date_time, cost, description)
+    SELECT expense_id, category_id, date_time, cost, description FROM batch
+)
+SELECT expense_id FROM batch ORDER BY row_number
+''')
+
+OWNED_CATEGORIES = sqlalchemy.text('''
+SELECT category_id FROM budget_category
+WHERE user_id = :user_id
+AND category_id = ANY(:category_ids)
+''')
+
+
+# Search
+
+# Expenses whose description, or the name of one of their items, matches
+# the query, best ranked first, then newest. Both are matched within the
+# user's categories, which items carry too, so the indexes leading with
+# category_id keep that to the user's own rows. The match and rank expressions of the search mode
+# are filled in for both searched columns, see search_expenses.
+SEARCH_EXPENSES = '''
+WITH categories AS MATERIALIZED (
+    SELECT category_id, category_name FROM budget_category
+    WHERE user_id = :user_id
+    AND (CAST(:category_id AS BIGINT) IS NULL OR category_id = :category_id)
+), matches AS (
+    SELECT expense_id, date_time, {expense_rank} AS rank
+    FROM expense
+    WHERE category_id IN (SELECT category_id FROM categories)
+    AND date_time >= :start_date AND date_time <= :end_date
+    AND {expense_match}
+    UNION ALL
+    SELECT expense_id, expense_date_time, {item_rank} AS rank
+    FROM item
+    WHERE category_id IN (SELECT category_id FROM categories)
+    AND expense_date_time >= :start_date AND expense_date_time <= :end_date
+    AND {item_match}
+), ranked AS (
+    SELECT expense_id, date_time, CAST(MAX(rank) AS FLOAT8) AS rank
+    FROM matches
+    GROUP BY expense_id, date_time
+)
+SELECT ranked.rank, expense.expense_id, expense.cost, expense.date_time,
+expense.description, categories.category_name
+FROM ranked
+JOIN expense ON expense.expense_id = ranked.expense_id
+AND expense.date_time = ranked.date_time
+JOIN categories ON categories.category_id = expense.category_id
+WHERE CAST(:after_rank AS FLOAT8) IS NULL
+OR (ranked.rank, ranked.date_time, ranked.expense_id)
+   < (:after_rank, :after_date_time, :after_expense_id)
+ORDER BY ranked.rank DESC, ranked.date_time DESC, ranked.expense_id DESC
+LIMIT :limit
+'''
+
+# (match, rank) of each search mode: websearch syntax full text, a
+# tsquery of word prefixes, and typo tolerant trigram word similarity
+SEARCH_MODES = {
+    "text": (
+        "to_tsvector('english', {column}) @@ websearch_to_tsquery('english', :query)",
+        "ts_rank(to_tsvector('english', {column}), websearch_to_tsquery('english', :query))",
+    ),
+    "prefix": (
+        "to_tsvector('english', {column}) @@ to_tsquery('english', :query)",
+        "ts_rank(to_tsvector('english', {column}), to_tsquery('english', :query))",
+    ),
+    "fuzzy": (
+        ":query <% {column}",
+        "word_similarity(:query, {column})",
+    ),
+}
+
+
+def search_expenses(match: str, rank: str):
+    return sqlalchemy.text(SEARCH_EXPENSES.format(
+        expense_match=match.format(column="expense.description"),
+        expense_rank=rank.format(column="expense.description"),
+        item_match=match.format(column="item.name"),
+        item_rank=rank.format(column="item.name"),
+    ))
+
+
+SEARCH_EXPENSES_BY_MODE = {
+    mode: search_expenses(match, rank)
+    for mode, (match, rank) in SEARCH_MODES.items()
+}
+
+# The word similarity fuzzy matches need, for the rest of the transaction
+SET_FUZZY_THRESHOLD = sqlalchemy.text(
+    "SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)")
+
+
+# Export
+
+# A user's whole history, for psycopg2's copy_expert (hence its own
+# paramstyle). The NDJSON export is CSV without quoting: the quote and
+# delimiter are control characters, which JSON text always escapes.
+EXPORT_EXPENSES = '''
+SELECT expense.expense_id, expense.date_time,
+budget_category.category_name AS category, expense.cost,
+expense.description
+FROM expense
+JOIN budget_category ON budget_category.category_id = expense.category_id
+WHERE budget_category.user_id = %(user_id)s
+'''
+EXPORT_EXPENSES_CSV = (
+    "COPY (" + EXPORT_EXPENSES + "ORDER BY date_time, expense_id) "
+    "TO STDOUT WITH (FORMAT csv, HEADER)"
+)
+EXPORT_EXPENSES_NDJSON = (
+    "COPY (SELECT row_to_json(export)::text FROM (" + EXPORT_EXPENSES
+    + ") AS export ORDER BY export.date_time, export.expense_id) "
+    "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+)
+
+SET_UTC_TIME_ZONE = sqlalchemy.text("SET LOCAL TimeZone = 'UTC'")
+
+
+# Analytics
+
+# Totals per category and bucket are aggregated first, the running total is
+# then a window over those (much fewer) rows. The range filter on
+# (category_id, date_time) is the same one list_expenses uses.
+SPENDING = sqlalchemy.text('''
+SELECT category_id, category_name, bucket, total, expense_count,
+SUM(total) OVER (PARTITION BY category_id ORDER BY bucket) AS running_total
+FROM (
+    SELECT budget_category.category_id, category_name,
+    date_trunc(:bucket, date_time) AS bucket,
+    SUM(cost) AS total, COUNT(*) AS expense_count
+    FROM expense
+    JOIN budget_category on budget_category.category_id = expense.category_id
+    WHERE budget_category.user_id = :user_id
+    AND (CAST(:category_id AS BIGINT) IS NULL OR budget_category.category_id = :category_id)
+    AND date_time <= :end_date AND date_time >= :start_date
+    GROUP BY budget_category.category_id, category_name, bucket
+) AS buckets
+ORDER BY category_id, bucket
+''')
+
+
+# The hot statements pooled connections prepare with DB_PREPARED_STATEMENTS,
+# under these names
+PREPARED = {
+    "user_by_id": USER_BY_ID,
+    "expense_by_id": EXPENSE_BY_ID,
+    "category_by_id": CATEGORY_BY_ID,
+    "data_version": DATA_VERSION,
+    "budget_data_version": BUDGET_DATA_VERSION,
+    "budget_report": BUDGET_REPORT,
+    "budget_summary": BUDGET_SUMMARY,
+    "category_by_name": CATEGORY_BY_NAME,
+    "expenses_by_id": EXPENSES_BY_ID,
+    "list_expenses_first_page": LIST_EXPENSES_FIRST_PAGE,
+    "list_expenses_next_page": LIST_EXPENSES_NEXT_PAGE,
+    "insert_expense": INSERT_EXPENSE,
+    "owned_categories": OWNED_CATEGORIES,
+}
+
+PYFORMAT_BIND = re.compile(r"%\((\w+)\)s")
+
+
+def prepared_forms(name: str, statement, dialect):
+    """
+    The SQL `statement` compiles to for `dialect`, which must use the
+    pyformat paramstyle, with the PREPARE creating it under `name` and the
+    EXECUTE running it with the same parameters.
+    """
+    sql = str(statement.compile(dialect=dialect))
+    params = list(dict.fromkeys(PYFORMAT_BIND.findall(sql)))
+    body = PYFORMAT_BIND.sub(
+        lambda bind: f"${params.index(bind.group(1)) + 1}", sql)
+    prepare = f"PREPARE {name} AS {body.replace('%%', '%').strip().rstrip(';')}"
+    execute = f"EXECUTE {name}"
+    if params:
+        execute += f"({', '.join(f'%({param})s' for param in params)})"
+    return sql, prepare, execute
+
+
+def prepare_statements(engine: sqlalchemy.Engine):
+    """
+    Has every new connection of `engine` PREPARE the PREPARED statements
+    once, then swaps their executions for EXECUTEs of the prepared ones,
+    so Postgres skips parsing and, once it settles on a generic plan,
+    planning them. Call it before the engine opens any connection.
+
+    Only psycopg2 engines need this: asyncpg already prepares, and caches
+    per connection, every statement it runs.
+    """
+    forms = [prepared_forms(name, statement, engine.dialect)
+             for name, statement in PREPARED.items()]
+    executes = {sql: execute for sql, _, execute in forms}
+
+    @event.listens_for(engine, "connect")
+    def prepare(dbapi_connection, connection_record):
+        with dbapi_connection.cursor() as cursor:
+            for _, prepare_sql, _ in forms:
+                cursor.execute(prepare_sql)
+        dbapi_connection.commit()
+        connection_record.info["prepared_statements"] = True
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def execute_prepared(conn, cursor, statement, parameters, context,
+                         executemany):
+        # server-side cursors (streams) cannot be declared over an EXECUTE
+        if (statement in executes and conn.info.get("prepared_statements")
+                and getattr(cursor, "name", None) is None):
+            return executes[statement], parameters
+        return statement, parameters
@@ -0,0 +1,87 @@
+"""
+Maintenance commands for the expense_monthly_rollup table, which triggers
+on expense keep in sync with every write.
+
+    python -m src.rollup backfill   rebuild the rollup from the expense table
+    python -m src.rollup check      report (category, month) totals that drifted
+"""
+import argparse
+import sys
+
+import sqlalchemy
+
+from src import database as db
+
+# expense totals per (user, category, month), the source of truth
+EXPENSE_TOTALS = '''
+SELECT budget_category.user_id, expense.category_id,
+date_trunc('month', expense.date_time AT TIME ZONE 'UTC')::date AS month,
+SUM(expense.cost) AS total_cost, COUNT(*) AS expense_count
+FROM expense
+JOIN budget_category ON budget_category.category_id = expense.category_id
+GROUP BY 1, 2, 3
+'''
+
+# rollup rows emptied by deletes are equivalent to missing ones
+ROLLUP_DRIFT = sqlalchemy.text(f'''
+SELECT COALESCE(actual.user_id, rollup.user_id) AS user_id,
+COALESCE(actual.category_id, rollup.category_id) AS category_id,
+COALESCE(actual.month, rollup.month) AS month,
+actual.total_cost AS expected_cost, rollup.total_cost AS rollup_cost,
+actual.expense_count AS expected_count, rollup.expense_count AS rollup_count
+FROM ({EXPENSE_TOTALS}) AS actual
+FULL OUTER JOIN expense_monthly_rollup AS rollup
+ON rollup.user_id = actual.user_id
+AND rollup.category_id = actual.category_id
+AND rollup.month = actual.month
+WHERE COALESCE(actual.expense_count, 0) <> COALESCE(rollup.expense_count, 0)
+OR abs(COALESCE(actual.total_cost, 0) - COALESCE(rollup.total_cost, 0)) > :tolerance
+ORDER BY 1, 2, 3
+''')
+
+
+def backfill():
+    with db.engine.begin() as conn:
+        # keep writers out until the rebuilt totals are committed
+        conn.execute(sqlalchemy.text("LOCK TABLE expense IN SHARE MODE"))
+        conn.execute(sqlalchemy.text("DELETE FROM expense_monthly_rollup"))
+        inserted = conn.execute(sqlalchemy.text(f'''
+            INSERT INTO expense_monthly_rollup
+            (user_id, category_id, month, total_cost, expense_count)
+            {EXPENSE_TOTALS}
+            '''))
+    print(f"rebuilt {inserted.rowcount} rollup rows")
+
+
+def check(tolerance: float) -> int:
+    with db.engine.connect() as conn:
+        drift = conn.execute(ROLLUP_DRIFT, {"tolerance": tolerance}).fetchall()
+    for row in drift:
+        print(
+            f"user {row.user_id} category {row.category_id} {row.month}: "
+            f"expected {row.expected_count or 0} expenses / {row.expected_cost or 0}, "
+            f"rollup has {row.rollup_count or 0} / {row.rollup_cost or 0}"
+        )
+    print(f"{len(drift)} rollup rows out of sync")
+    return 1 if drift else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.rollup")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill", help="rebuild the rollup from expense")
+    check_parser = commands.add_parser(
+        "check", help="compare the rollup against expense")
+    check_parser.add_argument(
+        "--tolerance", type=float, default=0.005,
+        help="largest acceptable difference between totals")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        backfill()
+        return 0
+    return check(args.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,169 @@
+import base64
+import datetime
+import hashlib
+import json
+
 import sqlalchemy
-from fastapi import HTTPException
-from src import database as db
+from fastapi import HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncConnection
 
+from src import cache
+from src import queries
 
-def get_user(user_id: int):
-    with db.engine.connect() as conn:
-        user = conn.execute(
-            sqlalchemy.text('SELECT * FROM "user" WHERE user_id = :user_id'),
-            [{"user_id": user_id}]
-        ).fetchone()
-        if user is None:
-            raise HTTPException(status_code=404, detail="user not found.")
-    return user
 
+def get_user(conn: sqlalchemy.Connection, user_id: int):
+    user = cache.lookups.get(cache.user_key(user_id))
+    if user is cache.MISSING:
+        user = conn.execute(queries.USER_BY_ID, [{"user_id": user_id}]).fetchone()
+        remember(cache.user_key(user_id), user)
+    return check_user(user)
 
-def get_expense(expense_id: int):
-    with db.engine.connect() as conn:
-        expense = conn.execute(
-            sqlalchemy.text(
-                "SELECT * FROM expense WHERE expense_id = :expense_id"),
-            [{"expense_id": expense_id}]
-        ).fetchone()
-        if expense is None:
-            raise HTTPException(status_code=404, detail="expense not found.")
-    return expense
+
+def get_expense(conn: sqlalchemy.Connection, expense_id: int):
+    expense = conn.execute(
+        queries.EXPENSE_BY_ID, [{"expense_id": expense_id}]).fetchone()
+    return check_expense(expense)
 
 
-def get_category(user_id: int, budget_category_id: int):
-    with db.engine.connect() as conn:
+def get_category(conn: sqlalchemy.Connection, user_id: int,
+                 budget_category_id: int):
+    key = cache.category_key(user_id, budget_category_id)
+    category_user = cache.lookups.get(key)
+    if category_user is cache.MISSING:
         category_user = conn.execute(
-            sqlalchemy.text('''
-            SELECT * FROM budget_category
-            WHERE user_id = :user_id
-            AND category_id = :category_id
-            '''),
+            queries.CATEGORY_BY_ID,
             [{"user_id": user_id, "category_id": budget_category_id}]
         ).fetchone()
-        if category_user is None:
-            raise HTTPException(
-                status_code=404, detail="budget category not found.")
+        remember(key, category_user)
+    return check_category(category_user)
+
+
+async def get_user_async(conn: AsyncConnection, user_id: int):
+    user = cache.lookups.get(cache.user_key(user_id))
+    if user is cache.MISSING:
+        result = await conn.execute(queries.USER_BY_ID, [{"user_id": user_id}])
+        user = result.fetchone()
+        remember(cache.user_key(user_id), user)
+    return check_user(user)
+
+
+async def get_expense_async(conn: AsyncConnection, expense_id: int):
+    result = await conn.execute(queries.EXPENSE_BY_ID, [{"expense_id": expense_id}])
+    return check_expense(result.fetchone())
+
+
+async def get_category_async(conn: AsyncConnection, user_id: int,
+                             budget_category_id: int):
+    key = cache.category_key(user_id, budget_category_id)
+    category_user = cache.lookups.get(key)
+    if category_user is cache.MISSING:
+        result = await conn.execute(
+            queries.CATEGORY_BY_ID,
+            [{"user_id": user_id, "category_id": budget_category_id}]
+        )
+        category_user = result.fetchone()
+        remember(key, category_user)
+    return check_category(category_user)
+
+
+def get_data_version(conn: sqlalchemy.Connection, user_id: int):
+    return conn.execute(queries.DATA_VERSION, [{"user_id": user_id}]).scalar()
+
+
+async def get_data_version_async(conn: AsyncConnection, user_id: int):
+    return (await conn.execute(queries.DATA_VERSION, [{"user_id": user_id}])).scalar()
+
+
+def get_budget_data_version(conn: sqlalchemy.Connection, user_id: int):
+    return conn.execute(queries.BUDGET_DATA_VERSION, [{"user_id": user_id}]).scalar()
+
+
+async def get_budget_data_version_async(conn: AsyncConnection, user_id: int):
+    return (await conn.execute(
+        queries.BUDGET_DATA_VERSION, [{"user_id": user_id}])).scalar()
+
+
+def remember(key, row):
+    # missing rows are not cached, they may be created at any moment
+    if row is not None:
+        cache.lookups.set(key, row)
+
+
+def check_user(user):
+    if user is None:
+        raise HTTPException(status_code=404, detail="user not found.")
+    return user
+
+
+def check_expense(expense):
+    if expense is None:
+        raise HTTPException(status_code=404, detail="expense not found.")
+    return expense
+
+
+def check_category(category_user):
+    if category_user is None:
+        raise HTTPException(
+            status_code=404, detail="budget category not found.")
     return category_user
+
+
+def to_timestamp(value: str) -> datetime.datetime:
+    """
+    Parses a "YYYY-MM-DD HH:MM:SS" timestamp, as loosely as Postgres does
+    (single digit days and months), falling back to ISO 8601.
+    """
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return datetime.datetime.fromisoformat(value)
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """to_timestamp for request parameters, answering 400 when invalid."""
+    try:
+        return to_timestamp(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail=f"invalid timestamp: {value}.")
+
+
+def encode_cursor(date_time, expense_id: int) -> str:
+    """Opaque keyset cursor pointing just past (date_time, expense_id)."""
+    payload = json.dumps([date_time.isoformat(), expense_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        date_time, expense_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.datetime.fromisoformat(date_time), int(expense_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor.")
+
+
+def check_etag(request: Request, response: Response, version):
+    """
+    Sets the weak ETag of a response built from a user's data at `version`
+    and returns a 304 response when the client already holds it. The
+    version has to be read before the data, so the data is never older
+    than its ETag. Unknown users (no version) get no ETag.
+    """
+    if version is None:
+        return None
+    url = f"{request.url.path}?{request.url.query}"
+    etag = f'W/"{version}-{hashlib.sha1(url.encode()).hexdigest()[:16]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match compares weakly, W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import admission
+from src.api.server import app
+
+client = TestClient(app)
+
+
+def test_waiting_requests_run_in_turn():
+    async def run():
+        limiter = admission.AdmissionController(2, 10, 5)
+        await limiter.acquire(2)
+        heavy = asyncio.ensure_future(limiter.acquire(2))
+        light = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 2
+
+        limiter.release(2, 0.1)
+        await heavy
+        assert not light.done()
+        limiter.release(2, 0.1)
+        await light
+        assert limiter.in_use == 1
+        assert limiter.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects():
+    async def run():
+        limiter = admission.AdmissionController(1, 0, 5)
+        await limiter.acquire(1)
+        with pytest.raises(admission.Overloaded):
+            await limiter.acquire(1)
+        assert limiter.rejected == 1
+
+    asyncio.run(run())
+
+
+def test_expected_wait_past_client_timeout_rejects():
+    async def run():
+        limiter = admission.AdmissionController(1, 10, 5)
+        await limiter.acquire(1)
+        limiter.release(1, 2)
+        await limiter.acquire(1)
+        # a unit takes 2s: the wait and the run take 4s
+        with pytest.raises(admission.Overloaded) as e:
+            await limiter.acquire(1, timeout=3)
+        assert e.value.retry_after == 2
+        assert limiter.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_wait_times_out():
+    async def run():
+        limiter = admission.AdmissionController(1, 10, 0.01)
+        await limiter.acquire(1)
+        with pytest.raises(admission.Overloaded):
+            await limiter.acquire(1)
+        assert limiter.queue_depth == 0
+        limiter.release(1, 0.1)
+        await limiter.acquire(1)
+
+    asyncio.run(run())
+
+
+def test_overload_is_a_503(monkeypatch):
+    limiter = admission.AdmissionController(1, 0, 5)
+    limiter.in_use = 1
+    monkeypatch.setattr(admission, "limiter", limiter)
+
+    response = client.get("/users/13/")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/healthz").status_code == 200
+
+    metrics = client.get("/metrics").text
+    assert "admission_queue_depth 0" in metrics
+    assert "admission_rejected_total 1" in metrics
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/users/{user_id}/"}') in metrics
+
+
+def test_requests_give_their_units_back():
+    assert client.get("/users/13/").status_code == 200
+    assert admission.limiter.in_use == 0
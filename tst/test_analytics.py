@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+
+from src.api.server import app
+
+client = TestClient(app)
+
+ANALYTICS_TEST_USER = 13
+ANALYTICS_TEST_USER_POSTS = 29
+ANALYTICS_TEST_CATEGORY_POSTS = 16
+
+
+def test_spending_by_month():
+    response = client.get(
+        f"/user/{ANALYTICS_TEST_USER}/analytics/spending",
+        params={"start_date": "2023-05-01 00:00:00",
+                "end_date": "2023-06-01 00:00:00",
+                "bucket": "month", "category_id": 4})
+    assert response.status_code == 200
+    assert response.json() == [{
+        "category_id": 4,
+        "category": "TestCategoryWithExpenses",
+        "series": [{"bucket": "2023-05-01T00:00:00+00:00", "total": 95.0,
+                    "count": 2, "running_total": 95.0}],
+    }]
+
+
+def test_spending_running_total():
+    for date_time in ["1999-01-10 12:00:00", "1999-02-10 12:00:00"]:
+        response = client.post(
+            f"/user/{ANALYTICS_TEST_USER_POSTS}/expense/",
+            json={"cost": 10, "date_time": date_time,
+                  "category_id": ANALYTICS_TEST_CATEGORY_POSTS,
+                  "description": "analytics"})
+        assert response.status_code == 200
+
+    response = client.get(
+        f"/user/{ANALYTICS_TEST_USER_POSTS}/analytics/spending",
+        params={"start_date": "1999-01-01 00:00:00",
+                "end_date": "1999-03-01 00:00:00", "bucket": "month"})
+    assert response.status_code == 200
+    january, february = response.json()[0]["series"]
+    assert january["running_total"] == january["total"]
+    assert february["running_total"] == january["total"] + february["total"]
+
+
+def test_spending_bad_bucket():
+    response = client.get(
+        f"/user/{ANALYTICS_TEST_USER}/analytics/spending",
+        params={"start_date": "2023-05-01 00:00:00",
+                "end_date": "2023-06-01 00:00:00", "bucket": "year"})
+    assert response.status_code == 422
+
+
+def test_spending_category_not_found():
+    response = client.get(
+        f"/user/{ANALYTICS_TEST_USER}/analytics/spending",
+        params={"start_date": "2023-05-01 00:00:00",
+                "end_date": "2023-06-01 00:00:00", "category_id": 20})
+    assert response.status_code == 404
@@ -0,0 +1,139 @@
+import importlib.util
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src import metrics
+from src.api.aio import users as aio_users
+from src.api.server import app
+
+client = TestClient(app)
+
+ASYNC_TEST_USER = 26
+ASYNC_TEST_BUDGET_USER = 13
+ASYNC_TEST_USER_POSTS = 29
+ASYNC_TEST_CATEGORY_POSTS = 16
+
+
+@pytest.fixture
+def async_client(monkeypatch):
+    """
+    A started client of the API as served with DB_ASYNC: a copy of
+    src.api.server built with the setting on, running on one event loop
+    with its own engines, asyncpg's included.
+    """
+    monkeypatch.setattr(db, "DB_ASYNC", True)
+    for name in db.ENGINES:
+        monkeypatch.setattr(db, name, getattr(db, name))
+    monkeypatch.setattr(db, "_engines_created", False)
+    # the copy registers its gauges again
+    monkeypatch.setattr(metrics, "REGISTRY", list(metrics.REGISTRY))
+    spec = importlib.util.find_spec("src.api.server")
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    with TestClient(server.app) as started:
+        assert db.async_engine is not None
+        yield started
+
+
+def test_async_endpoints_take_precedence(async_client):
+    [endpoint, *_] = [route.endpoint for route in async_client.app.routes
+                      if getattr(route, "path", None) == "/users/"
+                      and "GET" in route.methods]
+    assert endpoint is aio_users.list_users
+
+
+@pytest.fixture
+def local_time_zone():
+    """The API process running in a time zone other than the sessions' UTC."""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+@pytest.mark.parametrize("items", [None, [{"name": "stamp", "cost": 2}]])
+def test_async_add_expense_stores_the_same_time(
+        async_client, local_time_zone, items):
+    expense = {"cost": 2, "date_time": "2023-05-08 14:00:00",
+               "category_id": ASYNC_TEST_CATEGORY_POSTS,
+               "description": "time zone", "items": items}
+    url = f"/user/{ASYNC_TEST_USER_POSTS}/expense/"
+    stored = []
+    for any_client in (async_client, client):
+        response = any_client.post(url, json=expense)
+        assert response.status_code == 200
+        expense_id = response.json()["expense_id"]
+        stored.append(client.get(
+            f"/user/{ASYNC_TEST_USER_POSTS}/expense/{expense_id}").json()["date_time"])
+    assert stored == ["2023-05-08T14:00:00+00:00"] * 2
+
+
+@pytest.mark.parametrize("url", [
+    "/users/",
+    f"/users/{ASYNC_TEST_USER}/",
+    f"/users/{ASYNC_TEST_BUDGET_USER}/budget/",
+    f"/users/{ASYNC_TEST_BUDGET_USER}/budget/?budget_category_id=4",
+    f"/users/{ASYNC_TEST_BUDGET_USER}/budget/?include_expenses=false",
+    f"/user/{ASYNC_TEST_USER}/expense/5",
+    f"/user/{ASYNC_TEST_USER}/expense/5?include_items=true",
+    f"/user/{ASYNC_TEST_USER}/expense/999999",
+    f"/user/{ASYNC_TEST_USER}/expenses?start_date=2023-05-01 00:00:00",
+    f"/user/{ASYNC_TEST_USER}/expenses?start_date=2023-05-01 00:00:00&limit=1",
+    f"/user/{ASYNC_TEST_USER}/expenses?start_date=2023-05-01 00:00:00&include_items=true",
+])
+def test_async_reads_match_sync(async_client, url):
+    response = async_client.get(url)
+    expected = client.get(url)
+    assert response.status_code == expected.status_code
+    assert response.json() == expected.json()
+    assert response.headers.get("x-next-cursor") == \
+        expected.headers.get("x-next-cursor")
+
+
+def test_async_stream_matches_sync(async_client):
+    url = f"/user/{ASYNC_TEST_USER}/expenses?start_date=2023-05-01 00:00:00&stream=true"
+    response = async_client.get(url)
+    assert response.status_code == 200
+    assert response.text == client.get(url).text
+
+
+def test_async_batch_matches_sync(async_client):
+    url = f"/user/{ASYNC_TEST_USER}/expenses/batch"
+    batch = {"expense_ids": [5, 1, 999999]}
+    response = async_client.post(url, json=batch)
+    assert response.status_code == 200
+    assert response.json() == client.post(url, json=batch).json()
+
+
+def test_async_writes_read_back_as_sync(async_client):
+    user = async_client.post(
+        "/users/", json={"name": "async_user", "password": "correct horse"})
+    assert user.status_code == 200
+    user_id = user.json()["user_id"]
+    url = f"/users/{user_id}/"
+    assert async_client.get(url).json() == client.get(url).json() == {
+        "user_id": user_id, "name": "async_user"}
+
+    budget = async_client.post(
+        f"/users/{user_id}/budget/async category/", json={"budget": 50})
+    assert budget.status_code == 200
+    category_id = budget.json()["category_id"]
+
+    expense = async_client.post(f"/user/{user_id}/expense/", json={
+        "cost": 12.5, "date_time": "2023-05-08 09:30:00",
+        "category_id": category_id, "description": "async expense"})
+    assert expense.status_code == 200
+    url = f"/user/{user_id}/expense/{expense.json()['expense_id']}"
+    assert async_client.get(url).json() == client.get(url).json()
+
+    url = f"/users/{user_id}/budget/"
+    assert async_client.get(url).json() == client.get(url).json()
@@ -1,5 +1,8 @@
 import json
 import random
+import time
+import uuid
+from datetime import datetime, timedelta
 
 from fastapi.testclient import TestClient
 
@@ -60,3 +63,125 @@ def test_set_budget_update():
         "user_id": 13,
         "monthly_budget": budget
     }
+
+
+def test_get_budget_category_not_found():
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id=999999999")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "budget category not found."}
+
+
+def test_get_budget_without_expenses():
+    response = client.get(
+        f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id=4&include_expenses=false")
+    assert response.status_code == 200
+
+    with open("tst/budget/13-budget-4.json", encoding="utf-8") as f:
+        expected = json.load(f)
+    for category in expected:
+        del category["expenses"]
+    assert response.json() == expected
+
+
+def test_get_budget_not_modified():
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id=3")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id=3",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_get_budget_etag_changes_on_write():
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/")
+    etag = response.headers["etag"]
+
+    client.post(f"/users/{BUDGET_TEST_USER}/budget/TestBudgetUpdate/",
+                json={"budget": 10})
+
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/",
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def timestamp(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def test_budget_period():
+    name = f"PERIOD_BUDGET{uuid.uuid4().hex}"
+    category_id = client.post(f"/users/{BUDGET_TEST_USER}/budget/{name}/",
+                              json={"budget": 1000}).json()["category_id"]
+    now = datetime.utcnow().replace(microsecond=0)
+    start, end = now - timedelta(days=1), now + timedelta(days=1)
+    period = {"start_date": timestamp(start), "end_date": timestamp(end),
+              "budget": 100}
+    response = client.post(
+        f"/users/{BUDGET_TEST_USER}/budget/{name}/periods", json=period)
+    assert response.status_code == 200
+
+    for cost, date_time in [(30, now - timedelta(hours=1)),
+                            (500, start - timedelta(days=2))]:
+        response = client.post(f"/user/{BUDGET_TEST_USER}/expense/", json={
+            "cost": cost, "date_time": timestamp(date_time),
+            "category_id": category_id, "description": "period"})
+        assert response.status_code == 200
+
+    response = client.get(
+        f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id={category_id}")
+    [category] = response.json()
+    assert category["budget"] == 100
+    assert category["budget_period"] == {
+        "start": start.isoformat() + "+00:00", "end": end.isoformat() + "+00:00"}
+    assert [expense["cost"] for expense in category["expenses"]] == [30]
+    assert category["budget_delta"] == 70
+
+    response = client.get(f"/users/{BUDGET_TEST_USER}/budget/"
+                          f"?budget_category_id={category_id}&include_expenses=false")
+    assert response.json()[0]["budget_delta"] == 70
+
+
+def test_get_budget_etag_changes_when_a_period_ends():
+    name = f"PERIOD_BUDGET{uuid.uuid4().hex}"
+    category_id = client.post(f"/users/{BUDGET_TEST_USER}/budget/{name}/",
+                              json={"budget": 1000}).json()["category_id"]
+    now = datetime.utcnow().replace(microsecond=0)
+    end = now + timedelta(seconds=2)
+    period = {"start_date": timestamp(now - timedelta(hours=1)),
+              "end_date": timestamp(end), "budget": 100}
+    client.post(f"/users/{BUDGET_TEST_USER}/budget/{name}/periods", json=period)
+    url = f"/users/{BUDGET_TEST_USER}/budget/?budget_category_id={category_id}"
+    response = client.get(url)
+    assert response.json()[0]["budget"] == 100
+    etag = response.headers["etag"]
+
+    # no write in between, only the end of the period
+    time.sleep((end - datetime.utcnow()).total_seconds() + 0.1)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["budget"] == 1000
+    assert "budget_period" not in response.json()[0]
+
+
+def test_budget_period_overlap():
+    name = f"PERIOD_BUDGET{uuid.uuid4().hex}"
+    client.post(f"/users/{BUDGET_TEST_USER}/budget/{name}/", json={"budget": 1000})
+    url = f"/users/{BUDGET_TEST_USER}/budget/{name}/periods"
+    period = {"start_date": "2023-05-01 00:00:00",
+              "end_date": "2023-06-01 00:00:00", "budget": 100}
+    assert client.post(url, json=period).status_code == 200
+
+    overlapping = dict(period, start_date="2023-05-31 00:00:00",
+                       end_date="2023-07-01 00:00:00")
+    response = client.post(url, json=overlapping)
+    assert response.status_code == 409
+    assert response.json() == {"detail": "budget period overlaps another one."}
+
+    # periods exclude their end, so the next one may start there
+    following = dict(period, start_date="2023-06-01 00:00:00",
+                     end_date="2023-07-01 00:00:00")
+    assert client.post(url, json=following).status_code == 200
@@ -0,0 +1,52 @@
+from src import cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_hit_and_miss():
+    lookups = cache.TTLCache(maxsize=10, ttl=30)
+    assert lookups.get(cache.user_key(1)) is cache.MISSING
+    lookups.set(cache.user_key(1), "user one")
+    assert lookups.get(cache.user_key(1)) == "user one"
+    assert lookups.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_cache_expires_entries():
+    clock = FakeClock()
+    lookups = cache.TTLCache(maxsize=10, ttl=30, clock=clock)
+    lookups.set(cache.user_key(1), "user one")
+    clock.now = 29
+    assert lookups.get(cache.user_key(1)) == "user one"
+    clock.now = 31
+    assert lookups.get(cache.user_key(1)) is cache.MISSING
+    assert lookups.stats()["size"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    lookups = cache.TTLCache(maxsize=2, ttl=30)
+    lookups.set(cache.user_key(1), "user one")
+    lookups.set(cache.user_key(2), "user two")
+    lookups.get(cache.user_key(1))
+    lookups.set(cache.user_key(3), "user three")
+    assert lookups.get(cache.user_key(2)) is cache.MISSING
+    assert lookups.get(cache.user_key(1)) == "user one"
+    assert lookups.get(cache.user_key(3)) == "user three"
+
+
+def test_cache_invalidate():
+    lookups = cache.TTLCache(maxsize=10, ttl=30)
+    lookups.set(cache.category_key(13, 5), "category")
+    lookups.invalidate(cache.decode_key(cache.encode_key(cache.category_key(13, 5))))
+    assert lookups.get(cache.category_key(13, 5)) is cache.MISSING
+
+
+def test_cache_disabled():
+    lookups = cache.TTLCache(maxsize=10, ttl=0)
+    lookups.set(cache.user_key(1), "user one")
+    assert lookups.get(cache.user_key(1)) is cache.MISSING
@@ -1,8 +1,11 @@
 import json
+import random
 from datetime import datetime
 
+import sqlalchemy
 from fastapi.testclient import TestClient
 
+from src import database as db
 from src.api.server import app
 
 client = TestClient(app)
@@ -24,6 +27,27 @@ def test_get_expense_error():
     assert response.json() == {"detail": "expense not found."}
 
 
+def test_get_expenses_batch():
+    response = client.post(f"/user/{EXPENSE_TEST_USER}/expenses/batch",
+                           json={"expense_ids": [5, 1, 999999]})
+    assert response.status_code == 200
+
+    with open("tst/expenses/26-expenses-5.json", encoding="utf-8") as f:
+        expected = json.load(f)
+    assert response.json()["expenses"] == [expected]
+    # expense 1 belongs to another user
+    assert response.json()["errors"] == [
+        {"expense_id": 1, "detail": "expense not found."},
+        {"expense_id": 999999, "detail": "expense not found."},
+    ]
+
+
+def test_get_expenses_batch_too_large():
+    response = client.post(f"/user/{EXPENSE_TEST_USER}/expenses/batch",
+                           json={"expense_ids": list(range(1000))})
+    assert response.status_code == 422
+
+
 def test_list_expenses():
     # sample for list_expense : /user/{user_id}/expenses
     response = client.get(
@@ -34,6 +58,46 @@ def test_list_expenses():
         assert response.json() == json.load(f)
 
 
+def test_list_expenses_paginated():
+    url = (f"/user/{EXPENSE_TEST_USER}/expenses?start_date=2023-05-1%2001%3A05%3A29"
+           "&end_date=2023-05-10%2001%3A05%3A29&limit=1")
+    with open("tst/expenses/26-expenses-list.json", encoding="utf-8") as f:
+        expected = json.load(f)
+
+    first_page = client.get(url)
+    assert first_page.status_code == 200
+    assert first_page.json() == expected[:1]
+
+    second_page = client.get(url, params={"cursor": first_page.headers["X-Next-Cursor"]})
+    assert second_page.status_code == 200
+    assert second_page.json() == expected[1:2]
+
+
+def test_list_expenses_stream():
+    response = client.get(
+        f"/user/{EXPENSE_TEST_USER}/expenses?start_date=2023-05-1%2001%3A05%3A29&end_date=2023-05-10%2001%3A05%3A29&stream=true")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    with open("tst/expenses/26-expenses-list.json", encoding="utf-8") as f:
+        assert [json.loads(line) for line in response.text.splitlines()] == json.load(f)
+
+
+def test_list_expenses_bad_cursor():
+    response = client.get(f"/user/{EXPENSE_TEST_USER}/expenses?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "invalid cursor."}
+
+
+def test_list_expenses_not_modified():
+    url = f"/user/{EXPENSE_TEST_USER}/expenses?start_date=2023-05-01 00:00:00"
+    etag = client.get(url).headers["etag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
 def test_list_expenses_error():
     response = client.get("/user/999999/expense/999999")
     assert response.status_code == 404
@@ -82,3 +146,98 @@ def test_add_expense_error():
     )
     assert post_response.status_code == 404
     assert post_response.json() == {"detail": "budget category not found."}
+
+
+def test_add_expense_with_items():
+    data = {
+      "date_time": "2023-05-08 14:19:45",
+      "category_id": 16,
+      "description": "groceries",
+      "items": [{"name": "milk", "cost": 2.5}, {"name": "bread", "cost": 4}]
+    }
+
+    post_response = client.post(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expense/",
+        json=data
+    )
+    assert post_response.status_code == 200
+    assert post_response.json()["cost"] == 6.5
+    items = post_response.json()["items"]
+    assert [(item["name"], item["cost"]) for item in items] == \
+        [("milk", 2.5), ("bread", 4)]
+    expense_id = post_response.json()["expense_id"]
+
+    response = client.get(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expense/{expense_id}?include_items=true")
+    assert response.status_code == 200
+    assert response.json()["cost"] == 6.5
+    assert response.json()["items"] == items
+
+    response = client.get(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expenses?start_date=2023-05-08%2014%3A19%3A45"
+        "&end_date=2023-05-08%2014%3A19%3A45&include_items=true")
+    assert response.status_code == 200
+    listed = {expense["expense_id"]: expense for expense in response.json()}
+    assert listed[expense_id]["items"] == items
+    assert all("items" in expense for expense in listed.values())
+
+
+def test_add_expense_items_cost_mismatch():
+    data = {
+      "cost": 1,
+      "date_time": "2023-05-08 14:19:45",
+      "category_id": 16,
+      "description": "groceries",
+      "items": [{"name": "milk", "cost": 2.5}]
+    }
+
+    post_response = client.post(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expense/",
+        json=data
+    )
+    assert post_response.status_code == 422
+
+
+def test_add_expenses_bulk_json():
+    data = [
+        {"cost": 10, "date_time": "2023-05-08 14:19:45", "category_id": 16, "description": "bulk"},
+        {"cost": 10, "date_time": "2023-05-08 14:19:45", "category_id": 999999999, "description": "bulk"},
+        {"cost": "not a number", "date_time": "2023-05-08 14:19:45", "category_id": 16},
+    ]
+
+    post_response = client.post(f"/user/{EXPENSE_TEST_USER_POSTS}/expenses/bulk", json=data)
+    assert post_response.status_code == 200
+    assert post_response.json()["inserted"] == 1
+    assert [error["row"] for error in post_response.json()["errors"]] == [1, 2]
+    assert post_response.json()["errors"][0]["detail"] == "budget category not found."
+
+
+def test_add_expenses_bulk_csv():
+    data = "cost,date_time,category_id,description\n5,2023-05-08 14:19:45,16,bulk csv\n"
+
+    post_response = client.post(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expenses/bulk",
+        content=data,
+        headers={"content-type": "text/csv"}
+    )
+    assert post_response.status_code == 200
+    assert post_response.json() == {"inserted": 1, "errors": []}
+
+
+def test_add_expenses_bulk_without_description():
+    # a cost no other expense has, to find it again
+    cost = round(random.uniform(1000, 2000), 6)
+    data = f"cost,date_time,category_id\n{cost},2023-05-08 14:19:45,16\n"
+
+    post_response = client.post(
+        f"/user/{EXPENSE_TEST_USER_POSTS}/expenses/bulk",
+        content=data,
+        headers={"content-type": "text/csv"}
+    )
+    assert post_response.json() == {"inserted": 1, "errors": []}
+    with db.engine.connect() as conn:
+        description = conn.execute(sqlalchemy.text(
+            "SELECT description FROM expense WHERE category_id = 16 AND cost = :cost"
+        ), {"cost": cost}).scalar_one()
+    # stored like add_expense stores it
+    assert description == ""
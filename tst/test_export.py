@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from src.api import export
+from src.api.server import app
+
+client = TestClient(app)
+
+EXPORT_TEST_USER = 29
+
+
+def export_expenses(**params):
+    response = client.get(f"/user/{EXPORT_TEST_USER}/export", params=params)
+    assert response.status_code == 200
+    return response
+
+
+def test_export_csv():
+    response = export_expenses()
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == \
+        f'attachment; filename="expenses-{EXPORT_TEST_USER}.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows
+    assert list(rows[0]) == [
+        "expense_id", "date_time", "category", "cost", "description"]
+    dates = [row["date_time"] for row in rows]
+    assert dates == sorted(dates)
+
+
+def test_export_ndjson():
+    response = export_expenses(format="ndjson")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    expenses = [json.loads(line) for line in response.text.splitlines()]
+    assert len(expenses) == len(export_expenses().text.splitlines()) - 1
+    assert set(expenses[0]) == {
+        "expense_id", "date_time", "category", "cost", "description"}
+
+
+def test_export_gzip(monkeypatch):
+    # small chunks so that the export takes several of them
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 256)
+    response = export_expenses(format="ndjson", gzip=True)
+    assert response.headers["content-encoding"] == "gzip"
+    # the client decompresses the body
+    assert response.text == export_expenses(format="ndjson").text
+
+
+def test_export_unknown_user():
+    response = client.get("/user/1000000/export")
+    assert response.status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src import group_commit
+from src.api.server import app
+
+client = TestClient(app)
+
+GROUP_COMMIT_TEST_USER = 29
+GROUP_COMMIT_TEST_CATEGORY = 16
+
+INSERTED = sqlalchemy.text('''
+SELECT expense_id, cost, description, xmin::text AS transaction_id
+FROM expense WHERE expense_id = ANY(:expense_ids)
+ORDER BY expense_id
+''')
+
+
+def expense_row(cost, date_time="2023-05-08 14:19:45"):
+    return {"category_id": GROUP_COMMIT_TEST_CATEGORY, "date_time": date_time,
+            "cost": cost, "description": "group commit"}
+
+
+@pytest.fixture
+def writer():
+    writer = group_commit.ExpenseWriter(db.engine, max_rows=50, max_wait=0.2)
+    yield writer
+    writer.stop()
+
+
+def test_concurrent_rows_share_a_commit(writer):
+    futures = [writer.submit(expense_row(cost)) for cost in range(1, 6)]
+    expense_ids = [future.result(timeout=10) for future in futures]
+    assert len(set(expense_ids)) == 5
+
+    with db.engine.connect() as conn:
+        rows = conn.execute(INSERTED, {"expense_ids": expense_ids}).fetchall()
+    assert [(row.expense_id, row.cost) for row in rows] == \
+        sorted(zip(expense_ids, range(1, 6)))
+    assert len({row.transaction_id for row in rows}) == 1
+
+
+def test_bad_rows_fail_alone(writer):
+    futures = [
+        writer.submit(expense_row(1)),
+        writer.submit(expense_row(2, date_time="2023-13-45 00:00:00")),
+        writer.submit(expense_row(3)),
+    ]
+    with pytest.raises(sqlalchemy.exc.DataError):
+        futures[1].result(timeout=10)
+    expense_ids = [futures[0].result(), futures[2].result()]
+
+    with db.engine.connect() as conn:
+        rows = conn.execute(INSERTED, {"expense_ids": expense_ids}).fetchall()
+    assert [row.cost for row in rows] == [1, 3]
+
+
+def test_add_expense_group_commit(monkeypatch):
+    monkeypatch.setattr(group_commit, "EXPENSE_GROUP_COMMIT", True)
+    data = expense_row(25)
+    try:
+        response = client.post(
+            f"/user/{GROUP_COMMIT_TEST_USER}/expense/", json=data)
+    finally:
+        group_commit.stop()
+    assert response.status_code == 200
+    expense_id = response.json()["expense_id"]
+
+    response = client.get(
+        f"/user/{GROUP_COMMIT_TEST_USER}/expense/{expense_id}")
+    assert response.status_code == 200
+    assert response.json()["cost"] == 25
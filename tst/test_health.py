@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src.api.server import app
+
+client = TestClient(app)
+
+
+def test_healthz():
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+
+
+def test_readyz_after_startup():
+    assert client.get("/readyz").status_code == 503
+
+    with TestClient(app) as started:
+        response = started.get("/readyz")
+        assert response.status_code == 200
+        pool = response.json()["pools"]["primary"]
+        assert pool["checked_in"] >= min(db.DB_POOL_WARMUP, db.DB_POOL_SIZE)
+
+    assert client.get("/readyz").status_code == 503
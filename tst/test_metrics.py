@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from src import metrics
+from src.api.server import app
+
+client = TestClient(app)
+
+
+def test_metrics_count_queries_per_route():
+    response = client.get("/user/26/expense/5")
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert ('http_request_db_queries_count{method="GET",'
+            'route="/user/{user_id}/expense/{expense_id}"}') in response.text
+    assert "db_pool_checkout_wait_seconds_bucket" in response.text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Test.", (1, 2))
+    histogram.observe(0.5, route="/a")
+    histogram.observe(1.5, route="/a")
+    histogram.observe(3, route="/a")
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{route="/a",le="1"} 1',
+        'test_seconds_bucket{route="/a",le="2"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.0',
+        'test_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_parameter_shape_hides_values():
+    assert metrics.parameter_shape({"user_id": 1, "name": "secret"}) == {
+        "user_id": "int", "name": "str"}
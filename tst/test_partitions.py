@@ -0,0 +1,135 @@
+import datetime
+import threading
+
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src import partitions
+from src.api.server import app
+
+client = TestClient(app)
+
+PARTITION_TEST_USER_POSTS = 29
+PARTITION_TEST_CATEGORY_POSTS = 16
+
+
+def test_add_months():
+    assert partitions.add_months(datetime.date(2023, 11, 1), 3) == datetime.date(2024, 2, 1)
+    assert partitions.add_months(datetime.date(2023, 1, 1), -1) == datetime.date(2022, 12, 1)
+
+
+def test_partition_month():
+    assert partitions.partition_month("expense_y2023m05") == datetime.date(2023, 5, 1)
+    assert partitions.partition_month("expense_default") is None
+
+
+def test_maintenance_keeps_creating_partitions(monkeypatch):
+    runs = []
+    created = threading.Event()
+
+    def ensure_partitions(engine, months_ahead):
+        runs.append(months_ahead)
+        if len(runs) == 2:
+            created.set()
+    monkeypatch.setattr(partitions, "ensure_partitions", ensure_partitions)
+    monkeypatch.setattr(partitions, "EXPENSE_PARTITIONS_INTERVAL", 0.01)
+
+    assert partitions.start_maintenance() is not None
+    assert created.wait(5)
+    assert runs[:2] == [partitions.EXPENSE_PARTITIONS_AHEAD] * 2
+
+
+def test_create_partition_moves_default_rows():
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(sqlalchemy.text('''
+            INSERT INTO expense (category_id, date_time, cost, description)
+            VALUES (3, '1980-02-10 12:00:00+00', 1, 'partition test')
+            '''))
+        where = sqlalchemy.text('''
+            SELECT tableoid::regclass::text FROM expense
+            WHERE description = 'partition test'
+            ''')
+        assert conn.execute(where).scalar_one() == "expense_default"
+
+        name = conn.execute(partitions.CREATE_PARTITION,
+                            {"month": datetime.date(1980, 2, 20)}).scalar_one()
+        assert name == "expense_y1980m02"
+        assert conn.execute(where).scalar_one() == "expense_y1980m02"
+        transaction.rollback()
+
+
+def test_create_partition_keeps_items():
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(sqlalchemy.text('''
+            WITH new_expense AS (
+                INSERT INTO expense (category_id, date_time, cost, description)
+                VALUES (3, '1980-03-10 12:00:00+00', 3, 'partition items test')
+                RETURNING expense_id, date_time
+            )
+            INSERT INTO item (expense_id, expense_date_time, cost, name)
+            SELECT expense_id, date_time, cost, name
+            FROM new_expense, (VALUES (1, 'first'), (2, 'second')) AS items (cost, name)
+            '''))
+        items = sqlalchemy.text('''
+            SELECT item.name FROM item
+            JOIN expense ON expense.expense_id = item.expense_id
+            AND expense.date_time = item.expense_date_time
+            WHERE expense.description = 'partition items test'
+            ORDER BY item.name
+            ''')
+        assert conn.execute(items).scalars().all() == ["first", "second"]
+
+        conn.execute(partitions.CREATE_PARTITION,
+                     {"month": datetime.date(1980, 3, 1)})
+        assert conn.execute(items).scalars().all() == ["first", "second"]
+        transaction.rollback()
+
+
+def test_month_items_are_those_of_the_utc_month():
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(sqlalchemy.text("SET LOCAL TimeZone = 'America/New_York'"))
+        conn.execute(sqlalchemy.text('''
+            WITH new_expenses AS (
+                INSERT INTO expense (category_id, date_time, cost, description)
+                VALUES (3, '1980-04-01 01:00:00+00', 1, 'archive range test'),
+                       (3, '1980-04-30 23:00:00+00', 1, 'archive range test'),
+                       (3, '1980-05-01 01:00:00+00', 1, 'archive range test')
+                RETURNING expense_id, date_time
+            )
+            INSERT INTO item (expense_id, expense_date_time, cost, name)
+            SELECT expense_id, date_time, 1, 'archive range test' FROM new_expenses
+            '''))
+        items = conn.execute(
+            sqlalchemy.text(partitions.MONTH_ITEMS.format(
+                action="SELECT expense_date_time")
+                + "AND name = 'archive range test'"),
+            partitions.month_range(datetime.date(1980, 4, 1))).scalars().all()
+        utc = datetime.timezone.utc
+        assert sorted(item.astimezone(utc).isoformat() for item in items) == [
+            "1980-04-01T01:00:00+00:00", "1980-04-30T23:00:00+00:00"]
+        transaction.rollback()
+
+
+def test_archive_changes_etags():
+    response = client.post(f"/user/{PARTITION_TEST_USER_POSTS}/expense/", json={
+        "cost": 1, "date_time": "1969-07-20 20:17:40",
+        "category_id": PARTITION_TEST_CATEGORY_POSTS,
+        "description": "archive etag test"})
+    assert response.status_code == 200
+    with db.engine.begin() as conn:
+        name = conn.execute(partitions.CREATE_PARTITION,
+                            {"month": datetime.date(1969, 7, 1)}).scalar_one()
+    url = (f"/user/{PARTITION_TEST_USER_POSTS}/expenses"
+           "?start_date=1969-07-01 00:00:00&end_date=1969-08-01 00:00:00")
+    response = client.get(url)
+    assert response.json()
+    etag = response.headers["etag"]
+
+    partitions.archive_partition(db.engine, name, drop=True)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
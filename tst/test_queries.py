@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+import sqlalchemy
+
+from src import database as db
+from src import queries
+
+PREPARED_STATEMENTS = sqlalchemy.text('''
+SELECT name, generic_plans + custom_plans AS executions
+FROM pg_prepared_statements
+''')
+
+LIST_PARAMS = {
+    "user_id_input": 26,
+    "start_date": datetime.datetime(2023, 5, 1),
+    "end_date": datetime.datetime(2024, 1, 1),
+    "limit": 3,
+}
+
+STATEMENTS = [
+    (queries.USER_BY_ID, {"user_id": 13}),
+    (queries.DATA_VERSION, {"user_id": 13}),
+    (queries.CATEGORY_BY_ID, {"user_id": 13, "category_id": 4}),
+    (queries.BUDGET_REPORT, {"user_id": 13, "category_id": None}),
+    (queries.BUDGET_SUMMARY, {"user_id": 13, "category_id": 4}),
+    (queries.EXPENSES_BY_ID, {"user_id": 26, "expense_ids": [1, 2, 3]}),
+    (queries.OWNED_CATEGORIES, {"user_id": 13, "category_ids": []}),
+    (queries.LIST_EXPENSES_FIRST_PAGE, LIST_PARAMS),
+    (queries.LIST_EXPENSES_NEXT_PAGE, dict(
+        LIST_PARAMS, after_date_time=datetime.datetime(2023, 5, 2),
+        after_expense_id=0)),
+]
+
+
+@pytest.fixture(scope="module")
+def prepared_engine():
+    engine = sqlalchemy.create_engine(db.engine.url, pool_size=1)
+    queries.prepare_statements(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("statement, params", STATEMENTS)
+def test_prepared_statement_results(prepared_engine, statement, params):
+    with db.engine.connect() as conn:
+        expected = conn.execute(statement, params).fetchall()
+    with prepared_engine.connect() as conn:
+        assert conn.execute(statement, params).fetchall() == expected
+
+
+def test_connections_prepare_once(prepared_engine):
+    for _ in range(2):
+        with prepared_engine.connect() as conn:
+            conn.execute(queries.USER_BY_ID, {"user_id": 13}).fetchone()
+    with prepared_engine.connect() as conn:
+        executions = dict(conn.execute(PREPARED_STATEMENTS).fetchall())
+    assert set(executions) == set(queries.PREPARED)
+    assert executions["user_by_id"] >= 2
+
+
+def test_prepared_statement_streams(prepared_engine):
+    # server-side cursors run the statement itself, not the EXECUTE
+    with prepared_engine.connect() as conn:
+        result = conn.execution_options(yield_per=1).execute(
+            queries.LIST_EXPENSES_FIRST_PAGE, LIST_PARAMS)
+        streamed = result.fetchall()
+    with db.engine.connect() as conn:
+        assert streamed == conn.execute(
+            queries.LIST_EXPENSES_FIRST_PAGE, LIST_PARAMS).fetchall()
@@ -0,0 +1,234 @@
+import json
+import os
+
+import pytest
+import sqlalchemy
+
+from src import database as db
+from src import queries
+
+# Size of the seeded dataset, big enough that the planner prefers indexes
+# whenever one matches the query.
+PLAN_USERS = 500
+PLAN_CATEGORIES = 10
+PLAN_EXPENSES = 40
+
+BASELINE_FILE = "tst/query_plans/baseline.json"
+# A plan may cost up to this many times its recorded baseline
+COST_TOLERANCE = 3
+# Tables a query must never read with a sequential scan
+LARGE_TABLES = {"user", "budget_category", "expense", "expense_monthly_rollup",
+                "user_data_version", "item"}
+# Partitions this small are only a few pages, scanning them is fine
+SMALL_PARTITION_ROWS = 1000
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    """
+    Seeds the large dataset in a transaction that is rolled back once the
+    module's tests ran, so the shared database is left untouched.
+    """
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        conn.execute(sqlalchemy.text('''
+            INSERT INTO "user" (name)
+            SELECT 'plan-user-' || n FROM generate_series(1, :users) AS n
+            '''), {"users": PLAN_USERS})
+        conn.execute(sqlalchemy.text('''
+            INSERT INTO budget_category (user_id, category_name, monthly_budget)
+            SELECT user_id, 'plan-category-' || n, 100
+            FROM "user", generate_series(1, :categories) AS n
+            WHERE name LIKE 'plan-user-%'
+            '''), {"categories": PLAN_CATEGORIES})
+        # fresh statistics also replan the foreign key checks this
+        # connection cached while budget_category was tiny
+        conn.execute(sqlalchemy.text("ANALYZE budget_category"))
+        conn.execute(sqlalchemy.text('''
+            SELECT expense_create_partition(month::date)
+            FROM generate_series(DATE '2022-01-01', DATE '2022-02-01', INTERVAL '1 month') AS month
+            '''))
+        conn.execute(sqlalchemy.text('''
+            INSERT INTO expense (category_id, date_time, cost, description)
+            SELECT category_id,
+            TIMESTAMPTZ '2022-01-01' + n * INTERVAL '17 hours',
+            n % 50 + 0.5, 'plan-expense-' || n
+            FROM budget_category, generate_series(1, :expenses) AS n
+            WHERE category_name LIKE 'plan-category-%'
+            '''), {"expenses": PLAN_EXPENSES})
+        # one item per expense, named alike for every user, so an item
+        # search not kept to the user's categories would read them all
+        conn.execute(sqlalchemy.text('''
+            INSERT INTO item (expense_id, expense_date_time, category_id, cost, name)
+            SELECT expense_id, date_time, category_id, cost, description || ' item'
+            FROM expense
+            WHERE description LIKE 'plan-expense-%'
+            '''))
+        for table in LARGE_TABLES:
+            conn.execute(sqlalchemy.text(f'ANALYZE "{table}"'))
+        sample = conn.execute(sqlalchemy.text('''
+            SELECT budget_category.user_id, budget_category.category_id,
+            budget_category.category_name, MAX(expense.expense_id) AS expense_id
+            FROM budget_category
+            JOIN expense ON expense.category_id = budget_category.category_id
+            WHERE category_name LIKE 'plan-category-%'
+            GROUP BY budget_category.category_id
+            ORDER BY budget_category.category_id DESC
+            LIMIT 1
+            ''')).fetchone()
+        yield conn, sample
+        transaction.rollback()
+
+
+def endpoint_queries(sample):
+    """The statements behind each endpoint, with realistic parameters."""
+    list_params = {
+        "user_id_input": sample.user_id,
+        "start_date": "2022-01-01 00:00:00",
+        "end_date": "2022-02-01 00:00:00",
+        "limit": 51,
+    }
+    search_params = {
+        "user_id": sample.user_id,
+        "category_id": None,
+        "query": "plan expense 7",
+        "start_date": "2022-01-01 00:00:00",
+        "end_date": "2022-02-01 00:00:00",
+        "limit": 21,
+        "after_rank": None,
+        "after_date_time": None,
+        "after_expense_id": None,
+    }
+    return {
+        "get_user": (queries.USER_BY_ID, {"user_id": sample.user_id}),
+        "get_data_version": (
+            queries.DATA_VERSION, {"user_id": sample.user_id}),
+        "get_expense": (
+            queries.EXPENSE_BY_ID, {"expense_id": sample.expense_id}),
+        "get_expenses_batch": (queries.EXPENSES_BY_ID, {
+            "user_id": sample.user_id,
+            "expense_ids": [sample.expense_id, sample.expense_id - 1]}),
+        "get_category": (queries.CATEGORY_BY_ID, {
+            "user_id": sample.user_id, "category_id": sample.category_id}),
+        "get_budget": (queries.BUDGET_REPORT, {
+            "user_id": sample.user_id, "category_id": None}),
+        "get_budget_category": (queries.BUDGET_REPORT, {
+            "user_id": sample.user_id, "category_id": sample.category_id}),
+        "get_budget_summary": (queries.BUDGET_SUMMARY, {
+            "user_id": sample.user_id, "category_id": None}),
+        "set_budget_lookup": (queries.CATEGORY_BY_NAME, {
+            "user_id": sample.user_id,
+            "category_name": sample.category_name}),
+        "list_expenses": (queries.LIST_EXPENSES_FIRST_PAGE, list_params),
+        "list_expenses_next_page": (queries.LIST_EXPENSES_NEXT_PAGE, dict(
+            list_params,
+            after_date_time="2022-01-15 00:00:00",
+            after_expense_id=sample.expense_id)),
+        "bulk_category_check": (queries.OWNED_CATEGORIES, {
+            "user_id": sample.user_id,
+            "category_ids": [sample.category_id]}),
+        "search_expenses": (
+            queries.SEARCH_EXPENSES_BY_MODE["text"], search_params),
+        "search_expenses_fuzzy": (
+            queries.SEARCH_EXPENSES_BY_MODE["fuzzy"],
+            dict(search_params, query="plan-expnse-7")),
+        "spending_analytics": (queries.SPENDING, {
+            "user_id": sample.user_id, "category_id": None, "bucket": "week",
+            "start_date": "2022-01-01 00:00:00",
+            "end_date": "2022-02-01 00:00:00"}),
+    }
+
+
+QUERY_NAMES = [
+    "get_user", "get_data_version", "get_expense", "get_expenses_batch",
+    "get_category", "get_budget", "get_budget_category", "get_budget_summary",
+    "set_budget_lookup",
+    "list_expenses", "list_expenses_next_page", "bulk_category_check",
+    "search_expenses", "search_expenses_fuzzy", "spending_analytics",
+]
+
+
+def explain(conn, statement, params):
+    return conn.execute(
+        sqlalchemy.text("EXPLAIN (FORMAT JSON) " + statement.text), params
+    ).scalar()[0]["Plan"]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def large_partitions(conn):
+    """Maps each partition that is not tiny, e.g. expense_y2022m01, to its table."""
+    return dict(conn.execute(sqlalchemy.text('''
+        SELECT inhrelid::regclass::text, inhparent::regclass::text
+        FROM pg_inherits
+        JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid
+        WHERE pg_class.reltuples >= :rows
+        '''), {"rows": SMALL_PARTITION_ROWS}).fetchall())
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("name", QUERY_NAMES)
+def test_query_plan(seeded, name):
+    conn, sample = seeded
+    statement, params = endpoint_queries(sample)[name]
+    plan = explain(conn, statement, params)
+
+    parents = large_partitions(conn)
+    seq_scans = [
+        node["Relation Name"] for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan"
+        and (node["Relation Name"] in LARGE_TABLES
+             or parents.get(node["Relation Name"]) in LARGE_TABLES)
+    ]
+    assert seq_scans == [], f"{name} reads {seq_scans} with a sequential scan"
+
+    baseline = load_baseline().get(name)
+    if os.environ.get("UPDATE_PLAN_BASELINE"):
+        recorded = load_baseline()
+        recorded[name] = plan["Total Cost"]
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(recorded, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif baseline is not None:
+        assert plan["Total Cost"] <= baseline * COST_TOLERANCE, (
+            f"{name} plan costs {plan['Total Cost']}, baseline is {baseline}"
+        )
+
+
+def test_list_expenses_prunes_partitions(seeded):
+    conn, sample = seeded
+    statement, params = endpoint_queries(sample)["list_expenses"]
+    plan = explain(conn, statement, params)
+
+    scanned = {
+        node["Relation Name"] for node in plan_nodes(plan)
+        if node.get("Relation Name", "").startswith("expense_y")
+        or node.get("Relation Name") == "expense_default"
+    }
+    assert scanned and scanned <= {"expense_y2022m01", "expense_y2022m02"}
+
+
+@pytest.mark.parametrize("name", ["search_expenses", "search_expenses_fuzzy"])
+def test_search_reads_only_the_users_items(seeded, name):
+    conn, sample = seeded
+    statement, params = endpoint_queries(sample)[name]
+    plan = conn.execute(
+        sqlalchemy.text("EXPLAIN (ANALYZE, FORMAT JSON) " + statement.text), params
+    ).scalar()[0]["Plan"]
+
+    item_rows = [
+        node["Actual Rows"] for node in plan_nodes(plan)
+        if node.get("Index Name", "").startswith("ix_item_")
+    ]
+    assert item_rows, f"{name} does not read item through an index"
+    assert max(item_rows) <= PLAN_CATEGORIES * PLAN_EXPENSES
@@ -0,0 +1,52 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src.api.server import app
+
+client = TestClient(app)
+
+RENDER_TEST_USER_POSTS = 29
+RENDER_TEST_CATEGORY_POSTS = 16
+
+URLS = [
+    "/users/",
+    "/users/13/budget/",
+    "/users/13/budget/?budget_category_id=4",
+    "/users/13/budget/?include_expenses=false",
+    "/users/9/budget/",
+    "/users/999/budget/",
+    "/user/26/expenses?start_date=2023-05-01 00:00:00",
+    "/user/26/expenses?start_date=2023-05-01 00:00:00&limit=1",
+]
+
+
+def get_both(monkeypatch, url):
+    monkeypatch.setattr(db, "DB_RENDER_JSON", False)
+    encoded = client.get(url)
+    monkeypatch.setattr(db, "DB_RENDER_JSON", True)
+    rendered = client.get(url)
+    return encoded, rendered
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_rendered_json_matches(monkeypatch, url):
+    encoded, rendered = get_both(monkeypatch, url)
+    assert rendered.status_code == encoded.status_code
+    assert rendered.content == encoded.content
+    assert rendered.headers.get("x-next-cursor") == encoded.headers.get("x-next-cursor")
+
+
+def test_rendered_json_falls_back_for_huge_numbers(monkeypatch):
+    response = client.post(
+        f"/user/{RENDER_TEST_USER_POSTS}/expense/",
+        json={"cost": 1e20, "date_time": "1971-01-01 00:00:00",
+              "category_id": RENDER_TEST_CATEGORY_POSTS,
+              "description": "huge"})
+    assert response.status_code == 200
+
+    encoded, rendered = get_both(
+        monkeypatch, f"/user/{RENDER_TEST_USER_POSTS}/expenses"
+        "?start_date=1971-01-01 00:00:00&end_date=1971-01-02 00:00:00")
+    assert b"1e+20" in encoded.content
+    assert rendered.content == encoded.content
@@ -0,0 +1,99 @@
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from src import cache
+from src import database as db
+from src.api.server import app
+
+client = TestClient(app)
+
+REPLICA_TEST_USER = 13
+REPLICA_TEST_OTHER_USER = 26
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """
+    A "replica" that is the primary under another engine, reporting no lag,
+    with the number of connections checked out of it.
+    """
+    reader_engine = sqlalchemy.create_engine(db.engine.url)
+    checkouts = []
+    sqlalchemy.event.listen(
+        reader_engine, "checkout", lambda *args: checkouts.append(args))
+    monkeypatch.setattr(db, "DB_REPLICAS", ["primary"])
+    monkeypatch.setattr(db, "reader_engines", [reader_engine])
+    monkeypatch.setattr(db, "replica_lags", [None])
+    monkeypatch.setattr(db, "usable_replicas", [])
+    monkeypatch.setattr(
+        db, "recent_writers", cache.TTLCache(100, 60))
+    yield checkouts
+    reader_engine.dispose()
+
+
+def check_replicas(checkouts):
+    # the lag checks themselves connect to the replica
+    db.check_replicas()
+    checkouts.clear()
+
+
+def test_reads_go_to_replicas(replica):
+    assert client.get(f"/users/{REPLICA_TEST_USER}/").status_code == 200
+    assert len(replica) == 0
+
+    check_replicas(replica)
+    assert db.replica_lags == [0]
+    assert client.get(f"/users/{REPLICA_TEST_USER}/").status_code == 200
+    assert len(replica) == 1
+
+
+def test_lagging_replicas_are_skipped(replica, monkeypatch):
+    monkeypatch.setattr(db, "DB_REPLICA_MAX_LAG", -1)
+    check_replicas(replica)
+    assert db.usable_replicas == []
+    assert client.get(f"/users/{REPLICA_TEST_USER}/budget/").status_code == 200
+    assert len(replica) == 0
+
+
+def test_writers_read_from_the_primary(replica):
+    check_replicas(replica)
+    response = client.post(
+        f"/users/{REPLICA_TEST_USER}/budget/replica test/", json={"budget": 10})
+    assert response.status_code == 200
+
+    client.get(f"/users/{REPLICA_TEST_USER}/budget/")
+    assert len(replica) == 0
+    client.get(f"/users/{REPLICA_TEST_OTHER_USER}/budget/")
+    assert len(replica) == 1
+
+
+def test_batch_reads_do_not_pin_to_the_primary(replica):
+    check_replicas(replica)
+    response = client.post(f"/user/{REPLICA_TEST_USER}/expenses/batch",
+                           json={"expense_ids": [1]})
+    assert response.status_code == 200
+    assert len(replica) == 1
+
+    client.get(f"/users/{REPLICA_TEST_USER}/budget/")
+    assert len(replica) == 2
+
+
+def test_new_users_read_from_the_primary(replica):
+    check_replicas(replica)
+    response = client.post(
+        "/users/", json={"name": "replica user", "password": "correct horse"})
+    assert response.status_code == 200
+
+    response = client.get(f"/users/{response.json()['user_id']}/")
+    assert response.status_code == 200
+    assert len(replica) == 0
+
+
+def test_replicas_not_streaming_are_skipped(replica, monkeypatch):
+    # what REPLICA_LAG answers on a replica whose WAL receiver stopped
+    monkeypatch.setattr(
+        db, "REPLICA_LAG", sqlalchemy.text("SELECT CAST(NULL AS FLOAT8) AS lag"))
+    check_replicas(replica)
+    assert db.replica_lags == [None]
+    assert db.usable_replicas == []
@@ -0,0 +1,126 @@
+import random
+import string
+
+import pytest
+import sqlalchemy
+from fastapi.testclient import TestClient
+
+from src import database as db
+from src.api.server import app
+
+client = TestClient(app)
+
+SEARCH_TEST_USER_POSTS = 29
+SEARCH_TEST_CATEGORY_POSTS = 16
+
+
+@pytest.fixture
+def word():
+    """A word no other expense has."""
+    return "".join(random.choices(string.ascii_lowercase, k=12))
+
+
+def add_expense(description, items=None):
+    data = {"cost": 4.5, "date_time": "2023-05-08 09:30:00",
+            "category_id": SEARCH_TEST_CATEGORY_POSTS,
+            "description": description}
+    if items:
+        data = dict(data, cost=None, items=items)
+    response = client.post(
+        f"/user/{SEARCH_TEST_USER_POSTS}/expense/", json=data)
+    assert response.status_code == 200
+    return response.json()["expense_id"]
+
+
+def search(**params):
+    response = client.get(
+        f"/user/{SEARCH_TEST_USER_POSTS}/expenses/search", params=params)
+    assert response.status_code == 200
+    return response
+
+
+def test_search_text(word):
+    expense_id = add_expense(f"morning coffee shop {word}")
+    add_expense(f"coffee beans {word}")
+
+    expenses = search(q=f'"coffee shop" {word}').json()
+    assert [expense["expense_id"] for expense in expenses] == [expense_id]
+    assert expenses[0]["category"] == "posts"
+    assert expenses[0]["rank"] > 0
+
+
+def test_search_prefix(word):
+    expense_id = add_expense(f"morning coffee shop {word}")
+
+    expenses = search(q=f"coff {word[:8]}", mode="prefix").json()
+    assert [expense["expense_id"] for expense in expenses] == [expense_id]
+
+
+def test_search_fuzzy(word):
+    expense_id = add_expense(f"morning coffee shop {word}")
+
+    typo = word[:5] + word[6:]
+    expenses = search(q=typo, mode="fuzzy").json()
+    assert expense_id in [expense["expense_id"] for expense in expenses]
+
+
+def test_search_items(word):
+    expense_id = add_expense(
+        "groceries", items=[{"name": f"oat milk {word}", "cost": 3}])
+
+    expenses = search(q=word).json()
+    assert [expense["expense_id"] for expense in expenses] == [expense_id]
+
+
+def test_search_items_follow_their_expense(word):
+    expense_id = add_expense(
+        "groceries", items=[{"name": f"oat milk {word}", "cost": 3}])
+    with db.engine.begin() as conn:
+        other_user_id = conn.execute(sqlalchemy.text('''
+            UPDATE expense SET category_id = other.category_id
+            FROM (SELECT user_id, category_id FROM budget_category
+                  WHERE user_id <> :user_id ORDER BY category_id LIMIT 1) AS other
+            WHERE expense_id = :expense_id
+            RETURNING other.user_id
+            '''), {"user_id": SEARCH_TEST_USER_POSTS,
+                   "expense_id": expense_id}).scalar_one()
+
+    try:
+        assert search(q=word).json() == []
+        response = client.get(
+            f"/user/{other_user_id}/expenses/search", params={"q": word})
+        assert [expense["expense_id"] for expense in response.json()] == [expense_id]
+    finally:
+        with db.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(
+                "DELETE FROM expense WHERE expense_id = :expense_id"),
+                {"expense_id": expense_id})
+
+
+def test_search_paginated(word):
+    expense_ids = {add_expense(f"lunch {word}") for _ in range(3)}
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"q": word, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = search(**params)
+        pages.append([expense["expense_id"] for expense in response.json()])
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [2, 1]
+    assert {expense_id for page in pages for expense_id in page} == expense_ids
+
+
+def test_search_filters(word):
+    add_expense(f"dinner {word}")
+
+    assert search(q=word, start_date="2023-05-09 00:00:00").json() == []
+    response = client.get(
+        f"/user/{SEARCH_TEST_USER_POSTS}/expenses/search",
+        params={"q": word, "category_id": 999999999})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "budget category not found."}
@@ -1,5 +1,8 @@
 from fastapi.testclient import TestClient
 
+from src import database as db
+from src import passwords
+from src import queries
 from src.api.server import app
 
 client = TestClient(app)
@@ -24,10 +27,79 @@ def test_users_by_id2():
 
 def test_basic_user_post():
     data = {
-        "name": "test_user"
+        "name": "test_user",
+        "password": "correct horse",
     }
 
     postResponse = client.post("/users/", json=data)
     assert postResponse.status_code == 200
     assert "user_id" in postResponse.json()
     assert postResponse.json()["user_name"] == "test_user"
+
+
+def test_login():
+    user_id = client.post(
+        "/users/", json={"name": "login_user", "password": "correct horse"}
+    ).json()["user_id"]
+
+    response = client.post(
+        "/users/login", json={"user_id": user_id, "password": "correct horse"})
+    assert response.status_code == 200
+    assert response.json() == {"user_id": user_id, "name": "login_user"}
+
+    response = client.post(
+        "/users/login", json={"user_id": user_id, "password": "battery staple"})
+    assert response.status_code == 401
+    assert response.json() == {"detail": "invalid credentials."}
+
+
+def test_login_unknown_user():
+    response = client.post(
+        "/users/login", json={"user_id": 99999999999, "password": "correct horse"})
+    assert response.status_code == 401
+
+
+def test_login_rehashes_password(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 4)
+    user_id = client.post(
+        "/users/", json={"name": "rehash_user", "password": "correct horse"}
+    ).json()["user_id"]
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 5)
+
+    response = client.post(
+        "/users/login", json={"user_id": user_id, "password": "correct horse"})
+    assert response.status_code == 200
+    with db.engine.connect() as conn:
+        hashed_pwd = conn.execute(
+            queries.USER_PASSWORD, [{"user_id": user_id}]).fetchone().hashed_pwd
+    assert hashed_pwd.startswith("$2b$05$")
+    assert client.post(
+        "/users/login", json={"user_id": user_id, "password": "correct horse"}
+    ).status_code == 200
+
+
+def test_login_does_not_hold_connections_during_bcrypt(monkeypatch):
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 4)
+    user_id = client.post(
+        "/users/", json={"name": "pool_user", "password": "correct horse"}
+    ).json()["user_id"]
+    monkeypatch.setattr(passwords, "BCRYPT_ROUNDS", 5)
+    checked_out = []
+    for name in ("verify_password", "hash_password"):
+        def hashing(*args, bcrypt=getattr(passwords, name)):
+            checked_out.append(db.engine.pool.checkedout())
+            return bcrypt(*args)
+        monkeypatch.setattr(passwords, name, hashing)
+
+    response = client.post(
+        "/users/login", json={"user_id": user_id, "password": "correct horse"})
+    assert response.status_code == 200
+    # verified, then rehashed
+    assert checked_out == [0, 0]
+
+
+def test_verify_password_without_hash(monkeypatch):
+    # even a password matching the dummy hash fails without a stored hash
+    monkeypatch.setattr(passwords, "_DUMMY_HASH", passwords._hash("secret", 4))
+    assert not passwords.verify_password("secret", "")
+    assert not passwords.verify_password("secret", None)